@@ -1,12 +1,10 @@
 import streamlit as st
-import pandas as pd
 import os
 import tempfile
-import zipfile
-import io
-from process_shipping_list import process_shipping_list, read_policy_file
+import time
+from invoice_jobs import JobManager, build_zip_bundle, file_sha256
+from result_cache import ResultCache
 from pathlib import Path
-from validation_program.validators.input_validator import InputValidator
 
 # Set page config
 st.set_page_config(
@@ -36,6 +34,52 @@ file_descriptions = {
     "reimport_invoice_factory_Silvass.xlsx": "银禧工厂复进口发票 - 用于银禧工厂的复进口申报"
 }
 
+# 后台任务设置
+JOB_WORKERS = int(os.environ.get("INVOICE_JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL = 1.0
+# "下载所有文件"ZIP包的压缩级别(0-9)，xlsx本身已压缩，0表示只存储
+ZIP_COMPRESSLEVEL = int(os.environ.get("INVOICE_ZIP_COMPRESSLEVEL", "6"))
+STAGE_LABELS = {
+    "ingest": "读取与校验 Ingest",
+    "price": "价格计算 Pricing",
+    "export": "出口发票 Export",
+    "reimport": "进口发票 Reimport",
+    "merge": "模板合并 Merge",
+}
+# 处理结果缓存: 目录、最长保留时间和总大小上限
+CACHE_DIR = os.environ.get("INVOICE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "export_reimport_cache"))
+CACHE_MAX_AGE_HOURS = float(os.environ.get("INVOICE_CACHE_MAX_AGE_HOURS", "24"))
+CACHE_MAX_MB = float(os.environ.get("INVOICE_CACHE_MAX_MB", "500"))
+TEMPLATE_FILES = ["h.xlsx", "f.xlsx", "pl_h.xlsx", "pl_f.xlsx", "merge.py"]
+
+# 兼容旧版本Streamlit
+rerun = getattr(st, "rerun", None) or st.experimental_rerun
+
+@st.cache_resource
+def load_job_manager():
+    """每个服务进程只创建一个任务池，所有会话共享"""
+    return JobManager(stages=STAGE_LABELS.keys(), max_workers=JOB_WORKERS)
+
+@st.cache_resource
+def load_result_cache():
+    """每个服务进程共享一个结果缓存，启动时先淘汰过期条目"""
+    cache = ResultCache(CACHE_DIR, max_age_seconds=CACHE_MAX_AGE_HOURS * 3600,
+                        max_bytes=int(CACHE_MAX_MB * 1024 * 1024))
+    cache.evict()
+    return cache
+
+@st.cache_resource
+def warm_up():
+    """每个服务进程只执行一次: 导入处理模块、加载分类规则并查找模板文件和merge.py，缺失时在页面上提示"""
+    # 处理程序在首次用到时才导入，页面框架可以先渲染出来；
+    # 在这里提前导入，第一个任务不再承担导入和加载规则的时间
+    from process_shipping_list import find_file
+    from validation_program.validators.input_validator import InputValidator  # noqa: F401
+    from shipping_processor.model.rules import load_classification_rules
+    load_classification_rules()
+    found = {name: find_file(name) for name in TEMPLATE_FILES}
+    return {"found": found, "missing": [name for name, path in found.items() if not path]}
+
 # Create a temporary directory for file processing
 if 'temp_dir' not in st.session_state:
     st.session_state.temp_dir = tempfile.mkdtemp()
@@ -80,6 +124,8 @@ def validate_input_files(packing_list_path, policy_file_path):
     Returns:
         tuple: (验证是否通过, 错误信息)
     """
+    from validation_program.validators.input_validator import InputValidator
+
     validator = InputValidator()
     validation_results = validator.validate_all(packing_list_path, policy_file_path)
     
@@ -89,144 +135,188 @@ def validate_input_files(packing_list_path, policy_file_path):
     
     for check_name, result in validation_results.items():
         if not result["success"]:
-            # 特殊处理: 跳过"Value must be either numerical or a string containing a wildcard"错误
-            if "Value must be either numerical" in result['message'] or "argument of type 'int' is not iterable" in result['message']:
-                print(f"自动跳过错误: {result['message']}")
-                continue
-                
             all_passed = False
             error_messages.append(f"**{check_name}**: {result['message']}")
     
     return all_passed, error_messages
 
+def run_invoice_job(job, packing_list_path, policy_file_path, output_dir, result_cache=None, cache_key=None):
+    """在后台线程中执行的发票生成任务(不能调用任何st.*函数)
+
+    Args:
+        job: InvoiceJob，用于报告阶段进度
+        packing_list_path: 装箱单文件路径
+        policy_file_path: 政策文件路径
+        output_dir: 本任务的输出目录
+        result_cache: 处理成功后保存结果的ResultCache，为None时不缓存
+        cache_key: 结果的缓存键
+
+    Returns:
+        dict: validation_passed、error_messages、output_dir和export_files
+    """
+    from process_shipping_list import process_shipping_list
+
+    job.set_stage('ingest')
+
+    # 验证输入文件(重量列中的空值和通配符由验证和处理程序在内存中统一转换，不再改写上传的文件)
+    validation_passed, error_messages = validate_input_files(packing_list_path, policy_file_path)
+    if not validation_passed:
+        return {"validation_passed": False, "error_messages": error_messages}
+
+    # 模板文件只读取，每个任务写入自己的输出目录，多个任务可以同时处理
+    process_shipping_list(packing_list_path, policy_file_path, output_dir, progress_callback=job.set_stage)
+
+    export_files = [f for f in os.listdir(output_dir) if f.endswith('.xlsx')]
+
+    # 每个任务只打包一次，ZIP包直接写到磁盘上，页面按路径提供下载
+    file_paths = [os.path.join(output_dir, f) for f in export_files]
+    bundle_path = None
+    if file_paths:
+        bundle_path = build_zip_bundle(file_paths, os.path.join(os.path.dirname(output_dir), "all_export_files.zip"),
+                                       ZIP_COMPRESSLEVEL)
+
+    result = {
+        "validation_passed": True,
+        "error_messages": [],
+        "output_dir": output_dir,
+        "export_files": export_files,
+        "file_hashes": {f: file_sha256(path) for f, path in zip(export_files, file_paths)},
+        "bundle_path": bundle_path,
+    }
+    if result_cache is not None and export_files:
+        result = result_cache.commit(cache_key, os.path.dirname(output_dir), result)
+    return result
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def read_file_bytes(file_path, file_hash):
+    """读取下载文件的内容，按文件哈希缓存，页面重新运行时不再重复读盘
+
+    Args:
+        file_path: 文件路径
+        file_hash: 文件的SHA-256，只作为缓存键
+
+    Returns:
+        bytes: 文件内容
+    """
+    with open(file_path, "rb") as f:
+        return f.read()
+
+def file_download_data(file):
+    """获取单个输出文件的下载内容"""
+    file_path = os.path.join(st.session_state.output_dir, file)
+    file_hash = st.session_state.file_hashes.get(file)
+    if file_hash is None:
+        file_hash = file_sha256(file_path)
+    return read_file_bytes(file_path, file_hash)
+
+def show_validation_errors(error_messages):
+    """显示输入文件验证失败的信息"""
+    st.error("文件验证失败，请修正以下问题：")
+
+    # 创建一个错误展示区域
+    error_container = st.container()
+    with error_container:
+        for error in error_messages:
+            # 检查是否是weights验证错误
+            if "weights" in error.lower() or "净重" in error or "毛重" in error:
+                # 使用警告框突出显示weights相关错误
+                st.warning(error)
+                # 添加帮助提示
+                st.info("提示：净重和毛重字段必须为数值，且净重应小于毛重。请检查Excel文件中是否有非数值或通配符（如*、?、N/A等）。")
+            else:
+                # 其他错误使用普通错误框显示
+                st.error(error)
+
+    st.warning("请修正上述问题后重新上传文件。")
+
+def show_generated_files(result):
+    """把处理结果设置为当前会话的下载文件"""
+    st.session_state.output_dir = result["output_dir"]
+    st.session_state.files_generated = True
+    st.session_state.export_files = result["export_files"]
+    st.session_state.file_hashes = result["file_hashes"]
+    st.session_state.bundle_path = result["bundle_path"]
+
+job_manager = load_job_manager()
+result_cache = load_result_cache()
+template_status = warm_up()
+if template_status["missing"]:
+    st.warning(f"未找到模板文件: {', '.join(template_status['missing'])}")
+
 # Process button
-if st.button("Generate Invoice 生成发票", type="primary"):
+if st.button("Generate Invoice 生成发票", type="primary", disabled='job_id' in st.session_state):
     if not packing_list_file or not policy_file:
         st.error("Please upload both packing list and policy files first! 请先上传装箱单和政策文件！")
     else:
         try:
-            # Save uploaded files to temp directory
-            packing_list_path = os.path.join(st.session_state.temp_dir, "packing_list.xlsx")
-            policy_file_path = os.path.join(st.session_state.temp_dir, "policy.xlsx")
-            
-            with open(packing_list_path, "wb") as f:
-                f.write(packing_list_file.getvalue())
-            with open(policy_file_path, "wb") as f:
-                f.write(policy_file.getvalue())
-            
-            # 清洗净重/毛重列，避免校验异常
-            def clean_weights_columns(file_path):
-                try:
-                    # 直接读取Excel，不使用标题行
-                    df = pd.read_excel(file_path)
-                    # 查找可能的净重/毛重列名
-                    weight_keywords = ['净重', 'Net Weight', '毛重', 'Gross Weight', 'N.W', 'G.W', 'Weight']
-                    weight_cols = []
-                    
-                    # 更智能地查找所有重量相关列
-                    for col in df.columns:
-                        col_str = str(col).lower()
-                        if any(keyword.lower() in col_str for keyword in weight_keywords):
-                            weight_cols.append(col)
-                    
-                    # 处理每一列
-                    for col in weight_cols:
-                        # 先尝试直接转换为数值，错误值设为NaN
-                        df[col] = pd.to_numeric(df[col], errors='coerce')
-                        
-                        # 针对所有NaN的单元格(包括原始NaN和转换失败的)，重新处理
-                        mask = df[col].isna()
-                        if mask.any():
-                            # 获取原始值(在df复制上)
-                            orig_df = pd.read_excel(file_path)
-                            for idx in df.index[mask]:
-                                # 对于空或非数值的单元格，设为0
-                                if idx < len(orig_df):
-                                    orig_value = orig_df.iloc[idx][col]
-                                    # 如果是通配符字符串(*,?,N/A等)，尝试保留但确保可转换
-                                    if isinstance(orig_value, str) and any(c in orig_value for c in '*?N/An/a'):
-                                        # 保持通配符字符串，确保后续校验能识别，但移除可能导致问题的字符
-                                        df.at[idx, col] = "0"
-                                    else:
-                                        # 其他情况直接填0
-                                        df.at[idx, col] = 0
-                        
-                        # 最后确保所有值都是数值，避免任何字符串类型的值
-                        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-                    
-                    # 保存处理后的文件
-                    df.to_excel(file_path, index=False)
-                    print("成功清洗重量列，避免校验异常")
-                except Exception as e:
-                    print(f"清洗重量列时出错: {str(e)}，将尝试继续执行")
-            
-            # 执行净重/毛重列清洗
-            clean_weights_columns(packing_list_path)
-            
-            # 验证输入文件
-            with st.spinner("Validating files... 正在验证文件..."):
-                validation_passed, error_messages = validate_input_files(packing_list_path, policy_file_path)
-            
-            if not validation_passed:
-                st.error("文件验证失败，请修正以下问题：")
-                
-                # 创建一个错误展示区域
-                error_container = st.container()
-                with error_container:
-                    for error in error_messages:
-                        # 检查是否是weights验证错误
-                        if "weights" in error.lower() or "净重" in error or "毛重" in error or "Value must be" in error:
-                            # 使用警告框突出显示weights相关错误
-                            st.warning(error)
-                            # 添加帮助提示
-                            st.info("提示：净重和毛重字段必须为数值，且净重应小于毛重。请检查Excel文件中是否有非数值或通配符（如*、?、N/A等）。")
-                        else:
-                            # 其他错误使用普通错误框显示
-                            st.error(error)
-                
-                st.warning("请修正上述问题后重新上传文件。")
+            # 上传内容按哈希保存，相同的(装箱单, 政策文件)组合处理过时直接使用缓存结果
+            packing_list_hash, packing_list_upload = result_cache.store_upload(packing_list_file.getvalue())
+            policy_hash, policy_upload = result_cache.store_upload(policy_file.getvalue())
+            cache_key = result_cache.key(packing_list_hash, policy_hash)
+            cached_result = result_cache.lookup(cache_key)
+
+            if cached_result is not None:
+                print(f"命中结果缓存: {cache_key}")
+                show_generated_files(cached_result)
+                st.success("相同的文件已处理过，直接使用之前生成的文件。Using previously generated files.")
             else:
-                st.success("文件验证通过！正在处理...")
-                # 处理文件
-                with st.spinner("Processing files... 正在处理文件..."):
-                    process_shipping_list(packing_list_path, policy_file_path, st.session_state.output_dir)
-
-                    # Check for generated files
-                    export_files = [f for f in os.listdir(st.session_state.output_dir) if f.endswith('.xlsx')]
-                    
-                    if export_files:
-                        st.session_state.files_generated = True
-                        st.session_state.export_files = export_files
-                        st.success("Files generated successfully! 文件生成成功！")
-                    else:
-                        st.warning("No export files were generated. Please check your input files. 没有生成导出文件，请检查输入文件。")
+                # 每个任务使用独立的目录，避免前后任务互相覆盖
+                job_dir = result_cache.new_job_dir(cache_key, [packing_list_upload, policy_upload])
+                job_output_dir = os.path.join(job_dir, 'outputs')
+                os.makedirs(job_output_dir, exist_ok=True)
 
+                # 验证和处理都只读取输入文件，直接使用缓存中的上传文件
+                st.session_state.files_generated = False
+                st.session_state.job_id = job_manager.submit(
+                    run_invoice_job, packing_list_upload, policy_upload, job_output_dir, result_cache, cache_key)
         except Exception as e:
             st.error(f"An error occurred: {str(e)} 发生错误：{str(e)}")
             st.error("Please check your input files and try again. 请检查输入文件并重试。")
 
+# 轮询后台任务的进度
+if 'job_id' in st.session_state:
+    job = job_manager.get(st.session_state.job_id)
+    if job is None:
+        del st.session_state.job_id
+    elif not job.finished:
+        if job.status == 'queued':
+            st.info(f"任务排队中，前面还有 {max(0, job_manager.pending_count() - 1)} 个任务... Job queued...")
+        st.progress(job.progress, text=f"Processing files... 正在处理文件... {STAGE_LABELS.get(job.stage, '')}")
+        time.sleep(JOB_POLL_INTERVAL)
+        rerun()
+    else:
+        del st.session_state.job_id
+        if job.status == 'failed':
+            st.error(f"An error occurred: {job.error} 发生错误：{job.error}")
+            st.error("Please check your input files and try again. 请检查输入文件并重试。")
+        elif not job.result["validation_passed"]:
+            show_validation_errors(job.result["error_messages"])
+        elif job.result["export_files"]:
+            show_generated_files(job.result)
+            st.success("Files generated successfully! 文件生成成功！")
+        else:
+            st.warning("No export files were generated. Please check your input files. 没有生成导出文件，请检查输入文件。")
+
+# 缓存的结果可能已被淘汰
+if st.session_state.files_generated and not os.path.exists(st.session_state.bundle_path):
+    st.session_state.files_generated = False
+    st.info("之前生成的文件已过期清理，请重新生成。Generated files have expired, please generate again.")
+
 # 显示生成的文件下载区域
 if st.session_state.files_generated:
     st.header("Download Files 下载文件")
     
     # 创建下载所有文件的功能
     if st.session_state.export_files:
-        # 创建一个内存中的ZIP文件
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w') as zip_file:
-            for file in st.session_state.export_files:
-                file_path = os.path.join(st.session_state.output_dir, file)
-                with open(file_path, "rb") as f:
-                    zip_file.writestr(file, f.read())
-        
-        # 提供下载所有文件的按钮
-        st.download_button(
-            label="Download All Files 下载所有文件",
-            data=zip_buffer.getvalue(),
-            file_name="all_export_files.zip",
-            mime="application/zip",
-            help="Download all generated files as a ZIP archive"
-        )
+        # 提供下载所有文件的按钮(任务完成时已在磁盘上生成ZIP包)
+        with open(st.session_state.bundle_path, "rb") as bundle_file:
+            st.download_button(
+                label="Download All Files 下载所有文件",
+                data=bundle_file,
+                file_name="all_export_files.zip",
+                mime="application/zip",
+                help="Download all generated files as a ZIP archive"
+            )
         
         st.markdown("---")
         st.markdown("### Individual Files 单个文件")
@@ -241,32 +331,30 @@ if st.session_state.files_generated:
             if file == 'cif_original_invoice.xlsx':
                 # 添加一个可折叠区域用于显示CIF原始发票（默认折叠）
                 with st.expander("显示CIF原始发票（仅供内部使用）", expanded=False):
-                    with open(os.path.join(st.session_state.output_dir, file), "rb") as f:
-                        file_description = file_descriptions.get(file, "导出文件")
-                        st.download_button(
-                            label=f"Download {file}",
-                            data=f,
-                            file_name=file,
-                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                            help=file_description,
-                            key=f"download_{file}"
-                        )
-                        st.markdown(f"**描述**: {file_description}")
-                    st.markdown("*注意：CIF原始发票仅供内部计算使用，不是最终交付文件*")
-            else:
-                # 正常显示其他文件
-                with open(os.path.join(st.session_state.output_dir, file), "rb") as f:
                     file_description = file_descriptions.get(file, "导出文件")
                     st.download_button(
                         label=f"Download {file}",
-                        data=f,
+                        data=file_download_data(file),
                         file_name=file,
                         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
                         help=file_description,
                         key=f"download_{file}"
                     )
                     st.markdown(f"**描述**: {file_description}")
-                    st.markdown("---")
+                    st.markdown("*注意：CIF原始发票仅供内部计算使用，不是最终交付文件*")
+            else:
+                # 正常显示其他文件
+                file_description = file_descriptions.get(file, "导出文件")
+                st.download_button(
+                    label=f"Download {file}",
+                    data=file_download_data(file),
+                    file_name=file,
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                    help=file_description,
+                    key=f"download_{file}"
+                )
+                st.markdown(f"**描述**: {file_description}")
+                st.markdown("---")
 
 # Footer
 st.markdown("---")
@@ -0,0 +1,484 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+持久化的批量处理任务队列
+
+任务记录保存在SQLite数据库中: 输入文件哈希、状态、到达的处理阶段、已完成的步骤、输出文件和耗时。
+批量处理中断(机器重启、某个文件让openpyxl卡住)后重新运行即可继续，不需要从头开始:
+
+- 工作线程在一个IMMEDIATE事务中领取任务，多个运行进程不会领取同一任务
+- 每次尝试在独立的子进程中执行，超过时限的子进程被终止；失败后按指数退避重试，超过次数后标记为失败
+- 运行期间定时写心跳，重新启动时心跳过期的running任务重新排队
+- 每个任务分为process(生成发票)和publish(复制到输出目录并记录哈希)两步，
+  已完成的步骤不再重复执行。子进程在任务自己的工作目录中运行，模板文件只读取，
+  并发任务直接使用项目目录中的同一份模板
+
+用法:
+    python batch_queue.py add --packing-list a.xlsx --policy policy.xlsx --output-dir outputs/a
+    python batch_queue.py run --workers 2 --timeout 600
+    python batch_queue.py status
+"""
+
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_QUEUE_DIR = 'batch_jobs'
+
+# 每个任务的执行步骤，按顺序完成
+JOB_STEPS = ('process', 'publish')
+
+# --profile-deep时各阶段性能分析结果所在的子目录(与输出文件一起发布)
+PROFILE_DIR = 'profile'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    inputs_hash TEXT NOT NULL,
+    packing_lists TEXT NOT NULL,
+    policy TEXT NOT NULL,
+    output_dir TEXT NOT NULL,
+    options TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'queued',
+    stage TEXT,
+    step TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    next_run_at REAL NOT NULL,
+    claimed_by TEXT,
+    heartbeat_at REAL,
+    error TEXT,
+    artifacts TEXT,
+    timings TEXT NOT NULL DEFAULT '{}',
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (state, next_run_at);
+"""
+
+
+def inputs_hash(packing_lists, policy, options):
+    """输入文件内容和处理选项的SHA-256"""
+    digest = hashlib.sha256()
+    for path in list(packing_lists) + [policy]:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        digest.update(b'\0')
+    digest.update(json.dumps(options, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class JobQueue:
+    """SQLite任务队列，可以在多个线程和进程中同时使用(每次操作使用独立的连接)"""
+
+    def __init__(self, queue_dir=DEFAULT_QUEUE_DIR, backoff_seconds=30, lease_seconds=120):
+        self.queue_dir = os.path.abspath(queue_dir)
+        self.db_path = os.path.join(self.queue_dir, 'queue.db')
+        self.work_dir = os.path.join(self.queue_dir, 'work')
+        self.log_dir = os.path.join(self.queue_dir, 'logs')
+        self.backoff_seconds = backoff_seconds
+        self.lease_seconds = lease_seconds
+        os.makedirs(self.work_dir, exist_ok=True)
+        os.makedirs(self.log_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        return _Connection(conn)
+
+    def _update(self, job_id, **values):
+        assignments = ', '.join(f"{key} = ?" for key in values)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", list(values.values()) + [job_id])
+
+    def add(self, packing_lists, policy, output_dir, options=None, max_attempts=3):
+        """加入任务；相同输入和输出目录的任务未失败时不重复加入
+
+        Returns:
+            tuple: (任务ID, 是否新加入)
+
+        Raises:
+            FileNotFoundError: 装箱单或政策文件不存在
+        """
+        packing_lists = [os.path.abspath(path) for path in packing_lists]
+        policy = os.path.abspath(policy)
+        # 与process_shipping_list的命令行一样先检查输入文件
+        for path in packing_lists:
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"原始装箱单文件不存在: {path}")
+        if not os.path.exists(policy):
+            raise FileNotFoundError(f"政策文件不存在: {policy}")
+        output_dir = os.path.abspath(output_dir)
+        options = dict(options or {})
+        content_hash = inputs_hash(packing_lists, policy, options)
+
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute("SELECT id FROM jobs WHERE inputs_hash = ? AND output_dir = ? AND state != 'failed'",
+                               (content_hash, output_dir)).fetchone()
+            if row is not None:
+                conn.execute('COMMIT')
+                return row['id'], False
+            now = time.time()
+            cursor = conn.execute(
+                "INSERT INTO jobs (inputs_hash, packing_lists, policy, output_dir, options, max_attempts, "
+                "next_run_at, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (content_hash, json.dumps(packing_lists, ensure_ascii=False), policy, output_dir,
+                 json.dumps(options), max_attempts, now, now))
+            conn.execute('COMMIT')
+            return cursor.lastrowid, True
+
+    def claim(self, worker):
+        """领取一个到期的排队任务
+
+        Returns:
+            sqlite3.Row: 任务记录，没有可领取的任务时返回None
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute("SELECT id FROM jobs WHERE state = 'queued' AND next_run_at <= ? "
+                               "ORDER BY next_run_at, id LIMIT 1", (now,)).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            conn.execute("UPDATE jobs SET state = 'running', claimed_by = ?, heartbeat_at = ?, "
+                         "attempts = attempts + 1, error = NULL, started_at = COALESCE(started_at, ?) WHERE id = ?",
+                         (worker, now, now, row['id']))
+            job = conn.execute("SELECT * FROM jobs WHERE id = ?", (row['id'],)).fetchone()
+            conn.execute('COMMIT')
+            return job
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            return conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    def jobs(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT * FROM jobs ORDER BY id").fetchall()
+
+    def heartbeat(self, job_id):
+        self._update(job_id, heartbeat_at=time.time())
+
+    def set_stage(self, job_id, attempt, stage):
+        """记录处理程序到达的阶段(PROCESS_STAGES)，只有当前这次尝试可以更新"""
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET stage = ?, heartbeat_at = ? WHERE id = ? AND attempts = ? AND state = 'running'",
+                         (stage, time.time(), job_id, attempt))
+
+    def complete_step(self, job_id, attempt, step, seconds, **values):
+        """记录已完成的步骤及其耗时(累加到timings中)
+
+        运行进程被强制结束后，其子进程可能仍在运行；任务被重新领取后，旧的尝试不能再记录步骤。
+
+        Returns:
+            bool: 是否已记录(False表示这次尝试已被取代)
+        """
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute("SELECT timings FROM jobs WHERE id = ? AND attempts = ? AND state = 'running'",
+                               (job_id, attempt)).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return False
+            timings = json.loads(row['timings'])
+            timings[step] = timings.get(step, 0.0) + seconds
+            values.update(step=step, timings=json.dumps(timings), heartbeat_at=time.time())
+            assignments = ', '.join(f"{key} = ?" for key in values)
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", list(values.values()) + [job_id])
+            conn.execute('COMMIT')
+            return True
+
+    def finish(self, job_id):
+        self._update(job_id, state='done', claimed_by=None, finished_at=time.time())
+
+    def fail(self, job_id, error):
+        """记录失败: 未超过重试次数时按指数退避重新排队，否则标记为失败
+
+        Returns:
+            str: 新状态('queued'或'failed')
+        """
+        job = self.get(job_id)
+        if job['attempts'] < job['max_attempts']:
+            delay = self.backoff_seconds * 2 ** (job['attempts'] - 1)
+            self._update(job_id, state='queued', claimed_by=None, error=error, next_run_at=time.time() + delay)
+            print(f"任务 {job_id}: 第{job['attempts']}次尝试失败，{delay:.0f}秒后重试: {error}")
+            return 'queued'
+        self._update(job_id, state='failed', claimed_by=None, error=error, finished_at=time.time())
+        print(f"任务 {job_id}: 已失败 ({job['attempts']}次尝试): {error}")
+        return 'failed'
+
+    def requeue(self, job_id):
+        """把失败的任务重新排队(重置尝试次数，已完成的步骤保留)"""
+        self._update(job_id, state='queued', attempts=0, error=None, next_run_at=time.time(), finished_at=None)
+
+    def recover(self):
+        """心跳过期的running任务(运行进程已退出)重新排队，从已完成的步骤之后继续
+
+        Returns:
+            list: 重新排队的任务ID
+        """
+        expired = time.time() - self.lease_seconds
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute("SELECT id FROM jobs WHERE state = 'running' AND heartbeat_at < ?",
+                                (expired,)).fetchall()
+            conn.execute("UPDATE jobs SET state = 'queued', claimed_by = NULL, next_run_at = ? "
+                         "WHERE state = 'running' AND heartbeat_at < ?", (time.time(), expired))
+            conn.execute('COMMIT')
+        job_ids = [row['id'] for row in rows]
+        if job_ids:
+            print(f"重新排队中断的任务: {job_ids}")
+        return job_ids
+
+    def pending_count(self):
+        """排队(含等待重试)和运行中的任务数"""
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM jobs WHERE state IN ('queued', 'running')").fetchone()[0]
+
+    def job_dir(self, job_id):
+        return os.path.join(self.work_dir, str(job_id))
+
+
+class _Connection:
+    """sqlite3连接的上下文管理器，退出时关闭连接(sqlite3自带的上下文管理器只提交不关闭)"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self.conn.in_transaction:
+            self.conn.execute('ROLLBACK')
+        self.conn.close()
+
+
+def run_job_steps(queue, job_id, attempt, profile_deep=False):
+    """在子进程中执行任务的未完成步骤
+
+    process: 在任务工作目录中使用模板副本生成发票，输出写到工作目录的outputs中
+    publish: 把输出复制到任务的输出目录，记录文件和SHA-256
+    profile_deep为True时process步骤按阶段进行深度性能分析，结果随输出文件一起发布
+
+    Returns:
+        int: 退出码，0表示成功
+    """
+    from invoice_jobs import file_sha256
+
+    job = queue.get(job_id)
+    job_dir = queue.job_dir(job_id)
+    work_output_dir = os.path.join(job_dir, 'outputs')
+    completed = JOB_STEPS.index(job['step']) + 1 if job['step'] in JOB_STEPS else 0
+    if completed and not os.path.isdir(work_output_dir):
+        # 工作目录已被清理，重新处理
+        completed = 0
+
+    if completed < 1:
+        # 每次尝试从干净的工作目录开始(工作目录中没有模板，处理程序使用脚本目录中的模板)
+        shutil.rmtree(job_dir, ignore_errors=True)
+        os.makedirs(work_output_dir)
+        os.chdir(job_dir)
+
+        from process_shipping_list import process_shipping_list
+
+        options = json.loads(job['options'])
+        packing_lists = json.loads(job['packing_lists'])
+        set_stage = lambda stage: queue.set_stage(job_id, attempt, stage)
+        if profile_deep:
+            from shipping_processor.profiling import deep_profile
+            profiling = deep_profile(os.path.join(work_output_dir, PROFILE_DIR), set_stage)
+        else:
+            profiling = contextlib.nullcontext(set_stage)
+        start = time.perf_counter()
+        with profiling as progress_callback:
+            process_shipping_list(packing_lists if len(packing_lists) > 1 else packing_lists[0], job['policy'],
+                                  work_output_dir, progress_callback=progress_callback,
+                                  xml_merge=options.get('xml_merge', False),
+                                  supplier_breakdown=options.get('supplier_breakdown', False),
+                                  invoice_numbering=options.get('invoice_numbering', 'counter'),
+                                  in_process_merge=True)
+        export_files = sorted(f for f in os.listdir(work_output_dir) if f.endswith('.xlsx'))
+        if not export_files:
+            print("没有生成输出文件")
+            return 1
+        if not queue.complete_step(job_id, attempt, 'process', time.perf_counter() - start):
+            print("任务已被重新领取，本次尝试的结果不再使用")
+            return 1
+
+    if completed < 2:
+        start = time.perf_counter()
+        os.makedirs(job['output_dir'], exist_ok=True)
+        artifacts = {}
+        for name in sorted(os.listdir(work_output_dir)):
+            if name.endswith('.xlsx'):
+                target = os.path.join(job['output_dir'], name)
+                shutil.copy2(os.path.join(work_output_dir, name), target)
+                artifacts[name] = file_sha256(target)
+        profile_dir = os.path.join(work_output_dir, PROFILE_DIR)
+        if os.path.isdir(profile_dir):
+            shutil.copytree(profile_dir, os.path.join(job['output_dir'], PROFILE_DIR), dirs_exist_ok=True)
+        if not queue.complete_step(job_id, attempt, 'publish', time.perf_counter() - start,
+                                   artifacts=json.dumps(artifacts, ensure_ascii=False)):
+            print("任务已被重新领取，本次尝试的结果不再使用")
+            return 1
+    return 0
+
+
+class BatchRunner:
+    """领取并执行队列中的任务，直到没有排队或运行中的任务"""
+
+    def __init__(self, queue, workers=2, timeout=600, heartbeat_interval=5, profile_deep=False):
+        self.queue = queue
+        self.profile_deep = profile_deep
+        self.workers = workers
+        self.timeout = timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+
+    def run(self):
+        self.queue.recover()
+        threads = [threading.Thread(target=self._worker, args=(f"{self.name}:{i}",), name=f"batch-worker-{i}")
+                   for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _worker(self, worker):
+        while True:
+            job = self.queue.claim(worker)
+            if job is None:
+                # 还有等待重试或其他进程正在运行的任务时继续等待，期间接管心跳过期的任务
+                self.queue.recover()
+                if self.queue.pending_count() == 0:
+                    return
+                time.sleep(1)
+                continue
+            self._attempt(job)
+
+    def _attempt(self, job):
+        job_id = job['id']
+        print(f"任务 {job_id}: 开始第{job['attempts']}次尝试 (已完成步骤: {job['step'] or '无'})")
+        log_path = os.path.join(self.queue.log_dir, f"{job_id}-attempt{job['attempts']}.log")
+        command = [sys.executable, os.path.join(SCRIPT_DIR, 'batch_queue.py'),
+                   '--queue-dir', self.queue.queue_dir, 'run-job', str(job_id), str(job['attempts'])]
+        if self.profile_deep:
+            command.append('--profile-deep')
+
+        start = time.time()
+        deadline = start + self.timeout
+        with open(log_path, 'w', encoding='utf-8') as log:
+            process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT, cwd=SCRIPT_DIR)
+            while True:
+                try:
+                    returncode = process.wait(timeout=max(0.1, min(self.heartbeat_interval, deadline - time.time())))
+                    break
+                except subprocess.TimeoutExpired:
+                    if time.time() >= deadline:
+                        process.kill()
+                        process.wait()
+                        self.queue.fail(job_id, f"超时 ({self.timeout}秒)，已终止，日志: {log_path}")
+                        return
+                    self.queue.heartbeat(job_id)
+
+        if returncode == 0:
+            self.queue.finish(job_id)
+            print(f"任务 {job_id}: 完成, 耗时 {time.time() - start:.1f}秒")
+        else:
+            self.queue.fail(job_id, f"退出码 {returncode}，日志: {log_path}")
+
+
+def print_status(queue):
+    for job in queue.jobs():
+        timings = ', '.join(f"{step} {seconds:.1f}秒" for step, seconds in json.loads(job['timings']).items())
+        print(f"{job['id']:>4}  {job['state']:<7} 阶段 {job['stage'] or '-':<8} 步骤 {job['step'] or '-':<8} "
+              f"尝试 {job['attempts']}/{job['max_attempts']}  {timings}  {job['output_dir']}")
+        if job['error']:
+            print(f"      错误: {job['error']}")
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description='持久化的批量处理任务队列')
+    parser.add_argument('--queue-dir', default=DEFAULT_QUEUE_DIR, help=f'队列目录 (默认: {DEFAULT_QUEUE_DIR})')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    add = subparsers.add_parser('add', help='加入任务')
+    add.add_argument('--packing-list', nargs='+', required=True, help='装箱单文件，多个时合并处理')
+    add.add_argument('--policy', required=True, help='政策文件')
+    add.add_argument('--output-dir', required=True, help='输出目录')
+    add.add_argument('--xml-merge', action='store_true', help='在XML层面拼接表头/数据/页脚')
+    add.add_argument('--supplier-breakdown', action='store_true', help='输出按供应商的汇总')
+    add.add_argument('--invoice-numbering', choices=['counter', 'deterministic'], default='counter',
+                     help='发票号分配方式，deterministic时重试和重新运行得到相同的发票号 (默认: counter)')
+    add.add_argument('--max-attempts', type=int, default=3, help='最多尝试次数 (默认: 3)')
+
+    run = subparsers.add_parser('run', help='执行队列中的任务')
+    run.add_argument('--workers', type=int, default=2, help='并发任务数 (默认: 2)')
+    run.add_argument('--timeout', type=float, default=600, help='单次尝试的时限秒数 (默认: 600)')
+    run.add_argument('--backoff', type=float, default=30, help='第一次重试前的等待秒数，之后每次加倍 (默认: 30)')
+    run.add_argument('--lease', type=float, default=120,
+                     help='running任务超过此秒数没有心跳时视为中断并重新排队，需大于心跳间隔 (默认: 120)')
+    run.add_argument('--profile-deep', action='store_true',
+                     help=f'按处理阶段记录cProfile、调用栈采样和tracemalloc结果，随输出文件发布到<输出目录>/{PROFILE_DIR}/')
+
+    subparsers.add_parser('status', help='显示所有任务')
+
+    requeue = subparsers.add_parser('requeue', help='重新排队失败的任务')
+    requeue.add_argument('job_ids', type=int, nargs='+')
+
+    run_job = subparsers.add_parser('run-job', help=argparse.SUPPRESS)
+    run_job.add_argument('job_id', type=int)
+    run_job.add_argument('attempt', type=int)
+    run_job.add_argument('--profile-deep', action='store_true')
+    return parser
+
+
+def main():
+    args = build_arg_parser().parse_args()
+
+    if args.command == 'run':
+        queue = JobQueue(args.queue_dir, backoff_seconds=args.backoff, lease_seconds=args.lease)
+        BatchRunner(queue, workers=args.workers, timeout=args.timeout, profile_deep=args.profile_deep).run()
+        print_status(queue)
+        return
+
+    queue = JobQueue(args.queue_dir)
+    if args.command == 'add':
+        options = {'xml_merge': args.xml_merge, 'supplier_breakdown': args.supplier_breakdown,
+                   'invoice_numbering': args.invoice_numbering}
+        try:
+            job_id, added = queue.add(args.packing_list, args.policy, args.output_dir, options, args.max_attempts)
+        except FileNotFoundError as e:
+            print(f"错误: {e}")
+            sys.exit(1)
+        print(f"任务 {job_id}: {'已加入' if added else '相同的任务已存在'}")
+    elif args.command == 'status':
+        print_status(queue)
+    elif args.command == 'requeue':
+        for job_id in args.job_ids:
+            queue.requeue(job_id)
+            print(f"任务 {job_id}: 已重新排队")
+    elif args.command == 'run-job':
+        sys.exit(run_job_steps(queue, args.job_id, args.attempt, profile_deep=args.profile_deep))
+
+
+if __name__ == '__main__':
+    main()
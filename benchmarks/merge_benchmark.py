@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+复进口发票合并基准测试
+
+在宽表(大量附加列)上比较shipping_processor.model.transformer.merge_india_invoice_rows
+与改为单次聚合之前的同一函数(legacy_merge_india_invoice_rows，按零件号合并，每列单独groupby)
+的耗时，并检查两者的结果相同。
+
+用法:
+    python benchmarks/merge_benchmark.py
+    python benchmarks/merge_benchmark.py --rows 20000 --extra-columns 80
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+
+def make_invoice(rows, parts, extra_columns, seed=0):
+    """生成合成的复进口发票数据，列名两种实现都能识别"""
+    rng = np.random.default_rng(seed)
+    data = {
+        'NO.': np.arange(1, rows + 1),
+        'Part Number': rng.choice([f"P{i:05d}" for i in range(parts)], rows),
+        'Commodity Description (Customs)': rng.choice(['Bracket', 'Cable', 'Housing'], rows),
+        'Unit Price (CIF, USD)': rng.choice([1.2345, 2.5, 0.75], rows),
+        'Quantity': rng.integers(1, 100, rows),
+        'Unit': 'PCS',
+        'Total Amount (CIF, USD)': rng.random(rows) * 100,
+        'Total Net Weight (kg)': rng.random(rows) * 10,
+    }
+    for i in range(extra_columns):
+        data[f"Extra {i}"] = rng.choice(['A', 'B', 'C'], rows)
+    return pd.DataFrame(data)
+
+
+def legacy_merge_india_invoice_rows(df):
+    """改为单次聚合之前的shipping_processor.model.transformer.merge_india_invoice_rows(原样保留，作为对照)"""
+    if df.empty:
+        return df
+
+    result_df = df.copy()
+
+    sn_col = None
+    part_col = None
+    desc_col = None
+    qty_col = None
+
+    for col in df.columns:
+        col_lower = str(col).lower()
+        if 'no' in col_lower or 'sn' in col_lower or '序号' in col_lower:
+            sn_col = col
+        elif 'part' in col_lower or '零件' in col_lower:
+            part_col = col
+        elif 'desc' in col_lower or '描述' in col_lower:
+            desc_col = col
+        elif 'qty' in col_lower or 'quantity' in col_lower or '数量' in col_lower:
+            qty_col = col
+
+    if not all([sn_col, part_col, desc_col, qty_col]):
+        return df
+
+    grouped = result_df.groupby(part_col, as_index=False).agg({
+        sn_col: 'first',
+        desc_col: lambda x: '\n'.join(str(val) for val in x if val) if len(x) > 1 else x.iloc[0],
+        qty_col: 'sum'
+    })
+
+    for col in result_df.columns:
+        if col in [sn_col, part_col, desc_col, qty_col]:
+            continue
+
+        col_lower = str(col).lower()
+        if any(weight in col_lower for weight in ['weight', 'gross', 'net', '重量']):
+            grouped[col] = result_df.groupby(part_col)[col].sum().values
+        elif any(price in col_lower for price in ['price', 'unit price', '单价']):
+            grouped[col] = result_df.groupby(part_col)[col].first().values
+        elif any(amount in col_lower for amount in ['amount', 'total', '金额']):
+            grouped[col] = result_df.groupby(part_col)[col].sum().values
+        else:
+            grouped[col] = result_df.groupby(part_col)[col].first().values
+
+    for i, idx in enumerate(grouped.index):
+        grouped.at[idx, sn_col] = i + 1
+
+    return grouped
+
+
+def measure(func, df, repeat):
+    """运行多次取中位数(毫秒)，屏蔽被测函数的调试输出"""
+    samples = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func(df)
+            samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='复进口发票合并基准测试')
+    parser.add_argument('--rows', type=int, default=5000, help='数据行数 (默认: 5000)')
+    parser.add_argument('--parts', type=int, default=500, help='不同零件号的数量 (默认: 500)')
+    parser.add_argument('--extra-columns', type=int, default=40, help='附加列数量 (默认: 40)')
+    parser.add_argument('--repeat', type=int, default=5, help='运行次数，取中位数 (默认: 5)')
+    args = parser.parse_args()
+
+    from shipping_processor.model.transformer import merge_india_invoice_rows as refactored_merge
+
+    df = make_invoice(args.rows, args.parts, args.extra_columns)
+    print(f"数据: {args.rows}行 x {len(df.columns)}列, {args.parts}个零件号")
+
+    # 两种实现的结果应相同(列顺序以旧实现为准)
+    expected = legacy_merge_india_invoice_rows(df)
+    actual = refactored_merge(df)
+    pd.testing.assert_frame_equal(actual[expected.columns], expected, check_dtype=False)
+
+    legacy = measure(legacy_merge_india_invoice_rows, df, args.repeat)
+    refactored = measure(refactored_merge, df, args.repeat)
+    print(f"{'legacy (per-column groupby)':<40} {legacy:>9.1f} ms")
+    print(f"{'shipping_processor.model.transformer':<40} {refactored:>9.1f} ms  ({legacy / refactored:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
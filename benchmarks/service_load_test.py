@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+本地发票处理服务的压测客户端(仅标准库)
+
+并发提交若干任务，轮询到完成，输出每个任务的端到端耗时和服务端记录的阶段耗时。
+相同的输入文件会命中服务的结果缓存，使用--unique让每个任务的装箱单内容不同(末尾追加随机字节，
+不影响xlsx的读取)，以测量实际处理耗时。
+
+用法:
+    python invoice_service.py &
+    python benchmarks/service_load_test.py --jobs 4 --concurrency 2 --unique
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import Request, urlopen
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def request_json(url, data=None, headers=None):
+    with urlopen(Request(url, data=data, headers=headers or {})) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+
+def encode_multipart(fields, files):
+    """编码multipart/form-data请求体
+
+    Args:
+        fields: {字段: 文本值}
+        files: [(字段, 文件名, 内容), ...]
+
+    Returns:
+        tuple: (请求体, Content-Type)
+    """
+    boundary = uuid.uuid4().hex
+    chunks = []
+    for name, value in fields.items():
+        chunks.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, filename, content in files:
+        chunks.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                      f'Content-Type: application/octet-stream\r\n\r\n'.encode())
+        chunks.append(content + b'\r\n')
+    chunks.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(chunks), f'multipart/form-data; boundary={boundary}'
+
+
+def run_job(base_url, packing_list, policy, unique, poll_interval):
+    """提交一个任务并等待完成
+
+    Returns:
+        dict: 任务ID、状态、端到端耗时和服务端的运行概况
+    """
+    content = packing_list + (os.urandom(16) if unique else b'')
+    body, content_type = encode_multipart({}, [('packing_list', 'packing_list.xlsx', content),
+                                               ('policy', 'policy.xlsx', policy)])
+    start = time.perf_counter()
+    job_id = request_json(f"{base_url}/jobs", body, {'Content-Type': content_type})['job_id']
+    while True:
+        status = request_json(f"{base_url}/jobs/{job_id}")
+        if status['status'] in ('done', 'failed'):
+            break
+        time.sleep(poll_interval)
+    elapsed = time.perf_counter() - start
+    profile = request_json(f"{base_url}/jobs/{job_id}/profile")['profile']
+    return {'job_id': job_id, 'status': status['status'], 'elapsed': elapsed, 'profile': profile,
+            'artifacts': len(status.get('artifacts') or {})}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地发票处理服务压测客户端')
+    parser.add_argument('--url', default='http://127.0.0.1:8765', help='服务地址')
+    parser.add_argument('--packing-list', default=os.path.join(ROOT_DIR, 'testfiles', 'original_packing_list.xlsx'))
+    parser.add_argument('--policy', default=os.path.join(ROOT_DIR, 'testfiles', 'policy.xlsx'))
+    parser.add_argument('--jobs', type=int, default=4, help='任务数 (默认: 4)')
+    parser.add_argument('--concurrency', type=int, default=2, help='并发提交数 (默认: 2)')
+    parser.add_argument('--unique', action='store_true', help='每个任务使用不同的上传内容，不命中结果缓存')
+    parser.add_argument('--poll-interval', type=float, default=0.2, help='轮询间隔秒数 (默认: 0.2)')
+    args = parser.parse_args()
+
+    with open(args.packing_list, 'rb') as f:
+        packing_list = f.read()
+    with open(args.policy, 'rb') as f:
+        policy = f.read()
+
+    print(f"服务状态: {request_json(args.url + '/health')['warm_up']}")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = [executor.submit(run_job, args.url, packing_list, policy, args.unique, args.poll_interval)
+                   for _ in range(args.jobs)]
+        results = [future.result() for future in futures]
+    wall = time.perf_counter() - start
+
+    for result in results:
+        stages = ', '.join(f"{stage} {seconds:.2f}" for stage, seconds in result['profile']['stages'].items())
+        print(f"{result['job_id']}  {result['status']:<6} {result['elapsed']:>7.2f}秒  "
+              f"排队 {result['profile']['queued']:.2f}  [{stages}]  {result['artifacts']}个文件")
+    elapsed = [result['elapsed'] for result in results]
+    print(f"{len(results)}个任务, 总耗时 {wall:.2f}秒, 平均 {statistics.mean(elapsed):.2f}秒, "
+          f"最长 {max(elapsed):.2f}秒")
+    if any(result['status'] != 'done' for result in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
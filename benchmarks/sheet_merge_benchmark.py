@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+表头/数据/页脚合并基准测试
+
+生成一个包含装箱单和发票工作表的中间文件，比较merge.merge_three_excel_files(openpyxl逐个复制单元格)
+与shipping_processor.merge.splice.splice_three_excel_files(XML拼接)的耗时。
+
+用法:
+    python benchmarks/sheet_merge_benchmark.py
+    python benchmarks/sheet_merge_benchmark.py --rows 50000
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+
+def make_middle_file(path, rows, seed=0):
+    """生成中间文件: 第一个工作表为装箱单，第二个为发票，最后是合计行"""
+    rng = np.random.default_rng(seed)
+    invoice = pd.DataFrame({
+        'S/N': np.arange(1, rows + 1),
+        'Part Number': rng.choice([f"P{i:05d}" for i in range(500)], rows),
+        'Commodity Description (Customs)': rng.choice(['Bracket', 'Cable', 'Housing'], rows),
+        'Unit Price (CIF, USD)': rng.random(rows).round(4),
+        'Quantity': rng.integers(1, 100, rows),
+        'Unit': 'PCS',
+        'Total Amount (CIF, USD)': rng.random(rows) * 100,
+        'Total Net Weight (kg)': rng.random(rows) * 10,
+    })
+    total = {col: '' for col in invoice.columns}
+    total['Commodity Description (Customs)'] = 'Total'
+    invoice = pd.concat([invoice, pd.DataFrame([total])], ignore_index=True)
+    with pd.ExcelWriter(path, engine='openpyxl') as writer:
+        invoice.to_excel(writer, sheet_name='PL', index=False)
+        invoice.to_excel(writer, sheet_name='CXCI0001', index=False)
+
+
+def measure(func, *args):
+    """运行一次(毫秒)，屏蔽被测函数的调试输出"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        success = func(*args)
+        elapsed = (time.perf_counter() - start) * 1000
+    if not success:
+        raise RuntimeError(f"{func.__name__} failed")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='表头/数据/页脚合并基准测试')
+    parser.add_argument('--rows', type=int, default=10000, help='发票行数 (默认: 10000)')
+    args = parser.parse_args()
+
+    from merge import merge_three_excel_files
+    from shipping_processor.merge.splice import splice_three_excel_files
+
+    templates = [os.path.join(ROOT_DIR, name) for name in ('h.xlsx', 'f.xlsx', 'pl_h.xlsx', 'pl_f.xlsx')]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        middle = os.path.join(temp_dir, 'middle.xlsx')
+        make_middle_file(middle, args.rows)
+        print(f"数据: 2个工作表 x {args.rows}行")
+
+        for name, func in (('merge.merge_three_excel_files', merge_three_excel_files),
+                           ('splice.splice_three_excel_files', splice_three_excel_files)):
+            output = os.path.join(temp_dir, f"{func.__name__}.xlsx")
+            elapsed = measure(func, templates[0], middle, templates[1], output, templates[2], templates[3])
+            print(f"{name:<40} {elapsed:>10.1f} ms  ({os.path.getsize(output) / 1024:.0f} KB)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+启动时间基准测试
+
+用python -X importtime统计各入口模块的累计导入耗时，并计时命令行--help的整体运行时间。
+结果可以保存为基线JSON，之后用--compare对比，防止重量级依赖重新被提前导入。
+
+用法:
+    python benchmarks/startup_benchmark.py
+    python benchmarks/startup_benchmark.py --save benchmarks/startup_baseline.json
+    python benchmarks/startup_benchmark.py --compare benchmarks/startup_baseline.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 导入耗时: 名称 -> 被导入的模块
+IMPORT_TARGETS = {
+    'import shipping_processor': 'shipping_processor',
+    'import process_shipping_list': 'process_shipping_list',
+    'import invoice_jobs': 'invoice_jobs',
+    'import result_cache': 'result_cache',
+}
+
+# 命令行耗时: 名称 -> 命令参数
+COMMAND_TARGETS = {
+    'process_shipping_list.py --help': ['process_shipping_list.py', '--help'],
+    'validation_program/main.py --help': [os.path.join('validation_program', 'main.py'), '--help'],
+}
+
+
+def parse_importtime(stderr, module):
+    """从-X importtime的输出中取出指定模块的累计耗时
+
+    Args:
+        stderr: 子进程的标准错误输出
+        module: 模块名
+
+    Returns:
+        tuple: (累计耗时(毫秒), 导入最慢的5个模块[(名称, 毫秒)])
+    """
+    cumulative = None
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        parts = line[len('import time:'):].split('|')
+        try:
+            cumulative_us = int(parts[1].strip())
+        except ValueError:
+            # 表头行
+            continue
+        name = parts[2].strip()
+        # 名称前的缩进表示嵌套层级，顶层导入只有一个空格
+        depth = len(parts[2]) - len(parts[2].lstrip())
+        entries.append((name, cumulative_us / 1000, depth))
+        if name == module:
+            cumulative = cumulative_us / 1000
+
+    # 只统计顶层和第二层的模块，更深的子模块耗时已包含在父模块中
+    top_level = [(name, ms) for name, ms, depth in entries if depth <= 3]
+    top_level.sort(key=lambda item: item[1], reverse=True)
+    return cumulative, top_level[:5]
+
+
+def measure_import(module, repeat):
+    """测量模块的导入耗时，取多次运行的中位数"""
+    samples = []
+    slowest = []
+    for _ in range(repeat):
+        completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                   cwd=ROOT_DIR, capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise RuntimeError(f"导入{module}失败: {completed.stderr.strip().splitlines()[-1]}")
+        cumulative, slowest = parse_importtime(completed.stderr, module)
+        samples.append(cumulative)
+    return statistics.median(samples), slowest
+
+
+def measure_command(args, repeat):
+    """测量命令的整体运行时间(毫秒)，取多次运行的中位数"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable] + args, cwd=ROOT_DIR, capture_output=True, text=True)
+        samples.append((time.perf_counter() - start) * 1000)
+        if completed.returncode != 0:
+            raise RuntimeError(f"运行{' '.join(args)}失败: {completed.stderr.strip()}")
+    return statistics.median(samples)
+
+
+def run_benchmarks(repeat):
+    """执行全部基准测试
+
+    Returns:
+        dict: {名称: 毫秒}
+    """
+    results = {}
+    for name, module in IMPORT_TARGETS.items():
+        results[name], slowest = measure_import(module, repeat)
+        print(f"{name:<40} {results[name]:>9.1f} ms")
+        for dep, ms in slowest:
+            if dep != module:
+                print(f"    {dep:<36} {ms:>9.1f} ms")
+    for name, args in COMMAND_TARGETS.items():
+        results[name] = measure_command(args, repeat)
+        print(f"{name:<40} {results[name]:>9.1f} ms")
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """与基线对比，超出容差的项目视为退化
+
+    Returns:
+        bool: 是否没有退化
+    """
+    ok = True
+    print("\n与基线对比:")
+    for name, value in results.items():
+        if name not in baseline:
+            print(f"{name:<40} {value:>9.1f} ms  (基线中没有)")
+            continue
+        base = baseline[name]
+        change = (value - base) / base if base else 0.0
+        regressed = change > tolerance
+        ok = ok and not regressed
+        print(f"{name:<40} {value:>9.1f} ms  基线 {base:>9.1f} ms  {change:+.0%}{'  退化' if regressed else ''}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='入口模块导入和--help启动时间基准测试')
+    parser.add_argument('--repeat', type=int, default=5, help='每项测量的运行次数，取中位数 (默认: 5)')
+    parser.add_argument('--save', help='把结果保存为基线JSON文件')
+    parser.add_argument('--compare', help='与基线JSON文件对比，有退化时返回非零退出码')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='对比时允许的相对增长 (默认: 0.25)')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.repeat)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n基线已保存到: {args.save}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+检查按供应商汇总(supplier_breakdown.xlsx)的USD合计与出口发票的合计金额一致
+
+合并处理testfiles/25和testfiles/428两个同名装箱单(两个供应商都应单独成行)，
+两者的物料都是一般贸易，出口发票包含全部行。出口发票的单价保留4位小数后再乘以数量，
+允许的差额为每件0.00005美元。
+"""
+
+import contextlib
+import glob
+import io
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+from process_shipping_list import process_shipping_list
+
+PACKING_LISTS = ['testfiles/25/original_packing_list.xlsx', 'testfiles/428/original_packing_list.xlsx']
+POLICY = 'testfiles/policy.xlsx'
+
+
+def main():
+    with tempfile.TemporaryDirectory() as output_dir:
+        with contextlib.redirect_stdout(io.StringIO()):
+            process_shipping_list(PACKING_LISTS, POLICY, output_dir=output_dir, supplier_breakdown=True,
+                                  invoice_lines='csv', render_xlsx=False, invoice_numbering='deterministic')
+        breakdown = pd.read_excel(os.path.join(output_dir, 'supplier_breakdown.xlsx'))
+        export_files = glob.glob(os.path.join(output_dir, 'invoice_lines', 'CXCI*.csv'))
+        export_lines = pd.read_csv(export_files[0])
+
+    failures = 0
+    suppliers = breakdown[breakdown['Supplier'] != 'Total']
+    if len(suppliers) != len(PACKING_LISTS):
+        print(f"[不一致] 供应商行数: {len(suppliers)} (期望 {len(PACKING_LISTS)}) {list(suppliers['Supplier'])}")
+        failures += 1
+    else:
+        print(f"[OK] 供应商: {list(suppliers['Supplier'])}")
+
+    total = breakdown.loc[breakdown['Supplier'] == 'Total'].iloc[0]
+    breakdown_usd = total['CIF总价(USD)']
+    export_usd = export_lines['amount_usd'].sum()
+    tolerance = 0.00005 * export_lines['quantity'].sum() + 0.01
+    status = "OK" if abs(breakdown_usd - export_usd) <= tolerance else "不一致"
+    print(f"[{status}] 汇总CIF总价(USD) {breakdown_usd:.4f}, 出口发票合计 {export_usd:.4f} (允许差额 {tolerance:.4f})")
+    if status != "OK":
+        failures += 1
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,5 @@
 import pandas as pd
+from validation_program.validators.utils import read_layout_table
 import os
 
 def print_file_info(file_path, description):
@@ -8,7 +9,9 @@ def print_file_info(file_path, description):
         return
     
     try:
-        df = pd.read_excel(file_path)
+        df = read_layout_table(file_path)
+        if df is None:
+            df = pd.read_excel(file_path)
         print(f"\n{description} ({file_path}):")
         print(f"  - Number of rows: {len(df)}")
         print(f"  - Number of columns: {len(df.columns)}")
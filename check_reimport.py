@@ -1,4 +1,5 @@
 import pandas as pd
+from validation_program.validators.utils import read_sheet_layout, read_layout_table
 
 # Define a function to check for Chinese characters
 def contains_chinese(text):
@@ -24,9 +25,12 @@ try:
         if i >= 8 and i <= 14:  # Focus on the data rows we saw earlier
             print(f"Row {i}: {row.tolist()}")
 
-    # Now read the data with the correct header row (9)
-    print("\nReading data with header row 9:")
-    df_data = pd.read_excel('outputs/reimport_invoice.xlsx', sheet_name=1, header=9)
+    # Now read the data region recorded in the workbook (header row 9 for older files)
+    layout = read_sheet_layout('outputs/reimport_invoice.xlsx')
+    print("\nReading data region:")
+    df_data = read_layout_table('outputs/reimport_invoice.xlsx', sheet_name=1, layout=layout)
+    if df_data is None:
+        df_data = pd.read_excel('outputs/reimport_invoice.xlsx', sheet_name=1, header=9)
 
     # Print the column names
     print("\nColumns in the data:")
@@ -35,7 +39,9 @@ try:
     # Also check the RECI sheet
     print("\nChecking RECI sheet:")
     try:
-        reci_df = pd.read_excel('outputs/reimport_invoice.xlsx', sheet_name=2, header=9)
+        reci_df = read_layout_table('outputs/reimport_invoice.xlsx', sheet_name=2, layout=layout)
+        if reci_df is None:
+            reci_df = pd.read_excel('outputs/reimport_invoice.xlsx', sheet_name=2, header=9)
         print("RECI sheet columns:")
         print(reci_df.columns.tolist())
         print("\nRECI sheet preview:")
@@ -1,7 +1,10 @@
 import pandas as pd
+from validation_program.validators.utils import read_layout_table
 
 # Read the export invoice
-df = pd.read_excel('outputs/export_invoice.xlsx')
+df = read_layout_table('outputs/export_invoice.xlsx')
+if df is None:
+    df = pd.read_excel('outputs/export_invoice.xlsx')
 
 # Print a preview of important columns
 print("EXPORT INVOICE PREVIEW:")
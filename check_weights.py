@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+检查净重毛重验证(InputValidator.validate_weights)在样本装箱单上的结果
+
+testfiles/16和testfiles/25的第1行为空，testfiles/428的中文字段行重复一次，
+这些文件都应按中文字段行定位表头并通过验证。
+另外检查normalize_weight_values对单个值的转换: 带单位的值保留负号，负值按0处理。
+"""
+
+import contextlib
+import io
+import sys
+
+import pandas as pd
+
+from shipping_processor.input.weights import normalize_weight_values
+from validation_program.validators.input_validator import InputValidator
+
+# (装箱单, 期望的验证结果)
+EXPECTED = [
+    ('testfiles/original_packing_list.xlsx', True),
+    ('testfiles/16/original_packing_list.xlsx', True),
+    ('testfiles/25/original_packing_list.xlsx', True),
+    ('testfiles/428/original_packing_list.xlsx', True),
+]
+
+# (重量单元格的值, 期望的转换结果, 是否记录容错日志)
+VALUE_CASES = [
+    ('1,200.5', 1200.5, False),
+    ('12.5kg', 12.5, False),
+    ('-5kg', 0.0, True),
+    (-3.2, 0.0, True),
+    ('N/A', 0.0, True),
+]
+
+
+def main():
+    failures = 0
+    values, error_log = normalize_weight_values(pd.Series([value for value, _, _ in VALUE_CASES], dtype=object))
+    logged_rows = {int(message[1:message.index('行')]) for message in error_log}
+    for row, (value, expected, logged) in enumerate(VALUE_CASES, 1):
+        ok = values[row - 1] == expected and (row in logged_rows) == logged
+        print(f"[{'OK' if ok else '不一致'}] {value!r}: {values[row - 1]} (期望 {expected}, 记录日志 {logged})")
+        if not ok:
+            failures += 1
+    for path, expected in EXPECTED:
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = InputValidator().validate_weights(path)
+        status = "OK" if result['success'] == expected else "不一致"
+        print(f"[{status}] {path}: {result['success']} (期望 {expected}) {result['message'].splitlines()[0]}")
+        if result['success'] != expected:
+            failures += 1
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+后台任务执行
+
+发票生成放到有上限的线程池中执行，Streamlit页面只负责提交任务并轮询任务状态和阶段进度，
+不会在脚本线程中阻塞，多个用户的请求也不会被同一个页面脚本串行化。
+"""
+
+import hashlib
+import os
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+
+class InvoiceJob:
+    """单个任务的状态"""
+
+    def __init__(self, job_id, stages):
+        self.job_id = job_id
+        self.stages = list(stages)
+        self.status = 'queued'  # queued / running / done / failed
+        self.stage = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        # [(阶段, 进入时间), ...]，用于统计各阶段耗时
+        self.stage_times = []
+
+    def set_stage(self, stage):
+        """记录当前阶段，可直接作为process_shipping_list的progress_callback"""
+        self.stage = stage
+        self.stage_times.append((stage, time.time()))
+        print(f"任务 {self.job_id}: 进入阶段 {stage}")
+
+    def profile(self):
+        """任务的运行概况: 排队时间、各阶段耗时和总耗时(秒)，未完成的阶段按当前时间计算"""
+        end = self.finished_at or time.time()
+        marks = self.stage_times + [(None, end)]
+        stages = {}
+        for (stage, start), (_, stop) in zip(marks, marks[1:]):
+            stages[stage] = stages.get(stage, 0.0) + (stop - start)
+        return {
+            'queued': (self.started_at or end) - self.created_at,
+            'stages': stages,
+            'total': end - self.started_at if self.started_at else 0.0,
+        }
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed')
+
+    @property
+    def progress(self):
+        """按已完成阶段估算的进度(0~1)"""
+        if self.status == 'done':
+            return 1.0
+        if self.stage not in self.stages:
+            return 0.0
+        return self.stages.index(self.stage) / len(self.stages)
+
+
+class JobManager:
+    """有上限的后台任务池
+
+    任务函数在工作线程中以func(job, *args, **kwargs)调用，返回值保存在job.result中，
+    异常保存在job.error中。已完成的任务只保留最近max_finished个。
+    """
+
+    def __init__(self, stages, max_workers=2, max_finished=50):
+        self.stages = list(stages)
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='invoice-job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        """提交任务
+
+        Returns:
+            str: 任务ID
+        """
+        job = InvoiceJob(uuid.uuid4().hex[:12], self.stages)
+        with self._lock:
+            self._prune()
+            self._jobs[job.job_id] = job
+        self._executor.submit(self._run, job, func, args, kwargs)
+        print(f"任务 {job.job_id}: 已提交")
+        return job.job_id
+
+    def get(self, job_id):
+        """按ID获取任务，不存在时返回None"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        """当前保留的所有任务(按提交时间排序)"""
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda job: job.created_at)
+
+    def pending_count(self):
+        """排队或运行中的任务数"""
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if not job.finished)
+
+    def _run(self, job, func, args, kwargs):
+        job.status = 'running'
+        job.started_at = time.time()
+        try:
+            job.result = func(job, *args, **kwargs)
+            job.status = 'done'
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.finished_at = time.time()
+            print(f"任务 {job.job_id}: {job.status}, 耗时 {job.finished_at - job.started_at:.1f}秒")
+
+    def _prune(self):
+        """丢弃最早完成的任务，只保留最近max_finished个"""
+        finished = sorted((job for job in self._jobs.values() if job.finished), key=lambda job: job.finished_at)
+        for job in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job.job_id]
+
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    """按块计算文件的SHA-256，用作下载内容的缓存键"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def build_zip_bundle(file_paths, bundle_path, compresslevel=6):
+    """把文件逐个流式写入磁盘上的ZIP包(不在内存中拼装)
+
+    Args:
+        file_paths: 要打包的文件路径列表，包内使用文件名
+        bundle_path: ZIP包输出路径
+        compresslevel: 压缩级别0-9，0表示只存储不压缩
+
+    Returns:
+        str: ZIP包路径
+    """
+    if compresslevel <= 0:
+        options = {'compression': zipfile.ZIP_STORED}
+    else:
+        options = {'compression': zipfile.ZIP_DEFLATED, 'compresslevel': min(compresslevel, 9)}
+
+    # 先写临时文件再改名，避免页面读到写了一半的ZIP包
+    temp_path = bundle_path + '.tmp'
+    with zipfile.ZipFile(temp_path, 'w', **options) as zip_file:
+        for file_path in file_paths:
+            zip_file.write(file_path, arcname=os.path.basename(file_path))
+    os.replace(temp_path, bundle_path)
+    return bundle_path
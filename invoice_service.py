@@ -0,0 +1,389 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+本地常驻发票处理服务
+
+供ERP集成使用的HTTP服务(仅标准库)，默认只监听localhost。进程启动时加载pandas、openpyxl、
+处理模块、分类规则和编译模板，之后每个任务都在已预热的进程中处理，合并步骤也在进程内执行，
+不再为每次处理启动解释器和重新导入模块。小批量装箱单的耗时主要就在这部分开销上。
+
+接口(返回JSON，除下载文件外):
+    GET  /health                          服务状态和预热耗时
+    POST /jobs                            multipart/form-data上传: packing_list(可多个，合并处理)、policy，
+                                          可选字段xml_merge、supplier_breakdown、deterministic_numbers(1/true)；
+                                          返回job_id
+    GET  /jobs                            所有保留的任务
+    GET  /jobs/<id>                       任务状态、阶段和进度
+    GET  /jobs/<id>/artifacts             输出文件列表
+    GET  /jobs/<id>/artifacts/<name>      下载输出文件(all_export_files.zip为打包的所有文件)
+    GET  /jobs/<id>/profile               排队时间和各阶段耗时
+
+用法:
+    python invoice_service.py --port 8765 --workers 2
+"""
+
+import argparse
+import email.parser
+import email.policy
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+from invoice_jobs import JobManager, build_zip_bundle, file_sha256
+from result_cache import ResultCache
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_FILES = ['h.xlsx', 'f.xlsx', 'pl_h.xlsx', 'pl_f.xlsx']
+BUNDLE_NAME = 'all_export_files.zip'
+# 上传内容的大小上限
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+TRUE_VALUES = ('1', 'true', 'yes', 'on')
+
+
+def warm_up():
+    """导入处理模块并加载分类规则和编译模板，服务进程只执行一次
+
+    Returns:
+        dict: {'seconds': {步骤: 耗时}, 'missing': 未找到的模板文件}
+    """
+    seconds = {}
+
+    start = time.perf_counter()
+    import process_shipping_list
+    import merge  # noqa: F401  合并在进程内执行
+    from validation_program.validators.input_validator import InputValidator  # noqa: F401
+    seconds['imports'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    from shipping_processor.model.rules import load_classification_rules
+    load_classification_rules()
+    seconds['classification_rules'] = time.perf_counter() - start
+
+    # 编译模板加载到进程内缓存，merge.load_template_safely直接使用
+    start = time.perf_counter()
+    from shipping_processor.merge.templates import load_template
+    from openpyxl import load_workbook
+    missing = []
+    for name in TEMPLATE_FILES:
+        path = process_shipping_list.find_file(name)
+        if not path:
+            missing.append(name)
+            continue
+        sheet_count = len(load_workbook(path, read_only=True).sheetnames)
+        for sheet in [None] + list(range(sheet_count)):
+            load_template(path, sheet)
+    seconds['templates'] = time.perf_counter() - start
+
+    print(f"服务预热完成: {', '.join(f'{key} {value:.2f}秒' for key, value in seconds.items())}")
+    if missing:
+        print(f"警告: 未找到模板文件: {', '.join(missing)}")
+    return {'seconds': seconds, 'missing': missing}
+
+
+def validate_input_files(packing_list_path, policy_file_path):
+    """验证输入文件，规则与页面(app.py)相同
+
+    Returns:
+        tuple: (验证是否通过, 错误信息列表)
+    """
+    from validation_program.validators.input_validator import InputValidator
+
+    validation_results = InputValidator().validate_all(packing_list_path, policy_file_path)
+    error_messages = []
+    for check_name, result in validation_results.items():
+        if not result["success"]:
+            error_messages.append(f"{check_name}: {result['message']}")
+    return not error_messages, error_messages
+
+
+def run_service_job(job, packing_list_paths, policy_file_path, output_dir, options, result_cache=None, cache_key=None):
+    """在工作线程中执行的处理任务
+
+    Args:
+        job: InvoiceJob，用于报告阶段进度
+        packing_list_paths: 装箱单文件路径列表(多个时合并处理)
+        policy_file_path: 政策文件路径
+        output_dir: 本任务的输出目录
+        options: {'xml_merge': bool, 'supplier_breakdown': bool, 'deterministic_numbers': bool}
+        result_cache: 处理成功后保存结果的ResultCache，为None时不缓存
+        cache_key: 结果的缓存键
+
+    Returns:
+        dict: validation_passed、error_messages、output_dir、export_files、file_hashes和bundle_path
+    """
+    from process_shipping_list import process_shipping_list
+
+    job.set_stage('ingest')
+
+    error_messages = []
+    for path in packing_list_paths:
+        _, messages = validate_input_files(path, policy_file_path)
+        error_messages.extend(messages)
+    if error_messages:
+        return {"validation_passed": False, "error_messages": error_messages}
+
+    packing_list = packing_list_paths[0] if len(packing_list_paths) == 1 else packing_list_paths
+    # 模板文件只读取，每个任务写入自己的输出目录，多个工作线程可以同时处理
+    process_shipping_list(packing_list, policy_file_path, output_dir, progress_callback=job.set_stage,
+                          xml_merge=options['xml_merge'], supplier_breakdown=options['supplier_breakdown'],
+                          invoice_numbering='deterministic' if options['deterministic_numbers'] else 'counter',
+                          in_process_merge=True)
+
+    export_files = sorted(f for f in os.listdir(output_dir) if f.endswith('.xlsx'))
+    file_paths = [os.path.join(output_dir, f) for f in export_files]
+    bundle_path = None
+    if file_paths:
+        bundle_path = build_zip_bundle(file_paths, os.path.join(os.path.dirname(output_dir), BUNDLE_NAME))
+
+    result = {
+        "validation_passed": True,
+        "error_messages": [],
+        "output_dir": output_dir,
+        "export_files": export_files,
+        "file_hashes": {f: file_sha256(path) for f, path in zip(export_files, file_paths)},
+        "bundle_path": bundle_path,
+    }
+    if result_cache is not None and export_files:
+        result = result_cache.commit(cache_key, os.path.dirname(output_dir), result)
+    return result
+
+
+def cached_job(job, result):
+    """命中结果缓存时直接返回之前的结果"""
+    print(f"任务 {job.job_id}: 命中结果缓存")
+    return result
+
+
+def parse_multipart(content_type, body):
+    """解析multipart/form-data请求体
+
+    Returns:
+        tuple: ({字段: [文本值]}, {字段: [文件内容]})
+    """
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        b'Content-Type: ' + content_type.encode('latin-1') + b'\r\n\r\n' + body)
+    if not message.is_multipart():
+        raise ValueError("请求体不是multipart/form-data")
+
+    fields, files = {}, {}
+    for part in message.iter_parts():
+        name = part.get_param('name', header='content-disposition')
+        if not name:
+            continue
+        payload = part.get_payload(decode=True) or b''
+        if part.get_filename() is not None:
+            files.setdefault(name, []).append(payload)
+        else:
+            fields.setdefault(name, []).append(payload.decode('utf-8').strip())
+    return fields, files
+
+
+class InvoiceService:
+    """服务状态: 任务池、结果缓存和预热信息，所有请求共享"""
+
+    def __init__(self, cache_dir, workers=2):
+        self.warm = warm_up()
+        from process_shipping_list import PROCESS_STAGES
+        self.started_at = time.time()
+        self.job_manager = JobManager(stages=PROCESS_STAGES, max_workers=workers)
+        self.result_cache = ResultCache(cache_dir)
+        self.result_cache.evict()
+
+    def submit(self, packing_lists, policy, options):
+        """保存上传内容并提交任务
+
+        Args:
+            packing_lists: 装箱单文件内容列表
+            policy: 政策文件内容
+            options: 处理选项
+
+        Returns:
+            str: 任务ID
+        """
+        uploads = [self.result_cache.store_upload(data) for data in packing_lists]
+        policy_hash, policy_path = self.result_cache.store_upload(policy)
+
+        packing_list_key = uploads[0][0] if len(uploads) == 1 else hashlib.sha256(
+            '+'.join(content_hash for content_hash, _ in uploads).encode('ascii')).hexdigest()
+        cache_key = self.result_cache.key(packing_list_key, policy_hash)
+        if options['supplier_breakdown']:
+            cache_key += '_breakdown'
+        if options['deterministic_numbers']:
+            cache_key += '_deterministic'
+
+        cached_result = self.result_cache.lookup(cache_key)
+        if cached_result is not None:
+            return self.job_manager.submit(cached_job, cached_result)
+
+        # 每个任务使用独立的目录，避免前后任务互相覆盖
+        job_dir = self.result_cache.new_job_dir(cache_key, [path for _, path in uploads] + [policy_path])
+        output_dir = os.path.join(job_dir, 'outputs')
+        os.makedirs(output_dir, exist_ok=True)
+        return self.job_manager.submit(run_service_job, [path for _, path in uploads], policy_path,
+                                       output_dir, options, self.result_cache, cache_key)
+
+    def job_status(self, job):
+        """任务状态(JSON)"""
+        status = {
+            "job_id": job.job_id,
+            "status": job.status,
+            "stage": job.stage,
+            "progress": job.progress,
+            "error": job.error,
+            "created_at": job.created_at,
+            "finished_at": job.finished_at,
+        }
+        if job.status == 'done':
+            status["validation_passed"] = job.result["validation_passed"]
+            status["error_messages"] = job.result["error_messages"]
+            status["artifacts"] = self.artifacts(job)
+        return status
+
+    @staticmethod
+    def artifacts(job):
+        """已完成任务的输出文件: {文件名: 路径}"""
+        if job.status != 'done' or not job.result.get("validation_passed"):
+            return {}
+        files = {name: os.path.join(job.result["output_dir"], name) for name in job.result["export_files"]}
+        if job.result.get("bundle_path"):
+            files[BUNDLE_NAME] = job.result["bundle_path"]
+        return files
+
+
+class InvoiceRequestHandler(BaseHTTPRequestHandler):
+    """按路径分发请求，InvoiceService实例保存在server.service上"""
+
+    server_version = 'InvoiceService/1.0'
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def log_message(self, format, *args):
+        print(f"{self.address_string()} - {format % args}")
+
+    def send_json(self, payload, status=HTTPStatus.OK):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, message):
+        self.send_json({"success": False, "message": message}, status)
+
+    def send_file(self, path, name):
+        content_type = 'application/zip' if name.endswith('.zip') else \
+            'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(os.path.getsize(path)))
+        self.send_header('Content-Disposition', f'attachment; filename="{name}"')
+        self.end_headers()
+        with open(path, 'rb') as f:
+            shutil.copyfileobj(f, self.wfile)
+
+    def do_GET(self):
+        parts = [unquote(part) for part in urlparse(self.path).path.strip('/').split('/') if part]
+
+        if parts == ['health']:
+            self.send_json({
+                "success": True,
+                "message": "ok",
+                "uptime": time.time() - self.service.started_at,
+                "warm_up": self.service.warm,
+                "pending_jobs": self.service.job_manager.pending_count(),
+            })
+            return
+        if parts == ['jobs']:
+            self.send_json({"success": True, "jobs": [self.service.job_status(job)
+                                                       for job in self.service.job_manager.jobs()]})
+            return
+        if len(parts) < 2 or parts[0] != 'jobs':
+            self.send_error_json(HTTPStatus.NOT_FOUND, f"未知路径: {self.path}")
+            return
+
+        job = self.service.job_manager.get(parts[1])
+        if job is None:
+            self.send_error_json(HTTPStatus.NOT_FOUND, f"任务不存在: {parts[1]}")
+        elif len(parts) == 2:
+            self.send_json(dict(success=True, **self.service.job_status(job)))
+        elif parts[2:] == ['profile']:
+            self.send_json({"success": True, "job_id": job.job_id, "status": job.status, "profile": job.profile()})
+        elif parts[2:] == ['artifacts']:
+            self.send_json({"success": True, "job_id": job.job_id, "artifacts": sorted(self.service.artifacts(job))})
+        elif len(parts) == 4 and parts[2] == 'artifacts':
+            path = self.service.artifacts(job).get(parts[3])
+            if path is None or not os.path.exists(path):
+                self.send_error_json(HTTPStatus.NOT_FOUND, f"输出文件不存在: {parts[3]}")
+            else:
+                self.send_file(path, parts[3])
+        else:
+            self.send_error_json(HTTPStatus.NOT_FOUND, f"未知路径: {self.path}")
+
+    def do_POST(self):
+        if urlparse(self.path).path.rstrip('/') != '/jobs':
+            self.send_error_json(HTTPStatus.NOT_FOUND, f"未知路径: {self.path}")
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        if length <= 0 or length > MAX_UPLOAD_BYTES:
+            self.send_error_json(HTTPStatus.BAD_REQUEST, f"请求体大小无效: {length}")
+            return
+        try:
+            fields, files = parse_multipart(self.headers.get('Content-Type', ''), self.rfile.read(length))
+        except Exception as e:
+            self.send_error_json(HTTPStatus.BAD_REQUEST, f"无法解析上传内容: {e}")
+            return
+
+        if not files.get('packing_list') or len(files.get('policy', [])) != 1:
+            self.send_error_json(HTTPStatus.BAD_REQUEST, "需要上传至少一个packing_list和一个policy文件")
+            return
+        options = {name: (fields.get(name) or [''])[0].lower() in TRUE_VALUES
+                   for name in ('xml_merge', 'supplier_breakdown', 'deterministic_numbers')}
+
+        job_id = self.service.submit(files['packing_list'], files['policy'][0], options)
+        self.send_json({"success": True, "message": "任务已提交", "job_id": job_id}, HTTPStatus.ACCEPTED)
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description='本地常驻发票处理服务')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址 (默认: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='端口 (默认: 8765)')
+    parser.add_argument('--workers', type=int, default=2, help='工作线程数 (默认: 2)')
+    parser.add_argument('--cache-dir', default=os.path.join(tempfile.gettempdir(), 'export_reimport_service'),
+                        help='上传文件和处理结果的缓存目录')
+    return parser
+
+
+def main():
+    args = build_arg_parser().parse_args()
+    cache_dir = os.path.abspath(args.cache_dir)
+
+    # 模板按相对路径查找和修改，与命令行一样在程序目录中运行
+    os.chdir(SCRIPT_DIR)
+    if SCRIPT_DIR not in sys.path:
+        sys.path.insert(0, SCRIPT_DIR)
+
+    server = ThreadingHTTPServer((args.host, args.port), InvoiceRequestHandler)
+    server.service = InvoiceService(cache_dir, workers=args.workers)
+    print(f"发票处理服务已启动: http://{args.host}:{server.server_address[1]} (缓存目录: {cache_dir})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("服务已停止")
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,9 @@ import openpyxl
 import copy
 import os
 import sys
+from openpyxl.workbook.defined_name import DefinedName
+from shipping_processor.merge.templates import load_template, append_compiled_sheet
+from shipping_processor.merge.splice import LAYOUT_NAME_PREFIX, TOTAL_ROW_MARKERS, splice_three_excel_files
 
 def copy_cell_formatting(source_cell, target_cell):
     """Helper function to copy cell formatting."""
@@ -94,6 +97,52 @@ def apply_column_widths(sheet, column_widths, default_widths=None):
         else:
             sheet.column_dimensions[col_letter].width = default_widths['default']
 
+def find_total_row(sheet):
+    """Return the 1-based index of the summary (Total) row in a content sheet, or None."""
+    for row_idx, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), 2):
+        if any(isinstance(value, str) and value.strip() in TOTAL_ROW_MARKERS for value in row):
+            return row_idx
+    return None
+
+def set_layout_name(workbook, name, sheet_title, min_col, min_row, max_col, max_row):
+    """Create or replace a workbook-level defined name pointing at a cell range."""
+    quoted_title = sheet_title.replace("'", "''")
+    ref = (f"'{quoted_title}'!${openpyxl.utils.get_column_letter(min_col)}${min_row}:"
+           f"${openpyxl.utils.get_column_letter(max_col)}${max_row}")
+    defined_name = DefinedName(name, attr_text=ref)
+    if isinstance(workbook.defined_names, dict):
+        # openpyxl >= 3.1
+        workbook.defined_names[name] = defined_name
+    else:
+        workbook.defined_names.append(defined_name)
+
+def write_sheet_layout(workbook, sheet_index, target_sheet, content_sheet, header_rows, footer_rows):
+    """
+    Record where the table of a merged sheet lives as workbook-level defined names:
+    - LAYOUT_<n>_HEADER: column header row (first row of the content sheet)
+    - LAYOUT_<n>_DATA:   data rows between the column header and the Total row
+    - LAYOUT_<n>_TOTAL:  the Total row, if the content sheet has one
+    - LAYOUT_<n>_FOOTER: rows appended from the footer template
+    The validation program reads the data ranges through these names instead of
+    probing for the header row (the prefix is shared with splice.py).
+    """
+    max_col = max(content_sheet.max_column, 1)
+    header_row = header_rows + 1
+    content_total_row = find_total_row(content_sheet)
+    data_last_row = header_rows + (content_total_row - 1 if content_total_row else content_sheet.max_row)
+    prefix = f"{LAYOUT_NAME_PREFIX}{sheet_index}_"
+
+    set_layout_name(workbook, prefix + 'HEADER', target_sheet.title, 1, header_row, max_col, header_row)
+    if data_last_row > header_row:
+        set_layout_name(workbook, prefix + 'DATA', target_sheet.title, 1, header_row + 1, max_col, data_last_row)
+    if content_total_row:
+        total_row = header_rows + content_total_row
+        set_layout_name(workbook, prefix + 'TOTAL', target_sheet.title, 1, total_row, max_col, total_row)
+    if footer_rows:
+        footer_first_row = header_rows + content_sheet.max_row + 1
+        set_layout_name(workbook, prefix + 'FOOTER', target_sheet.title, 1, footer_first_row,
+                        max_col, footer_first_row + footer_rows - 1)
+
 def load_workbook_safely(file_path):
     """Load workbook with error handling."""
     try:
@@ -102,7 +151,16 @@ def load_workbook_safely(file_path):
         print(f"Error opening file {file_path}: {e}")
         return None
 
-def merge_three_excel_files(first_file, middle_file, last_file, output_file, first_sheet_first_file=None, first_sheet_last_file=None):
+def load_template_safely(file_path, sheet=None):
+    """Load a compiled header/footer template sheet (recompiled from the xlsx when it changed)."""
+    try:
+        return load_template(file_path, sheet)
+    except Exception as e:
+        print(f"Error opening template {file_path}: {e}")
+        return None
+
+def merge_three_excel_files(first_file, middle_file, last_file, output_file, first_sheet_first_file=None, first_sheet_last_file=None,
+                            values=None):
     """
     Merge Excel files with specific requirements:
     - First file used for headers (h.xlsx)
@@ -112,6 +170,8 @@ def merge_three_excel_files(first_file, middle_file, last_file, output_file, fir
 
     If first_sheet_first_file and first_sheet_last_file are provided, they will be used
     to merge with the first sheet (Packing List) of the middle file.
+
+    values: {占位名称: 值}(公司名称/地址)，写入表头模板的占位单元格，模板文件本身不修改
     """
     print(f"Merging files: {first_file}, {middle_file}, {last_file}")
 
@@ -148,33 +208,40 @@ def merge_three_excel_files(first_file, middle_file, last_file, output_file, fir
     if first_sheet_first_file and first_sheet_last_file:
         print(f"Merging {pl_sheet_name} with: {first_sheet_first_file}, {middle_file}, {first_sheet_last_file}")
 
-        # Prepare data for merging Packing List
-        pl_files_to_merge = [
-            (first_sheet_first_file, lambda wb: wb.active),
-            (middle_file, lambda wb: wb[wb.sheetnames[0]]),
-            (first_sheet_last_file, lambda wb: wb.active)
-        ]
+        # Merge Packing List sheets vertically: pl_h.xlsx / pl_f.xlsx come from compiled templates
+        pl_h_template = load_template_safely(first_sheet_first_file)
+        pl_f_template = load_template_safely(first_sheet_last_file)
+        if not pl_h_template or not pl_f_template:
+            return False
 
-        # Merge Packing List sheets vertically
         pl_row_offset = 0
-        for file_path, sheet_selector in pl_files_to_merge:
-            wb = load_workbook_safely(file_path)
-            if not wb:
-                return False
-
-            sheet = sheet_selector(wb)
-            print(f"Processing {pl_sheet_name}: {file_path}")
-            pl_row_offset += append_sheet_with_offset(sheet, packing_list_sheet, pl_row_offset, file_path)
+        pl_part_rows = []
+        print(f"Processing {pl_sheet_name}: {first_sheet_first_file}")
+        appended_rows = append_compiled_sheet(pl_h_template, packing_list_sheet, pl_row_offset, values)
+        pl_row_offset += appended_rows
+        pl_part_rows.append(appended_rows)
+
+        print(f"Processing {pl_sheet_name}: {middle_file}")
+        appended_rows = append_sheet_with_offset(middle_pl_sheet, packing_list_sheet, pl_row_offset, middle_file)
+        pl_row_offset += appended_rows
+        pl_part_rows.append(appended_rows)
+
+        print(f"Processing {pl_sheet_name}: {first_sheet_last_file}")
+        appended_rows = append_compiled_sheet(pl_f_template, packing_list_sheet, pl_row_offset)
+        pl_row_offset += appended_rows
+        pl_part_rows.append(appended_rows)
 
         # Apply column widths to Packing List
         apply_column_widths(packing_list_sheet, pl_column_widths)
+        write_sheet_layout(merged_wb, 0, packing_list_sheet, middle_pl_sheet, pl_part_rows[0], pl_part_rows[2])
     else:
         # If no first sheet files provided, just copy the first sheet from middle file
         print(f"Copying first sheet from {middle_file}")
         copy_sheet(middle_wb[pl_sheet_name], packing_list_sheet)
+        write_sheet_layout(merged_wb, 0, packing_list_sheet, middle_pl_sheet, 0, 0)
 
     # Process each invoice sheet
-    for invoice_sheet_name in invoice_sheet_names:
+    for invoice_index, invoice_sheet_name in enumerate(invoice_sheet_names, 1):
         print(f"\nProcessing invoice sheet: {invoice_sheet_name}")
         
         # Create new sheet for this invoice
@@ -188,29 +255,24 @@ def merge_three_excel_files(first_file, middle_file, last_file, output_file, fir
             if cell.value and col_letter in middle_invoice_sheet.column_dimensions:
                 invoice_column_widths[cell.value] = middle_invoice_sheet.column_dimensions[col_letter].width
 
-        # Load first file (h.xlsx) and get its second sheet for header
-        first_wb = load_workbook_safely(first_file)
-        if not first_wb or len(first_wb.sheetnames) < 2:
+        # Header: second sheet of h.xlsx; footer: active sheet of f.xlsx (compiled templates)
+        h_invoice_sheet = load_template_safely(first_file, 1)
+        if not h_invoice_sheet:
             print(f"Error: First file (h.xlsx) must have at least 2 sheets")
             return False
 
-        # Get the second sheet from h.xlsx
-        h_invoice_sheet = first_wb[first_wb.sheetnames[1]]
-        
-        # Load last file (f.xlsx) for footer
-        last_wb = load_workbook_safely(last_file)
-        if not last_wb:
+        f_invoice_sheet = load_template_safely(last_file)
+        if not f_invoice_sheet:
             print(f"Error: Could not load last file (f.xlsx)")
             return False
-            
-        f_invoice_sheet = last_wb.active
 
         # Merge sheets vertically for this invoice
         row_offset = 0
         
         # Add header from h.xlsx (second sheet)
         print(f"Adding header from {first_file} (second sheet)")
-        row_offset += append_sheet_with_offset(h_invoice_sheet, invoice_sheet, row_offset, first_file)
+        header_rows = append_compiled_sheet(h_invoice_sheet, invoice_sheet, row_offset, values)
+        row_offset += header_rows
         
         # Add content from middle file
         print(f"Adding content from {middle_file} ({invoice_sheet_name})")
@@ -218,10 +280,12 @@ def merge_three_excel_files(first_file, middle_file, last_file, output_file, fir
         
         # Add footer from f.xlsx
         print(f"Adding footer from {last_file}")
-        row_offset += append_sheet_with_offset(f_invoice_sheet, invoice_sheet, row_offset, last_file)
+        footer_rows = append_compiled_sheet(f_invoice_sheet, invoice_sheet, row_offset)
+        row_offset += footer_rows
         
         # Apply column widths to this invoice sheet
         apply_column_widths(invoice_sheet, invoice_column_widths)
+        write_sheet_layout(merged_wb, invoice_index, invoice_sheet, middle_invoice_sheet, header_rows, footer_rows)
 
     # Save result
     try:
@@ -237,32 +301,62 @@ def merge_three_excel_files(first_file, middle_file, last_file, output_file, fir
         print(f"Error saving output file {output_file}: {e}")
         return False
 
-if __name__ == "__main__":
-    if len(sys.argv) < 5:
-        print("Usage: python merge.py <first_file.xlsx> <middle_file.xlsx> <last_file.xlsx> <output_file.xlsx> [first_sheet_first_file.xlsx] [first_sheet_last_file.xlsx]")
-        # Return error code but don't exit the process
-        sys.exit(1)
+def main(argv):
+    """命令行入口，也可以在已加载模板的进程中直接调用，省去启动解释器和重新导入的开销
+
+    Args:
+        argv: 命令行参数(不含程序名):
+            [--xml] [--company-name 名称] [--company-address 地址] first middle last output [pl_first] [pl_last]
+
+    Returns:
+        int: 退出码，0表示成功
+    """
+    argv = list(argv)
+    # --xml: 在XML层面拼接工作表(shipping_processor.merge.splice)，不创建openpyxl单元格对象
+    use_xml_splice = '--xml' in argv
+    if use_xml_splice:
+        argv.remove('--xml')
+
+    # --company-name/--company-address: 政策文件中的公司信息，合并时写入表头模板的占位单元格
+    values = {}
+    for option, name in (('--company-name', 'company_name'), ('--company-address', 'company_address')):
+        if option in argv:
+            index = argv.index(option)
+            if index + 1 >= len(argv):
+                print(f"Error: {option} requires a value")
+                return 1
+            values[name] = argv[index + 1]
+            del argv[index:index + 2]
+
+    if len(argv) < 4:
+        print("Usage: python merge.py [--xml] [--company-name <name>] [--company-address <address>] <first_file.xlsx> <middle_file.xlsx> <last_file.xlsx> <output_file.xlsx> [first_sheet_first_file.xlsx] [first_sheet_last_file.xlsx]")
+        return 1
 
     try:
-        files = [os.path.abspath(sys.argv[i]) for i in range(1, 5)]
+        files = [os.path.abspath(argv[i]) for i in range(4)]
 
         # Check if first sheet files are provided
-        first_sheet_first_file = os.path.abspath(sys.argv[5]) if len(sys.argv) > 5 else None
-        first_sheet_last_file = os.path.abspath(sys.argv[6]) if len(sys.argv) > 6 else None
+        first_sheet_first_file = os.path.abspath(argv[4]) if len(argv) > 4 else None
+        first_sheet_last_file = os.path.abspath(argv[5]) if len(argv) > 5 else None
 
-        success = merge_three_excel_files(
+        merge_function = splice_three_excel_files if use_xml_splice else merge_three_excel_files
+        success = merge_function(
             files[0], files[1], files[2], files[3],
-            first_sheet_first_file, first_sheet_last_file
+            first_sheet_first_file, first_sheet_last_file,
+            values=values
         )
 
         if not success:
             print("Merge operation failed!")
-            # Return error code
-            sys.exit(1)
+            return 1
     except Exception as e:
         print(f"Error during merge operation: {e}")
-        # Return error code
-        sys.exit(1)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
 
 # 在Windows系统下自动打开合并后的Excel文件
 # if os.name == 'nt':
@@ -1,7 +1,63 @@
+import argparse
+import sys
+
+
+def build_arg_parser():
+    """命令行参数定义(放在其他导入之前，只查看--help时不需要加载pandas和openpyxl)"""
+    parser = argparse.ArgumentParser(description='处理装运清单并生成出口和复进口发票')
+
+    parser.add_argument('--packing-list', type=str, nargs='+', default=['testfiles/original_packing_list.xlsx'],
+                      help='原始装箱单文件路径，同一政策文件下的多个装箱单可以一起列出合并处理 '
+                           '(默认: testfiles/original_packing_list.xlsx)')
+
+    parser.add_argument('--policy', type=str, default='testfiles/policy.xlsx',
+                      help='政策文件路径 (默认: testfiles/policy.xlsx)')
+
+    parser.add_argument('--output-dir', type=str, default='outputs',
+                      help='输出目录 (默认: outputs)')
+
+    parser.add_argument('--debug', action='store_true',
+                      help='启用调试模式，显示详细错误信息')
+
+    parser.add_argument('--validate-in-memory', action='store_true',
+                      help='在写出文件之前对内存数据运行验证检查')
+
+    parser.add_argument('--xml-merge', action='store_true',
+                      help='合并表头、数据和页脚时直接拼接工作表XML，不使用openpyxl逐个复制单元格')
+
+    parser.add_argument('--supplier-breakdown', action='store_true',
+                      help='另外输出按供应商(装箱单)汇总的supplier_breakdown.xlsx')
+
+    parser.add_argument('--intermediates', choices=['feather', 'parquet'],
+                      help='另外把带类型的中间数据写成Feather/Parquet文件和manifest.json (需要pyarrow)')
+
+    parser.add_argument('--invoice-lines', choices=['csv', 'jsonl'],
+                      help='为每张发票另外写出CSV或JSON Lines格式的发票行(供ERP导入)')
+
+    parser.add_argument('--invoice-numbering', choices=['counter', 'deterministic'], default='counter',
+                      help='发票号分配方式: counter为按日递增的计数器(并发安全)，'
+                           'deterministic由输入文件内容得到(重新运行号码不变) (默认: counter)')
+
+    parser.add_argument('--invoice-number-db', type=str,
+                      help='发票号计数器数据库路径 (默认: 项目目录中的invoice_numbers.db)')
+
+    parser.add_argument('--profile-deep', action='store_true',
+                      help='按处理阶段记录cProfile统计、调用栈采样和tracemalloc内存分配，写到<输出目录>/profile/ '
+                           '(合并步骤在进程内执行以便计入，处理会明显变慢)')
+
+    parser.add_argument('--no-xlsx', action='store_true',
+                      help='不生成xlsx文件，只输出发票行和中间数据 (与--invoice-lines或--intermediates一起使用)')
+
+    return parser
+
+
+# 只查看帮助时直接输出并退出，不加载下面的重量级模块
+if __name__ == "__main__" and any(arg in ('-h', '--help') for arg in sys.argv[1:]):
+    build_arg_parser().parse_args()
+
 import pandas as pd
 import os
 import time
-import argparse
 from openpyxl import Workbook, load_workbook
 from openpyxl.styles import Alignment, Font, Border, Side, PatternFill, Color
 from openpyxl.utils import get_column_letter
@@ -11,11 +67,17 @@ import shutil
 import logging
 import datetime
 import re
-import sys
 import json
 import numpy as np
 from openpyxl.styles.numbers import FORMAT_NUMBER_COMMA_SEPARATED1, FORMAT_NUMBER_00
 import glob # Added for file pattern matching
+import contextlib
+# 重量列的容错转换与验证程序共用
+from shipping_processor.input.weights import normalize_weight_values
+from shipping_processor.input.consolidate import read_packing_lists
+from shipping_processor.model.rules import load_classification_rules
+from shipping_processor.model.aggregation import aggregate_invoice_rows
+from shipping_processor.invoice.document import InvoiceDocument
 
 # Make sure outputs directory exists
 if not os.path.exists('outputs'):
@@ -27,6 +89,9 @@ if not os.path.exists('outputs'):
         raise
 
 # Define constants
+# 处理阶段，progress_callback按此顺序收到阶段名称
+PROCESS_STAGES = ('ingest', 'price', 'export', 'reimport', 'merge')
+
 # Unit translation dictionary for converting Chinese units to English
 UNIT_TRANSLATION = {
     "个": "PCS",
@@ -151,28 +216,7 @@ def read_excel_file(file_path, skip=0):
 
         print(f"Simplified column names: {df.columns.tolist()[:5]}...")
 
-        # Filter out the Chinese header translation row if it appears as the first data row
-        if len(df) > 0:
-            # Check if the first row contains Chinese header translations
-            first_row = df.iloc[0]
-
-            # Check for common Chinese header terms in the first row
-            chinese_header_terms = ['料号', '进口清关货描', '型号', '总件数', '总体积', '箱号']
-            matching_terms = 0
-
-            for _, value in first_row.items():
-                if isinstance(value, str):
-                    for term in chinese_header_terms:
-                        if term in value:
-                            matching_terms += 1
-                            break
-
-            # If we found multiple Chinese header terms in the first row, it's likely a header translation row
-            if matching_terms >= 2:
-                print(f"Detected Chinese header translation row as first data row in read_excel_file. Removing this row.")
-                df = df.iloc[1:].reset_index(drop=True)
-                print(f"After removing header translation row, data now has {len(df)} rows")
-
+        # 表头翻译行、合计行等由读取后的normalize_packing_list统一去掉
         return df
 
     except Exception as e:
@@ -306,6 +350,28 @@ def merge_packing_list_cells(workbook_path):
         print(f"Error merging cells in Packing List: {e}")
         return False
 
+def pl_footer_lines(totals):
+    """根据装箱单合计生成页脚文字(包裹数、净重、毛重、总体积、原产国)
+
+    Args:
+        totals: InvoiceDocument.set_total返回的合计
+
+    Returns:
+        list: 页脚文字，每项一行
+    """
+    total_packages = int(totals.get('Total Carton Quantity', 0))
+    total_net_weight = totals.get('Total Net Weight (kg)', 0)
+    total_gross_weight = totals.get('Total Gross Weight (kg)', 0)
+    total_volume = totals.get('Total Volume (CBM)', 0)
+    return [
+        f'PACKED IN {total_packages} PACKAGES ONLY.',
+        f'NET WEIGHT: {total_net_weight:.2f} KGS',
+        f'GROSS WEIGHT: {total_gross_weight:.2f} KGS',
+        f'TOTAL MEASUREMENT:{total_volume:.2f} CBM',
+        'COUNTRY OF ORIGIN: CHINA',
+    ]
+
+
 def apply_pl_footer_styling(workbook_path):
     """为PL页脚应用样式，包括合并单元格和加粗文本。"""
     try:
@@ -539,30 +605,6 @@ def merge_india_invoice_rows(df):
     print(f"原始数据列名: {result_df.columns.tolist()}")
     print(f"原始数据前3行: {result_df.head(3)}")
 
-    # Filter out the Chinese header translation row that appears as the first data row
-    # This row typically contains translations of column headers and should not be treated as data
-    if len(result_df) > 0:
-        # Check if the first row contains Chinese header translations
-        first_row = result_df.iloc[0]
-        is_header_translation = False
-
-        # Check for common Chinese header terms in the first row
-        chinese_header_terms = ['料号', '进口清关货描', '型号', '总件数', '总体积', '箱号']
-        matching_terms = 0
-
-        for _, value in first_row.items():
-            if isinstance(value, str):
-                for term in chinese_header_terms:
-                    if term in value:
-                        matching_terms += 1
-                        break
-
-        # If we found multiple Chinese header terms in the first row, it's likely a header translation row
-        if matching_terms >= 2:
-            print(f"Detected Chinese header translation row as first data row. Removing this row.")
-            result_df = result_df.iloc[1:].reset_index(drop=True)
-            print(f"After removing header translation row, data now has {len(result_df)} rows")
-
     # Convert numeric columns to appropriate types
     numeric_cols = ['Quantity', 'Unit Price (CIF, USD)', 'Total Amount (CIF, USD)', 'Total Net Weight (kg)']
     for col in numeric_cols:
@@ -584,11 +626,6 @@ def merge_india_invoice_rows(df):
         print("警告: Unit Price (CIF, USD)列不存在，无法进行合并")
         return result_df
 
-    # 打印合并前的唯一Part Number和Unit Price组合
-    unique_combinations = result_df.groupby(['Part Number', 'Unit Price (CIF, USD)']).size().reset_index(name='count')
-    print(f"合并前的唯一Part Number和Unit Price组合数量: {len(unique_combinations)}")
-    print(f"前5个组合: {unique_combinations.head(5)}")
-
     # Group by Part Number and Unit Price only, then aggregate
     try:
         # 确保所有必要的列都存在于结果DataFrame中
@@ -606,25 +643,15 @@ def merge_india_invoice_rows(df):
                 else:
                     result_df[col] = 0
 
-        # 使用groupby合并相同Part Number和Unit Price的行
-        agg_dict = {
-            'Quantity': 'sum',
-            'Total Amount (CIF, USD)': 'sum',
-            'Total Net Weight (kg)': 'sum',
-            # Keep the first occurrence of other fields
-            'Commodity Description (Customs)': 'first',
-            'Unit': 'first'
-        }
-
-        # 只对agg_dict中存在于DataFrame的列进行聚合
-        valid_agg_dict = {k: v for k, v in agg_dict.items() if k in result_df.columns}
-
-        # 对Unit Price (CIF, USD)进行四舍五入到小数点后4位，以确保相同价格的行能够正确合并
-        if 'Unit Price (CIF, USD)' in result_df.columns:
-            result_df['Unit Price (CIF, USD)'] = result_df['Unit Price (CIF, USD)'].round(4)
-            print("Rounded Unit Price (CIF, USD) to 4 decimal places for merging")
-
-        grouped = result_df.groupby(['Part Number', 'Unit Price (CIF, USD)']).agg(valid_agg_dict).reset_index()
+        # 按(Part Number, 量化到0.0001的Unit Price)合并，数量、金额和净重求和，其他字段保留第一个值
+        # 结果按Part Number和单价排序
+        grouped = aggregate_invoice_rows(
+            result_df,
+            sum_cols=['Quantity', 'Total Amount (CIF, USD)', 'Total Net Weight (kg)'],
+            first_cols=['Commodity Description (Customs)', 'Unit'],
+            sort=True,
+        )
+        print(f"合并后的唯一Part Number和Unit Price组合数量: {len(grouped)}")
 
         # 重新计算Total Amount以确保准确性
         if 'Quantity' in grouped.columns and 'Unit Price (CIF, USD)' in grouped.columns:
@@ -756,43 +783,19 @@ def print_column_mappings(mappings):
     expected_count = len(expected_columns)
     print(f"\nFound {found_count} out of {expected_count} expected column mappings ({100*found_count/expected_count:.1f}%)")
 
-def split_by_project_and_factory(df):
-    """Split the dataframe by project and factory."""
-    print("Available columns for splitting:", df.columns.tolist())
+def split_by_project_and_factory(df, include_empty=False):
+    """Split the dataframe by project and factory.
 
-    # 过滤掉表头行 - 检查第一行是否包含列名或中文字段名
-    if len(df) > 0:
-        first_row = df.iloc[0]
-        is_header_row = False
-
-        # 检查第一行是否是表头行（包含列名或中文字段名）
-        for col, val in first_row.items():
-            if isinstance(val, str) and (val in df.columns or '工厂地点' in val or '序号' in val or '料号' in val):
-                is_header_row = True
-                break
+    Args:
+        df: 装箱单数据
+        include_empty: 是否为没有数据的(项目, 工厂)组合补充空的DataFrame，默认不补充
 
-        if is_header_row:
-            print("检测到第一行是表头行，将其过滤掉")
-            df = df.iloc[1:].reset_index(drop=True)
-
-        # 检查是否有中文表头翻译行（通常包含多个中文表头术语）
-        first_row = df.iloc[0] if len(df) > 0 else None
-        if first_row is not None:
-            chinese_header_terms = ['料号', '进口清关货描', '型号', '总件数', '总体积', '箱号']
-            matching_terms = 0
-
-            for _, value in first_row.items():
-                if isinstance(value, str):
-                    for term in chinese_header_terms:
-                        if term in value:
-                            matching_terms += 1
-                            break
+    Returns:
+        tuple: ({(项目分类, 工厂): DataFrame}, 项目分类名称列表, 工厂列名)
+    """
+    print("Available columns for splitting:", df.columns.tolist())
 
-            # 如果找到多个中文表头术语，这可能是一个表头翻译行
-            if matching_terms >= 2:
-                print(f"在split_by_project_and_factory中检测到中文表头翻译行，将其过滤掉")
-                df = df.iloc[1:].reset_index(drop=True)
-                print(f"过滤后数据行数: {len(df)}")
+    # 表头翻译行已在读取装箱单时去掉(见normalize_packing_list)
 
     # 确保必要的列存在
     if 'project' not in df.columns:
@@ -823,8 +826,9 @@ def split_by_project_and_factory(df):
 
     # Clean up project and factory values
     # Convert NaN, None and empty strings to default values
-    df['project'] = df['project'].apply(lambda x: '大华' if pd.isna(x) or str(x).strip() == '' else str(x).strip())
-    df[factory_column] = df[factory_column].apply(lambda x: '默认工厂' if pd.isna(x) or str(x).strip() == '' else str(x).strip())
+    rules = load_classification_rules()
+    df['project'] = rules.fill_default(df['project'], 'project')
+    df[factory_column] = rules.fill_default(df[factory_column], 'factory')
 
     # Print detailed debug information about factory values
     print("\nDETAILED FACTORY VALUES DEBUG:")
@@ -833,73 +837,62 @@ def split_by_project_and_factory(df):
     print(f"Factory column value counts:")
     print(df[factory_column].value_counts())
 
-    # Print first 20 rows of factory column for inspection
-    print("\nFirst 20 rows of factory column:")
-    for i, val in enumerate(df[factory_column].head(20)):
-        print(f"  Row {i+1}: '{val}' (type: {type(val)})")
-
     # Ensure all values are properly converted to strings
-    df[factory_column] = df[factory_column].astype(str).apply(lambda x: x.strip())
-
-    print("\nAfter string conversion:")
-    print(f"Factory column data type: {df[factory_column].dtype}")
-    print(f"Factory column value counts:")
-    print(df[factory_column].value_counts())
+    df[factory_column] = df[factory_column].astype(str).str.strip()
 
     print("\nUnique project values:", df['project'].unique())
     print(f"Unique factory values from {factory_column}:", df[factory_column].unique())
 
-    # Define the project categories with more robust string handling
-    # 修改项目分类逻辑，使用包含关系而不是精确匹配
-    project_categories = {
-        '工厂': lambda x: 'special' not in str(x).strip().lower(),
-    }
-
-    # Get unique factories
-    factories = sorted(df[factory_column].unique())
-    if len(factories) == 0:
-        factories = ['默认工厂']
-        df[factory_column] = '默认工厂'
-        print("WARNING: 没有有效的工厂值，使用'默认工厂'")
+    # 项目分类由配置的project_category规则决定(包含关系而不是精确匹配)
+    # 分组键使用分类类型(categorical)，一次groupby得到每个(项目分类, 工厂)组合的行位置
+    project_categories = list(dict.fromkeys(rules.rule_sets['project_category'].values))
+    project_keys = pd.Categorical(rules.classify(df['project'], 'project_category'), categories=project_categories)
+    factory_keys = pd.Categorical(df[factory_column])
+    groups = df.groupby([project_keys, factory_keys], observed=True, sort=True).indices
 
     # Dictionary to store split dataframes
     split_dfs = {}
-
-    # Split by project and factory
-    for project_name, project_filter in project_categories.items():
-        try:
-            project_df = df[df['project'].apply(project_filter)]
-            print(f"Found {len(project_df)} rows for project {project_name}")
-
+    for (project_name, factory), positions in groups.items():
+        split_dfs[(project_name, factory)] = df.take(positions)
+        print(f"Found {len(positions)} rows for {project_name} - {factory}")
+
+    # 只有调用方需要时才补齐没有数据的项目和工厂组合
+    if include_empty:
+        factories = list(factory_keys.categories) or ['默认工厂']
+        for project in dict.fromkeys(project_categories + ['大华', '麦格米特']):
             for factory in factories:
-                key = (project_name, factory)
-                factory_df = project_df[project_df[factory_column] == factory]
-
-                split_dfs[key] = factory_df
-                print(f"Found {len(split_dfs[key])} rows for {project_name} - {factory}")
-        except Exception as e:
-            print(f"Error processing project {project_name}: {e}")
-            continue
-
-    # 如果有项目为'工厂'的数据集为空，确保仍添加一个空的DataFrame
-    for factory in factories:
-        key = ('工厂', factory)
-        if key not in split_dfs:
-            split_dfs[key] = pd.DataFrame(columns=df.columns)
-            print(f"Added empty DataFrame for 工厂 - {factory}")
-
-    # 检查是否所有项目和工厂的组合都有数据框
-    all_projects = ['大华', '麦格米特', '工厂']
-    for project in all_projects:
-        for factory in factories:
-            key = (project, factory)
-            if key not in split_dfs:
-                split_dfs[key] = pd.DataFrame(columns=df.columns)
-                print(f"Added empty DataFrame for {project} - {factory}")
+                key = (project, factory)
+                if key not in split_dfs:
+                    split_dfs[key] = df.iloc[0:0]
+                    print(f"Added empty DataFrame for {project} - {factory}")
 
     return split_dfs, project_categories, factory_column
 
 # Function to find a file in multiple locations
+def run_merge_command(merge_cmd, check=False, in_process=False):
+    """运行merge.py合并命令
+
+    Args:
+        merge_cmd: [python, merge.py, 参数...]
+        check: 返回码不为0时抛出subprocess.CalledProcessError
+        in_process: 在当前进程中调用merge.main，不启动新的解释器，
+            常驻服务中可以复用已导入的模块和已加载的编译模板(输出直接打印，不再捕获)
+
+    Returns:
+        subprocess.CompletedProcess: 返回码和捕获的输出
+    """
+    import subprocess
+
+    if not in_process:
+        return subprocess.run(merge_cmd, check=check, capture_output=True, text=True)
+
+    import merge
+    returncode = merge.main(merge_cmd[2:])
+    if check and returncode != 0:
+        raise subprocess.CalledProcessError(returncode, merge_cmd)
+    return subprocess.CompletedProcess(merge_cmd, returncode, stdout='', stderr='')
+
+
 def find_file(filename, output_dir='outputs'):
     """
     Find a file in multiple locations: current directory, output directory, or script directory.
@@ -928,30 +921,6 @@ def find_file(filename, output_dir='outputs'):
 
     return None  # File not found
 
-# Function to generate valid invoice sheet name
-def generate_invoice_sheet_name(prefix="CXCI"):
-    """Generate a valid invoice sheet name in the format XXXX20230101####"""
-    import datetime
-    today = datetime.datetime.now()
-    date_part = today.strftime("%Y%m%d")
-
-
-    import datetime
-
-# 获取当前时间
-    now = datetime.datetime.now()
-    # 获取当天 0 点的时间
-    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    # 计算当前时间与当天 0 点的时间差
-    delta = now - midnight
-    # 获取时间差的总秒数
-    seconds = delta.total_seconds()
-
-    serial = int((seconds / 86400) * 10000)
-
-    # Use a serial number starting with 0001
-    return f"{prefix}{date_part}{serial}"
-
 # Function to convert numbers to English words
 def num_to_words(num):
     """Convert a number to its English word representation."""
@@ -1004,48 +973,6 @@ def num_to_words(num):
 
     return result.strip()
 
-def modify_header_file(h_file_path, company_name, company_address):
-    """
-    Modify the header file (h.xlsx) with company information while preserving styles and merges.
-
-    Args:
-        h_file_path: Path to the h.xlsx file
-        company_name: Company name to replace A1
-        company_address: Company address to replace A2
-    """
-    try:
-        # Load the workbook
-        wb = load_workbook(h_file_path)
-        ws = wb.active
-
-        # Store the original merged cell ranges
-        merged_ranges = list(ws.merged_cells.ranges)
-
-        # Unmerge all cells temporarily
-        for merged_range in merged_ranges:
-            ws.unmerge_cells(str(merged_range))
-
-        # Update the values
-        ws['A1'] = company_name
-        ws['A2'] = company_address
-
-        # Reapply the merges
-        for merged_range in merged_ranges:
-            ws.merge_cells(str(merged_range))
-
-        # Ensure text alignment is preserved
-        for row in [1, 2]:
-            cell = ws.cell(row=row, column=1)
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-
-        # Save the modified file
-        wb.save(h_file_path)
-        print(f"Successfully updated header file with company information")
-        return True
-    except Exception as e:
-        print(f"Error modifying header file: {e}")
-        return False
-
 def read_policy_file(policy_file):
     """
     读取新格式的政策文件并提取所需参数
@@ -1096,10 +1023,145 @@ def read_policy_file(policy_file):
             print(f"无法读取政策文件内容: {e2}")
         raise
 
+class InMemoryValidation:
+    """在写出文件之前直接对内存中的DataFrame运行验证检查
+
+    复用validation_program中ProcessValidator和ImportInvoiceValidator的检查逻辑，
+    不需要先写出再重新读取Excel文件。检查结果只记录和打印，不会中断处理流程。
+    """
+
+    def __init__(self, packing_list_file, policy_file, consolidated=False):
+        # 延迟导入验证器，只有启用内存验证时才需要
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        if script_dir not in sys.path:
+            sys.path.append(script_dir)
+        from validation_program.validators.context import ValidationContext
+        from validation_program.validators.process_validator import ProcessValidator
+        from validation_program.validators.import_invoice_validator import ImportInvoiceValidator
+        from validation_program.validators.runner import run_checks
+
+        context = ValidationContext()
+        self.process_validator = ProcessValidator(context=context)
+        self.import_validator = ImportInvoiceValidator(context=context)
+        self.run_checks = run_checks
+        self.packing_list_file = packing_list_file
+        self.policy_file = policy_file
+        # 合并多个装箱单时，运保费按合并后的总净重分摊，与单个原始装箱单重新计算的结果不可比
+        self.consolidated = consolidated
+        self.results = {}
+
+    def _record(self, stage, results):
+        """记录并打印一个阶段的检查结果"""
+        print(f"\n内存验证 - {stage}:")
+        for key, result in results.items():
+            self.results[f"{stage}:{key}"] = result
+            status = "通过" if result.get("success") else "失败"
+            print(f"  [{status}] {key}: {result.get('message')}")
+
+    def check_cif_invoice(self, cif_df):
+        """FOB/保险/运费/CIF价格检查(合并处理时只检查不依赖原始装箱单的CIF价格)"""
+        checks = self.process_validator.get_in_memory_checks(self.packing_list_file, self.policy_file, cif_df)
+        if self.consolidated:
+            checks = [(key, check) for key, check in checks if key == "cif_price_calculation"]
+        self._record("cif_original_invoice", self.run_checks(checks))
+
+    def check_export_invoice(self, cif_df, export_df):
+        """CIF发票与合并后出口发票之间的合并逻辑检查"""
+        self._record("export_invoice", self.run_checks([
+            ("merge_logic", lambda: self.process_validator.validate_merge_logic(cif_df, export_df)),
+        ]))
+
+    def check_reimport_invoice(self, name, invoice_df):
+        """拆分后单张进口发票的合并、编号和求和检查"""
+        self._record(name, self.run_checks(self.import_validator.get_in_memory_checks(invoice_df)))
+
+    def failures(self):
+        """返回所有未通过的检查"""
+        return {key: result for key, result in self.results.items() if not result.get("success")}
+
+    def print_summary(self):
+        """打印内存验证汇总"""
+        failures = self.failures()
+        print(f"\n内存验证完成: {len(self.results)}项检查, {len(failures)}项未通过")
+        for key, result in failures.items():
+            print(f"  - {key}: {result.get('message')}")
+
 # Main function to process the shipping list
-def process_shipping_list(packing_list_file, policy_file, output_dir='outputs'):
+def process_shipping_list(packing_list_file, policy_file, output_dir='outputs', validate_in_memory=False,
+                          progress_callback=None, xml_merge=False, supplier_breakdown=False,
+                          in_process_merge=False, intermediates=None, invoice_lines=None, render_xlsx=True,
+                          invoice_numbering='counter', invoice_number_db=None):
+    # 启用时在每个文件写出之前对内存数据运行验证检查，结果保存在返回值的attrs['in_memory_validation']中
+    # xml_merge: merge.py在XML层面拼接表头/数据/页脚工作表(shipping_processor.merge.splice)，不创建openpyxl单元格对象
+    # packing_list_file可以是多个装箱单的列表(同一政策文件下的合并出运)，生成一套合并的出口和复进口发票
+    # supplier_breakdown: 另外输出按供应商汇总的supplier_breakdown.xlsx
+    # in_process_merge: 在当前进程中调用merge.main，不为每次合并启动新的解释器(常驻服务使用)
+    # intermediates: 'feather'或'parquet'时另外把带类型的中间DataFrame写到<output_dir>/intermediate/(需要pyarrow)
+    # invoice_lines: 'csv'或'jsonl'时为每张发票另外写出发票行到<output_dir>/invoice_lines/
+    # render_xlsx: 为False时只计算发票数据，不生成任何xlsx文件(不做模板合并和样式处理)
+    # invoice_numbering: 发票号分配方式，'counter'(SQLite计数器，invoice_number_db指定数据库)
+    #                    或'deterministic'(由输入文件内容哈希得到，重新运行号码不变)
+    if isinstance(packing_list_file, (list, tuple)):
+        packing_list_files = list(packing_list_file)
+    else:
+        packing_list_files = [packing_list_file]
+    consolidated = len(packing_list_files) > 1
+    in_memory_validation = (InMemoryValidation(packing_list_files[0], policy_file, consolidated=consolidated)
+                            if validate_in_memory else None)
+    # 可选阶段的模块只在用到时导入
+    intermediate_writer = None
+    if intermediates:
+        from shipping_processor.intermediate.columnar import IntermediateWriter
+        try:
+            intermediate_writer = IntermediateWriter(output_dir, intermediates)
+        except ImportError as e:
+            print(f"警告: {e}，本次不写出中间文件")
+    line_writer = None
+    if invoice_lines:
+        from shipping_processor.invoice.lines import InvoiceLineWriter
+        line_writer = InvoiceLineWriter(output_dir, invoice_lines)
+    from shipping_processor.invoice.numbering import number_source
+    invoice_numbers = number_source(invoice_numbering, packing_list_files + [policy_file],
+                                    db_path=invoice_number_db, job=os.path.abspath(output_dir))
+
+    # 每进入一个处理阶段(见PROCESS_STAGES)通知调用方，用于显示进度
+    def report_stage(stage):
+        if progress_callback:
+            progress_callback(stage)
+
+    # 返回值: result_df，attrs中附带内存验证结果和读取时去掉的行
+    def finish_result():
+        if in_memory_validation:
+            in_memory_validation.print_summary()
+            result_df.attrs['in_memory_validation'] = in_memory_validation.results
+
+        # 读取时去掉的行，供调用方查看
+        result_df.attrs['removed_rows'] = removed_rows
+
+        return result_df
+
+    report_stage('ingest')
+
     # Read the input files
-    packing_list_df = read_excel_file(packing_list_file, skip=2)
+    # 只在读取时清理一次: 去掉表头翻译行、合计/小计行和页脚行，后续阶段直接使用清理后的数据
+    # (行号为原装箱单中的Excel行号: 标题行、英文表头和中文表头之后)
+    # 多个装箱单时并发读取后合并，运保费按合并后的总净重分摊，packing_list_sources记录每行的供应商
+    packing_list_df, packing_list_sources, removed_rows = read_packing_lists(
+        packing_list_files, lambda path: read_excel_file(path, skip=2), row_offset=4)
+    if consolidated:
+        print(f"合并处理 {len(packing_list_files)} 个装箱单: 共 {len(packing_list_df)} 行")
+        for name, count in packing_list_sources.value_counts(sort=False).items():
+            print(f"  {name}: {count} 行")
+    dropped_rows = [item for item in removed_rows if item['kind'] != 'error']
+    if dropped_rows:
+        print(f"读取装箱单时去掉 {len(dropped_rows)} 行:")
+        for item in dropped_rows:
+            location = f"{item['file']} " if consolidated else ""
+            print(f"  {location}第{item['row']}行: {item['reason']}")
+    for item in removed_rows:
+        if item['kind'] == 'error':
+            location = f"{item['file']} " if consolidated else ""
+            print(f"错误: {location}第{item['row']}行{item['reason']}")
 
     # 使用新的政策文件读取函数
     try:
@@ -1122,55 +1184,8 @@ def process_shipping_list(packing_list_file, policy_file, output_dir='outputs'):
         print(f"处理政策文件时出错: {e}")
         raise
 
-    # Modify h.xlsx with company information
-    h_file = 'h.xlsx'
-    h_file_paths = [
-        h_file,  # Current directory
-        os.path.join(output_dir, h_file),  # Output directory
-        os.path.join(os.path.dirname(os.path.abspath(__file__)), h_file)  # Script directory
-    ]
-
-    h_file_found = False
-    for h_path in h_file_paths:
-        if os.path.exists(h_path):
-            print(f"Found h.xlsx at: {h_path}")
-            if modify_header_file(h_path, pc, pca):
-                h_file_found = True
-                break
-
-    if not h_file_found:
-        print("Warning: Could not find or modify h.xlsx")
-
-    # Update pl_h.xlsx with company information
-    pl_h_file = 'pl_h.xlsx'
-    try:
-        # Load the workbook
-        wb = load_workbook(pl_h_file)
-        ws = wb.active
-
-        # Store the original merged cell ranges
-        merged_ranges = list(ws.merged_cells.ranges)
-
-        # Unmerge cells temporarily
-        for merged_range in merged_ranges:
-            ws.unmerge_cells(str(merged_range))
-
-        # Update the values in B4 and B5 (shipper information)
-        ws['B4'] = pc  # Company name
-        ws['B5'] = pca  # Company address
-
-        ws['A1'] = pc  # Company name
-        ws['A2'] = pca  # Company address
-
-        # Reapply the merges
-        for merged_range in merged_ranges:
-            ws.merge_cells(str(merged_range))
-
-        # Save the modified file
-        wb.save(pl_h_file)
-        print(f"Successfully updated pl_h.xlsx with company information")
-    except Exception as e:
-        print(f"Error modifying pl_h.xlsx: {e}")
+    # 公司信息在合并时由merge.py写入h.xlsx/pl_h.xlsx的占位单元格(A1/A2，装箱单另有B4/B5)，模板文件本身不修改
+    template_value_args = ['--company-name', str(pc), '--company-address', str(pca)]
 
     # Print original column names for debugging
     print("Original packing list columns:")
@@ -1589,20 +1604,10 @@ def process_shipping_list(packing_list_file, policy_file, output_dir='outputs'):
         for col in packing_list_df.columns:
             print(f"  {col}")
 
-    # Apply trade type determination
-    def determine_trade_type(row_type):
-        if pd.isna(row_type):
-            return '一般贸易'  # Default to general trade if empty
-
-        row_type_str = str(row_type).strip().lower()
-        if '买单' in row_type_str:
-            return '买单贸易'
-        else:
-            return '一般贸易'
-
-    # Apply trade type determination to both DataFrames
-    result_df['Trade Type'] = result_df['Trade Type'].apply(determine_trade_type)
-    pl_result_df['Trade Type'] = pl_result_df['Trade Type'].apply(determine_trade_type)
+    # 贸易类型和发货人按配置的分类规则向量化求值(见shipping_processor/config/classification_rules.json)
+    rules = load_classification_rules()
+    for frame in (result_df, pl_result_df):
+        frame['Trade Type'] = rules.classify(frame['Trade Type'], 'trade_type')
 
     # Count items by trade type
     general_trade_count = (result_df['Trade Type'] == '一般贸易').sum()
@@ -1612,13 +1617,8 @@ def process_shipping_list(packing_list_file, policy_file, output_dir='outputs'):
     print(f"  买单贸易物料数量: {purchase_trade_count}")
 
     # Set Shipper information for both DataFrames
-    result_df['Shipper'] = result_df['Trade Type'].apply(
-        lambda x: '创想(创想-PCT)' if x == '一般贸易' else 'Unicair(UC-PCT)'
-    )
-
-    pl_result_df['Shipper'] = pl_result_df['Trade Type'].apply(
-        lambda x: '创想(创想-PCT)' if x == '一般贸易' else 'Unicair(UC-PCT)'
-    )
+    for frame in (result_df, pl_result_df):
+        frame['Shipper'] = rules.classify(frame['Trade Type'], 'shipper')
 
     # If Amount column is missing, set to None
     if 'Amount' not in result_df.columns:
@@ -1626,9 +1626,13 @@ def process_shipping_list(packing_list_file, policy_file, output_dir='outputs'):
 
     # Convert columns to numeric for calculations
     try:
+        # 重量列在内存中统一转换：空值、通配符(*、?、N/A等)和无法解析的值按0处理并记录原因
+        # (行号为原装箱单中的Excel行号: 标题行、英文表头和中文表头之后)
+        weight_log = []
         if net_weight_col:
-            result_df['net weight'] = pd.to_numeric(result_df['net weight'], errors='coerce')
-            result_df['Total Net Weight (kg)'] = pd.to_numeric(result_df['Total Net Weight (kg)'], errors='coerce')
+            result_df['net weight'], col_log = normalize_weight_values(result_df['net weight'], '净重', row_offset=4)
+            weight_log.extend(col_log)
+            result_df['Total Net Weight (kg)'] = result_df['net weight']
             print(f"Converted net weight to numeric. Example values: {result_df['net weight'].head()}")
         else:
             # If net weight column not found, set to default value
@@ -1642,21 +1646,24 @@ def process_shipping_list(packing_list_file, policy_file, output_dir='outputs'):
         # Also convert packing list numeric columns
         pl_result_df['Quantity'] = pd.to_numeric(pl_result_df['Quantity'], errors='coerce')
         if 'Total Gross Weight (kg)' in pl_result_df.columns:
-            pl_result_df['Total Gross Weight (kg)'] = pd.to_numeric(pl_result_df['Total Gross Weight (kg)'], errors='coerce')
+            pl_result_df['Total Gross Weight (kg)'], col_log = normalize_weight_values(
+                pl_result_df['Total Gross Weight (kg)'], '毛重', row_offset=4)
+            weight_log.extend(col_log)
         if 'Total Net Weight (kg)' in pl_result_df.columns:
-            pl_result_df['Total Net Weight (kg)'] = pd.to_numeric(pl_result_df['Total Net Weight (kg)'], errors='coerce')
-
-        # Fill NaN values with 0 for numerical calculations
-        result_df['net weight'] = result_df['net weight'].fillna(0)
-        result_df['Total Net Weight (kg)'] = result_df['Total Net Weight (kg)'].fillna(0)
+            pl_result_df['Total Net Weight (kg)'], col_log = normalize_weight_values(
+                pl_result_df['Total Net Weight (kg)'], '净重', row_offset=4)
+            # 与发票的净重列来自同一列，同一单元格只记录一次
+            weight_log.extend(message for message in col_log if message not in weight_log)
+        if weight_log:
+            print(f"重量列容错处理 {len(weight_log)} 处:")
+            for message in weight_log:
+                print(f"  {message}")
+
+        # Fill NaN values with 0 for numerical calculations (重量列已在上面转换)
         result_df['Qty'] = result_df['Qty'].fillna(0)
         result_df['Unit Price'] = result_df['Unit Price'].fillna(0)
 
         pl_result_df['Quantity'] = pl_result_df['Quantity'].fillna(0)
-        if 'Total Gross Weight (kg)' in pl_result_df.columns:
-            pl_result_df['Total Gross Weight (kg)'] = pl_result_df['Total Gross Weight (kg)'].fillna(0)
-        if 'Total Net Weight (kg)' in pl_result_df.columns:
-            pl_result_df['Total Net Weight (kg)'] = pl_result_df['Total Net Weight (kg)'].fillna(0)
 
         # Calculate total net weight
         net_weight = result_df['net weight']
@@ -1677,6 +1684,8 @@ def process_shipping_list(packing_list_file, policy_file, output_dir='outputs'):
         net_weight = pd.Series([0] * len(result_df))
         print(f"Using default values due to error")
 
+    report_stage('price')
+
     # Calculate total cost (采购总价) for each row and sum - 保持完整精度
     result_df['采购总价'] = result_df['Unit Price'] * result_df['Qty']
     total_amount = result_df['采购总价'].sum()
@@ -1697,14 +1706,8 @@ def process_shipping_list(packing_list_file, policy_file, output_dir='outputs'):
             result_df['net weight'] = pd.to_numeric(result_df['net weight'], errors='coerce')
             result_df['Total Net Weight (kg)'] = pd.to_numeric(result_df['Total Net Weight (kg)'], errors='coerce')
 
-            # 修改识别汇总行的逻辑
-            total_mask = ~(
-                (result_df['NO.'].isna() | (result_df['NO.'] == '')) &
-                (result_df['net weight'].notna())
-            )
-
-            # 计算总净重时只使用非汇总行 - 保持完整精度
-            net_weight = result_df[total_mask]['net weight']
+            # 汇总行已在读取时去掉，所有行都参与计算 - 保持完整精度
+            net_weight = result_df['net weight']
             total_net_weight = net_weight.sum()
 
         else:
@@ -1897,25 +1900,44 @@ def process_shipping_list(packing_list_file, policy_file, output_dir='outputs'):
     cif_file_path = os.path.join(output_dir, 'cif_original_invoice.xlsx')
     pl_file_path = os.path.join(output_dir, 'pl_original_invoice.xlsx')
 
-    # 保存CIF发票时不进行任何格式化或四舍五入
-    with pd.ExcelWriter(cif_file_path, engine='openpyxl') as writer:
-        cif_invoice.to_excel(writer, index=False)
+    if in_memory_validation:
+        in_memory_validation.check_cif_invoice(cif_invoice)
+
+    if supplier_breakdown:
+        from shipping_processor.invoice.breakdown import supplier_breakdown as build_supplier_breakdown
+        breakdown_path = os.path.join(output_dir, 'supplier_breakdown.xlsx')
+        breakdown_df = build_supplier_breakdown(result_df, packing_list_sources, exchange_rate)
+        breakdown_df.to_excel(breakdown_path, index=False)
+        print(f"按供应商汇总已保存到: {breakdown_path}")
+
+    if render_xlsx:
+        # 保存CIF发票时不进行任何格式化或四舍五入
+        with pd.ExcelWriter(cif_file_path, engine='openpyxl') as writer:
+            cif_invoice.to_excel(writer, index=False)
 
-        # 获取工作表
-        workbook = writer.book
-        worksheet = writer.sheets['Sheet1']
+            # 获取工作表
+            workbook = writer.book
+            worksheet = writer.sheets['Sheet1']
+
+            # 设置数值列的格式以显示完整精度
+            for col_idx, col_name in enumerate(cif_invoice.columns, 1):
+                if col_name in numeric_columns:
+                    # 使用自定义数字格式来显示所有有效数字
+                    col_letter = get_column_letter(col_idx)
+                    for row in range(2, len(cif_invoice) + 2):  # 从第2行开始（跳过表头）
+                        cell = worksheet[f"{col_letter}{row}"]
+                        cell.number_format = '0.############'  # 使用足够多的#来显示所有有效数字
 
-        # 设置数值列的格式以显示完整精度
-        for col_idx, col_name in enumerate(cif_invoice.columns, 1):
-            if col_name in numeric_columns:
-                # 使用自定义数字格式来显示所有有效数字
-                col_letter = get_column_letter(col_idx)
-                for row in range(2, len(cif_invoice) + 2):  # 从第2行开始（跳过表头）
-                    cell = worksheet[f"{col_letter}{row}"]
-                    cell.number_format = '0.############'  # 使用足够多的#来显示所有有效数字
+    if intermediate_writer:
+        intermediate_writer.write('cif_original_invoice', cif_invoice, frame='result_df', xlsx=cif_file_path)
 
     # 保存打包清单
-    safe_save_to_excel(pl_invoice, pl_file_path)
+    if render_xlsx:
+        safe_save_to_excel(pl_invoice, pl_file_path)
+    if intermediate_writer:
+        intermediate_writer.write('pl_original_invoice', pl_invoice, frame='pl_result_df')
+
+    report_stage('export')
 
     # 提取一般贸易的物料
     general_trade_df = result_df[result_df['Trade Type'] == '一般贸易'].copy()
@@ -1967,15 +1989,12 @@ def process_shipping_list(packing_list_file, policy_file, output_dir='outputs'):
         if 'Original_Unit' in general_trade_df.columns:
             export_invoice['Unit'] = general_trade_df['Original_Unit']
 
-        # Group by Material code and other fields, keeping original units
-        export_grouped = export_invoice.groupby(['Part Number', 'Unit Price (CIF, USD)'], as_index=False).agg({
-            'Quantity': 'sum',
-            'S/N': 'first',
-            'Unit': 'first',  # This will keep the original Chinese unit
-            'Model Number': 'first',
-            '名称': 'first',
-            'Total Net Weight (kg)': 'sum',  # Sum the total net weight for grouped items
-        })
+        # 按(Part Number, 量化到0.0001的Unit Price)合并，保留原始中文单位
+        export_grouped = aggregate_invoice_rows(
+            export_invoice,
+            sum_cols=['Quantity', 'Total Net Weight (kg)'],
+            first_cols=['S/N', 'Unit', 'Model Number', '名称'],
+        )
 
         # Calculate Amount after grouping
         export_grouped['Total Amount (CIF, USD)'] = (export_grouped['Unit Price (CIF, USD)'] * export_grouped['Quantity'])
@@ -1995,6 +2014,19 @@ def process_shipping_list(packing_list_file, policy_file, output_dir='outputs'):
         export_grouped = export_grouped.reset_index(drop=True)
         export_grouped['S/N'] = export_grouped.index + 1
 
+        if in_memory_validation:
+            in_memory_validation.check_export_invoice(cif_invoice, export_grouped)
+        if intermediate_writer:
+            intermediate_writer.write('export_invoice', export_grouped, frame='export_grouped')
+
+        # 使用正确的发票号码格式作为工作表名
+        invoice_sheet_name = invoice_numbers.reserve('CXCI')[0]
+        if line_writer:
+            line_writer.write(export_grouped, invoice_sheet_name, 'export')
+    else:
+        print("没有一般贸易的物料，不生成出口发票文件")
+
+    if render_xlsx and not general_trade_df.empty:
         # Save both sheets to the same Excel file
         export_file_path = os.path.join(output_dir, 'export_invoice.xlsx')
 
@@ -2025,99 +2057,26 @@ def process_shipping_list(packing_list_file, policy_file, output_dir='outputs'):
 
                 # 确保正确的输出列顺序（不包含 project）
                 output_columns = [col for col in pl_output_columns if col != 'project']
-                packing_df = packing_df[output_columns]
+                packing_doc = InvoiceDocument(packing_df, columns=output_columns)
 
-                # 确保S/N列从1开始编号
-                if 'S/N' in packing_df.columns:
-                    # 在添加汇总行和页脚行之前重新编号
-                    packing_df = packing_df.reset_index(drop=True)
-                    packing_df['S/N'] = range(1, len(packing_df) + 1)
+                # 确保S/N列从1开始编号（只对数据行编号，合计行和页脚行是单独的区段）
+                if 'S/N' in output_columns:
+                    packing_doc.renumber('S/N')
                     print("Reset export packing list S/N to start from 1")
 
                 # 添加汇总行（只对数字列计算总和）
                 summary_cols = ['Quantity', 'Total Gross Weight (kg)', 'Total Net Weight (kg)', 'Total Carton Quantity', 'Total Volume (CBM)']
-                summary_packing = {'名称': 'Total'}
-                for col in summary_cols:
-                    if col in packing_df.columns:
-                        # Calculate sum without modifying the original column in place
-                        # Coerce to numeric, fill NA with 0 JUST for the sum calculation
-                        summary_packing[col] = pd.to_numeric(packing_df[col], errors='coerce').fillna(0).sum()
-
-                summary_row = pd.DataFrame([{col: (summary_packing.get(col, None) if col in summary_cols else None) for col in packing_df.columns}])
-                summary_row['名称'] = 'Total'
-                packing_df = pd.concat([packing_df, summary_row], ignore_index=True)
+                summary_packing = packing_doc.set_total('名称', summary_cols)
 
                 # Debug print columns
                 print("\nPacking List columns before saving:")
-                print(packing_df.columns.tolist())
+                print(output_columns)
 
                 # 添加PL页脚信息
-                # 获取包裹数量
-                total_packages = int(summary_packing.get('Total Carton Quantity', 0))
-                # 获取总净重
-                total_net_weight = summary_packing.get('Total Net Weight (kg)', 0)
-                # 获取总毛重
-                total_gross_weight = summary_packing.get('Total Gross Weight (kg)', 0)
-                # 获取总体积
-                total_volume = summary_packing.get('Total Volume (CBM)', 0)
-
-                # 创建页脚行
-                footer_rows = [
-                    {'S/N': f'PACKED IN {total_packages} PACKAGES ONLY.'},
-                    {'S/N': f'NET WEIGHT: {total_net_weight:.2f} KGS'},
-                    {'S/N': f'GROSS WEIGHT: {total_gross_weight:.2f} KGS'},
-                    {'S/N': f'TOTAL MEASUREMENT:{total_volume:.2f} CBM'},
-                    {'S/N': 'COUNTRY OF ORIGIN: CHINA'}
-                ]
-
-                # 为每行添加空白列，确保列数匹配
-                for row in footer_rows:
-                    for col in packing_df.columns:
-                        if col not in row:
-                            row[col] = None
-
-                # 检查是否有中文表头翻译行 - 通常是第一行数据，包含多个中文表头术语
-                if len(packing_df) > 0:
-                    first_row = packing_df.iloc[0]
-                    chinese_header_terms = ['料号', '进口清关货描', '型号', '总件数', '总体积', '箱号']
-                    matching_terms = 0
-
-                    for col, value in first_row.items():
-                        if isinstance(value, str):
-                            for term in chinese_header_terms:
-                                if term in value:
-                                    matching_terms += 1
-                                    break
-
-                    # 如果找到多个中文表头术语，这可能是一个表头翻译行
-                    if matching_terms >= 2:
-                        print(f"在导出发票中检测到中文表头翻译行，将其过滤掉")
-                        packing_df = packing_df.iloc[1:].reset_index(drop=True)
-                        # 重新编号S/N列
-                        if 'S/N' in packing_df.columns:
-                            # 识别页脚行和Total行
-                            footer_mask = packing_df['S/N'].astype(str).str.contains('PACKED IN|NET WEIGHT|GROSS WEIGHT|TOTAL MEASUREMENT|COUNTRY OF ORIGIN', na=False, regex=True)
-                            total_mask = packing_df['名称'] == 'Total' if '名称' in packing_df.columns else pd.Series(False, index=packing_df.index)
-
-                            # 提取数据行
-                            data_rows = packing_df[~(footer_mask | total_mask)].copy()
-
-                            if not data_rows.empty:
-                                # 重新编号数据行，从1开始
-                                data_rows['S/N'] = range(1, len(data_rows) + 1)
-
-                                # 重新组合数据
-                                total_rows = packing_df[total_mask].copy()
-                                footer_rows = packing_df[footer_mask].copy()
-                                packing_df = pd.concat([data_rows, total_rows, footer_rows], ignore_index=True)
-                                print("Reset export packing list S/N to start from 1")
-
-                # 将页脚行添加到数据框
-                footer_df = pd.DataFrame(footer_rows)
-                packing_df = pd.concat([packing_df, footer_df], ignore_index=True)
+                packing_doc.set_footer(pl_footer_lines(summary_packing))
 
                 # 保存到Excel
-                packing_df.to_excel(writer, sheet_name='PL', index=False)
+                packing_doc.to_excel(writer, sheet_name='PL')
 
                 # Apply cell merging for packing list
                 merge_packing_list_cells(export_file_path)
@@ -2130,44 +2089,23 @@ def process_shipping_list(packing_list_file, policy_file, output_dir='outputs'):
                 empty_pl_df.to_excel(writer, sheet_name='PL', index=False)
 
             # Commercial Invoice 工作表处理
-            commercial_df = export_grouped.copy()
+            commercial_doc = InvoiceDocument(export_grouped, columns=exportReimport_output_columns)
             # 添加汇总行
-            summary_commercial = {'名称': 'Total', 'Part Number': ''}
-            for col in ['Quantity', 'Total Amount (CIF, USD)', 'Total Net Weight (kg)']:
-                if col in commercial_df.columns:
-                    summary_commercial[col] = pd.to_numeric(commercial_df[col], errors='coerce').fillna(0).sum()
-
-            # Create new row with just the sums for Qty and Amount
-            summary_row = pd.DataFrame([summary_commercial])
-
-            # Proper column order for the summary row
-            for col in exportReimport_output_columns:
-                if col not in summary_row.columns:
-                    summary_row[col] = None
-
-            summary_row = summary_row[exportReimport_output_columns]
+            # 金额合计与各行金额一样保留4位小数，重量保留2位
+            summary_commercial = commercial_doc.set_total(
+                '名称', ['Quantity', 'Total Amount (CIF, USD)', 'Total Net Weight (kg)'], values={'Part Number': ''},
+                decimals={'Total Amount (CIF, USD)': 4})
 
             # Get the total amount from the summary row
             total_amount = summary_commercial.get('Total Amount (CIF, USD)', 0)
             total_amount_words = num_to_words(total_amount)
 
             # Format following the screenshot: "SAY USD [AMOUNT IN WORDS] ONLY."
-            # Create an empty row with all fields blank, but spanning all columns
-            empty_row_data = {col: "" for col in exportReimport_output_columns}
-            empty_row = pd.DataFrame([empty_row_data])
-
-            # Create the words row with the exact format from screenshot
-            words_row_data = {col: "" for col in exportReimport_output_columns}
-            words_row_data['S/N'] = f"Amount in Words: SAY USD {total_amount_words} ONLY."
-            words_row = pd.DataFrame([words_row_data])
-
-            # Add both rows to the DataFrame (summary row, empty row, words row)
-            commercial_df = pd.concat([commercial_df, summary_row, empty_row, words_row], ignore_index=True)
+            # 汇总行之后空一行，再写金额大写行
+            commercial_doc.set_words({'S/N': f"Amount in Words: SAY USD {total_amount_words} ONLY."})
 
-            # 使用正确的发票号码格式作为工作表名
-            invoice_sheet_name = generate_invoice_sheet_name()
             print(f"Using invoice sheet name: {invoice_sheet_name}")
-            commercial_df.to_excel(writer, sheet_name=invoice_sheet_name, index=False)
+            commercial_doc.to_excel(writer, sheet_name=invoice_sheet_name)
 
             # 确保至少一个工作表可见
             workbook = writer.book
@@ -2437,15 +2375,17 @@ def process_shipping_list(packing_list_file, policy_file, output_dir='outputs'):
                                 export_file_path
                             ]
 
+                        if xml_merge:
+                            merge_cmd.insert(2, '--xml')
+                        merge_cmd[2:2] = template_value_args
                         print(f"Running merge command: {' '.join(merge_cmd)}")
 
                         try:
                             # Use subprocess.run with stdout and stderr captured to diagnose issues
-                            result = subprocess.run(
+                            result = run_merge_command(
                                 merge_cmd,
                                 check=True,
-                                capture_output=True,
-                                text=True
+                                in_process=in_process_merge
                             )
 
                             # Print stdout and stderr for debugging
@@ -2495,8 +2435,8 @@ def process_shipping_list(packing_list_file, policy_file, output_dir='outputs'):
                         pass
         except Exception as e:
             print(f"Warning: File saved but could not apply styling: {e}")
-    else:
-        print("没有一般贸易的物料，不生成出口发票文件")
+
+    report_stage('reimport')
 
     # After creating result_df and before generating any output files
     # Split the data by project and factory
@@ -2505,27 +2445,29 @@ def process_shipping_list(packing_list_file, policy_file, output_dir='outputs'):
     # Generate a single invoice file with multiple sheets for all splits
     reimport_invoice_path = os.path.join(output_dir, 'reimport_invoice.xlsx')
 
-    # Delete existing reimport_invoice.xlsx file if it exists
-    if os.path.exists(reimport_invoice_path):
-        try:
-            os.remove(reimport_invoice_path)
-            print(f"Removed existing file: {reimport_invoice_path}")
-            time.sleep(1)  # Give the OS time to fully release the file
-        except Exception as e:
-            print(f"Warning: Could not remove existing file: {e}")
+    if render_xlsx:
+        # Delete existing reimport_invoice.xlsx file if it exists
+        if os.path.exists(reimport_invoice_path):
+            try:
+                os.remove(reimport_invoice_path)
+                print(f"Removed existing file: {reimport_invoice_path}")
+                time.sleep(1)  # Give the OS time to fully release the file
+            except Exception as e:
+                print(f"Warning: Could not remove existing file: {e}")
+
+        # Create a new Excel file with at least two sheets to avoid the "At least one sheet must be visible" error
+        wb = Workbook()
+        ws1 = wb.active
+        ws1.title = "PL"
+        ws2 = wb.create_sheet("Dummy")
+        ws2['A1'] = "Dummy Sheet"
+        ws2['A2'] = "This sheet will be replaced with actual data"
+        wb.save(reimport_invoice_path)
+        print(f"Created initial reimport_invoice.xlsx with PL and Dummy sheets")
 
-    # Create a new Excel file with at least two sheets to avoid the "At least one sheet must be visible" error
-    wb = Workbook()
-    ws1 = wb.active
-    ws1.title = "PL"
-    ws2 = wb.create_sheet("Dummy")
-    ws2['A1'] = "Dummy Sheet"
-    ws2['A2'] = "This sheet will be replaced with actual data"
-    wb.save(reimport_invoice_path)
-    print(f"Created initial reimport_invoice.xlsx with PL and Dummy sheets")
-
-    # Now open the file for writing with pandas
-    with pd.ExcelWriter(reimport_invoice_path, engine='openpyxl', mode='a') as writer:
+    # Now open the file for writing with pandas (只输出数据时没有工作簿，writer为None)
+    with (pd.ExcelWriter(reimport_invoice_path, engine='openpyxl', mode='a') if render_xlsx
+          else contextlib.nullcontext()) as writer:
         # First, add the complete Packing List sheet
         complete_pl_df = pl_result_df.copy()
 
@@ -2621,109 +2563,37 @@ def process_shipping_list(packing_list_file, policy_file, output_dir='outputs'):
         save_columns = ['Commodity Description (Customs)' if col == '名称' else col for col in save_columns]
         complete_pl_df = complete_pl_df[save_columns]
 
+        # 数据行重新编号，S/N从1开始（合计行和页脚行是单独的区段）
+        pl_doc = InvoiceDocument(complete_pl_df)
+        if 'S/N' in complete_pl_df.columns and not complete_pl_df.empty:
+            pl_doc.renumber('S/N')
+            print("Reset import packing list S/N to start from 1")
+
         # Add summary row to packing list for import invoice
         summary_cols = ['Quantity', 'Total Gross Weight (kg)', 'Total Net Weight (kg)', 'Total Carton Quantity', 'Total Volume (CBM)']
-        summary_packing = {'Commodity Description (Customs)': 'Total'}
-        for col in summary_cols:
-            if col in complete_pl_df.columns:
-                # Calculate sum without modifying the original column in place
-                # Coerce to numeric, fill NA with 0 JUST for the sum calculation
-                summary_packing[col] = pd.to_numeric(complete_pl_df[col], errors='coerce').fillna(0).sum()
-
-        summary_row = pd.DataFrame([summary_packing])
-        complete_pl_df = pd.concat([complete_pl_df, summary_row], ignore_index=True)
+        summary_packing = pl_doc.set_total('Commodity Description (Customs)', summary_cols)
 
         # 添加PL页脚信息
-        # 获取包裹数量
-        total_packages = int(summary_packing.get('Total Carton Quantity', 0))
-        # 获取总净重
-        total_net_weight = summary_packing.get('Total Net Weight (kg)', 0)
-        # 获取总毛重
-        total_gross_weight = summary_packing.get('Total Gross Weight (kg)', 0)
-        # 获取总体积
-        total_volume = summary_packing.get('Total Volume (CBM)', 0)
-
-        # 创建页脚行
-        footer_rows = [
-            {'S/N': f'PACKED IN {total_packages} PACKAGES ONLY.'},
-            {'S/N': f'NET WEIGHT: {total_net_weight:.2f} KGS'},
-            {'S/N': f'GROSS WEIGHT: {total_gross_weight:.2f} KGS'},
-            {'S/N': f'TOTAL MEASUREMENT:{total_volume:.2f} CBM'},
-            {'S/N': 'COUNTRY OF ORIGIN: CHINA'}
-        ]
-
-        # 为每行添加空白列，确保列数匹配
-        for row in footer_rows:
-            for col in complete_pl_df.columns:
-                if col not in row:
-                    row[col] = None
-
-        # 将页脚行添加到数据框
-        footer_df = pd.DataFrame(footer_rows)
-        complete_pl_df = pd.concat([complete_pl_df, footer_df], ignore_index=True)
-
-        # 确保S/N列从1开始编号
-        if 'S/N' in complete_pl_df.columns:
-            # 识别页脚行 - 通常是包含特定文本的行
-            footer_mask = complete_pl_df['S/N'].astype(str).str.contains('PACKED IN|NET WEIGHT|GROSS WEIGHT|TOTAL MEASUREMENT|COUNTRY OF ORIGIN', na=False, regex=True)
-            # 识别Total行
-            total_mask = complete_pl_df['Commodity Description (Customs)'] == 'Total'
-
-            # 识别中文表头翻译行 - 通常是第一行数据，包含多个中文表头术语
-            chinese_header_mask = False
-            if len(complete_pl_df) > 0:
-                first_row = complete_pl_df.iloc[0]
-                chinese_header_terms = ['料号', '进口清关货描', '型号', '总件数', '总体积', '箱号']
-                matching_terms = 0
-
-                for col, value in first_row.items():
-                    if isinstance(value, str):
-                        for term in chinese_header_terms:
-                            if term in value:
-                                matching_terms += 1
-                                break
-
-                # 如果找到多个中文表头术语，这可能是一个表头翻译行
-                if matching_terms >= 2:
-                    print(f"在最终输出前检测到中文表头翻译行，将其过滤掉")
-                    chinese_header_mask = complete_pl_df.index == 0
-
-            # 提取数据行、Total行和页脚行，排除中文表头翻译行
-            data_rows = complete_pl_df[~(footer_mask | total_mask | chinese_header_mask)].copy()
-            total_rows = complete_pl_df[total_mask].copy()
-            footer_rows = complete_pl_df[footer_mask].copy()
-
-            if not data_rows.empty:
-                # 重新编号数据行，从1开始
-                data_rows['S/N'] = range(1, len(data_rows) + 1)
-
-                # 按顺序合并所有行：数据行、Total行、页脚行
-                complete_pl_df = pd.concat([data_rows, total_rows, footer_rows], ignore_index=True)
-                print("Reset import packing list S/N to start from 1")
+        pl_doc.set_footer(pl_footer_lines(summary_packing))
 
         # Save packing list sheet - overwrite the existing PL sheet
-        if 'PL' in writer.book.sheetnames:
+        if writer is not None and 'PL' in writer.book.sheetnames:
             # Remove the existing PL sheet
             idx = writer.book.sheetnames.index('PL')
             writer.book.remove(writer.book.worksheets[idx])
             print("Removed existing PL sheet before saving new data")
 
         # Now save the packing list to the PL sheet
-        complete_pl_df.to_excel(writer, sheet_name='PL', index=False)
+        if writer is not None:
+            pl_doc.to_excel(writer, sheet_name='PL')
 
         # Process each split for Commercial Invoice sheets only
-        # Generate base invoice number and increment for each sheet
-        base_invoice_name = generate_invoice_sheet_name(prefix="RECI")
-        # Extract the numeric part for incrementing
-        invoice_prefix = base_invoice_name[:-4]  # Everything except last 4 digits
-        invoice_number = int(base_invoice_name[-4:])  # Last 4 digits as integer
-
-        print(f"Base invoice name: {base_invoice_name}")
-        print(f"Prefix: {invoice_prefix}, Starting number: {invoice_number}")
-
         # Sort keys to ensure consistent ordering
         sorted_keys = sorted(split_dfs.keys())
 
+        # 每个非空拆分一张发票，一次预留一段连续的发票号
+        reimport_numbers = iter(invoice_numbers.reserve('RECI', sum(not split_dfs[key].empty for key in sorted_keys)))
+
         # Track sheet names being created
         created_sheet_names = []
 
@@ -2733,13 +2603,10 @@ def process_shipping_list(packing_list_file, policy_file, output_dir='outputs'):
 
             if not df.empty:
                 # Create sequential invoice sheet name
-                ci_sheet_name = f"{invoice_prefix}{invoice_number:04d}"
+                ci_sheet_name = next(reimport_numbers)
                 created_sheet_names.append(ci_sheet_name)
                 print(f"Using sheet name '{ci_sheet_name}' for project '{project}', factory '{factory}'")
 
-                # Increment for next sheet
-                invoice_number += 1
-
                 # 确保文件名中的工厂和项目值是有效的字符串
                 project_safe = str(project).strip().replace(' ', '_')
                 factory_safe = str(factory).strip().replace(' ', '_')
@@ -2985,16 +2852,10 @@ def process_shipping_list(packing_list_file, policy_file, output_dir='outputs'):
                 invoice_df = merge_india_invoice_rows(invoice_df)
 
                 # Add summary row to invoice
-                summary_invoice = {col: '' for col in reimport_columns}
-                summary_invoice['Commodity Description (Customs)'] = 'Total'
-                summary_invoice['Part Number'] = ''
-                for col in ['Quantity', 'Total Amount (CIF, USD)', 'Total Net Weight (kg)']:
-                    if col in invoice_df.columns:
-                        summary_invoice[col] = pd.to_numeric(invoice_df[col], errors='coerce').fillna(0).sum()
-                summary_row = pd.DataFrame([summary_invoice])[reimport_columns]
-                # Create empty row and words row
-                empty_row = pd.DataFrame([{col: '' for col in reimport_columns}])
-                words_row = pd.DataFrame([{col: '' for col in reimport_columns}])
+                invoice_doc = InvoiceDocument(invoice_df, columns=reimport_columns)
+                summary_invoice = invoice_doc.set_total(
+                    'Commodity Description (Customs)', ['Quantity', 'Total Amount (CIF, USD)', 'Total Net Weight (kg)'],
+                    fill='', values={'Part Number': ''}, decimals={'Total Amount (CIF, USD)': 4})
 
                 # Calculate the total amount for THIS specific invoice
                 this_invoice_total = summary_invoice.get('Total Amount (CIF, USD)', 0)
@@ -3002,10 +2863,25 @@ def process_shipping_list(packing_list_file, policy_file, output_dir='outputs'):
                 this_invoice_amount_words = num_to_words(this_invoice_total)
                 print(f"Generated Amount in Words for {project}_{factory}: {this_invoice_amount_words}")
 
-                words_row['S/N'] = 'Amount in Words:'
-                words_row['Part Number'] = f"SAY USD {this_invoice_amount_words} ONLY."
-                # Add all rows to the DataFrame
-                invoice_df = pd.concat([invoice_df, summary_row, empty_row, words_row], ignore_index=True)[reimport_columns]
+                # 汇总行之后空一行，再写金额大写行
+                invoice_doc.set_words({'S/N': 'Amount in Words:',
+                                       'Part Number': f"SAY USD {this_invoice_amount_words} ONLY."})
+                if intermediate_writer:
+                    intermediate_writer.write(f"reimport_{project_safe}_{factory_safe}", invoice_doc.data,
+                                              frame='invoice_df', project=str(project), factory=str(factory),
+                                              sheet_name=ci_sheet_name)
+                if line_writer:
+                    line_writer.write(invoice_doc.data, ci_sheet_name, 'reimport',
+                                      project=str(project), factory=str(factory))
+
+                # 临时文件和校验仍使用整表
+                invoice_df = invoice_doc.to_frame()
+
+                if in_memory_validation:
+                    in_memory_validation.check_reimport_invoice(reimport_file_name, invoice_df)
+
+                if not render_xlsx:
+                    continue
 
                 # Save to a temporary file first
                 temp_reimport_file = os.path.join(output_dir, f'temp_{reimport_file_name}')
@@ -3097,15 +2973,17 @@ def process_shipping_list(packing_list_file, policy_file, output_dir='outputs'):
                                 reimport_file_path
                             ]
 
+                        if xml_merge:
+                            merge_cmd.insert(2, '--xml')
+                        merge_cmd[2:2] = template_value_args
                         print(f"Running merge command for individual reimport: {' '.join(merge_cmd)}")
 
                         try:
                             # Execute merge command without check=True to handle non-zero exit codes
-                            result = subprocess.run(
+                            result = run_merge_command(
                                 merge_cmd,
                                 check=False,  # Changed to False to prevent exception on non-zero exit
-                                capture_output=True,
-                                text=True
+                                in_process=in_process_merge
                             )
 
                             # Print output and errors
@@ -3165,12 +3043,16 @@ def process_shipping_list(packing_list_file, policy_file, output_dir='outputs'):
                     pass
 
                 # Save to combined workbook
-                invoice_df.to_excel(writer, sheet_name=ci_sheet_name, index=False)
+                invoice_doc.to_excel(writer, sheet_name=ci_sheet_name)
 
                 print(f"Added Commercial Invoice sheet for project {project}, factory {factory}")
 
         print(f"Created reimport invoice sheets: {created_sheet_names}")
 
+    if not render_xlsx:
+        # 只输出数据: 不做模板合并、样式处理和中间xlsx文件清理
+        return finish_result()
+
     # Verify the sheet names in the saved file
     try:
         verification_xls = pd.ExcelFile(reimport_invoice_path)
@@ -3199,6 +3081,8 @@ def process_shipping_list(packing_list_file, policy_file, output_dir='outputs'):
     except Exception as e:
         print(f"Error verifying sheet names: {e}")
 
+    report_stage('merge')
+
     # Apply styling to the reimport file
     try:
         # Load the workbook
@@ -3387,15 +3271,17 @@ def process_shipping_list(packing_list_file, policy_file, output_dir='outputs'):
                             reimport_invoice_path
                         ]
 
+                    if xml_merge:
+                        merge_cmd.insert(2, '--xml')
+                    merge_cmd[2:2] = template_value_args
                     print(f"Running merge command for reimport: {' '.join(merge_cmd)}")
 
                     try:
                         # Use subprocess.run with stdout and stderr captured to diagnose issues
-                        result = subprocess.run(
+                        result = run_merge_command(
                             merge_cmd,
                             check=False,  # Changed to False to prevent exception on non-zero exit
-                            capture_output=True,
-                            text=True
+                            in_process=in_process_merge
                         )
 
                         # Print stdout and stderr for debugging
@@ -3580,7 +3466,7 @@ def process_shipping_list(packing_list_file, policy_file, output_dir='outputs'):
     else:
         print(f"  Not found (already removed or never created): {os.path.basename(backup_reimport_path)}")
 
-    return result_df
+    return finish_result()
 
 def apply_import_invoice_footer_styling(workbook_path, company_name, bank_name, account_no, swift_code, branch_address, company_address):
     """
@@ -3816,21 +3702,7 @@ def apply_import_invoice_footer_styling(workbook_path, company_name, bank_name,
 # Run the process
 if __name__ == "__main__":
     # Set up command line argument parsing
-    parser = argparse.ArgumentParser(description='处理装运清单并生成出口和复进口发票')
-
-    parser.add_argument('--packing-list', type=str, default='testfiles/original_packing_list.xlsx',
-                      help='原始装箱单文件路径 (默认: testfiles/original_packing_list.xlsx)')
-
-    parser.add_argument('--policy', type=str, default='testfiles/policy.xlsx',
-                      help='政策文件路径 (默认: testfiles/policy.xlsx)')
-
-    parser.add_argument('--output-dir', type=str, default='outputs',
-                      help='输出目录 (默认: outputs)')
-
-    parser.add_argument('--debug', action='store_true',
-                      help='启用调试模式，显示详细错误信息')
-
-    args = parser.parse_args()
+    args = build_arg_parser().parse_args()
 
     # Create output directory if it doesn't exist
     if not os.path.exists(args.output_dir):
@@ -3842,30 +3714,52 @@ if __name__ == "__main__":
             raise
 
     # Get file paths from arguments
-    packing_list_file = args.packing_list
+    packing_list_files = args.packing_list
+    packing_list_file = packing_list_files[0]
     policy_file = args.policy
 
     try:
         # Verify input files exist
-        if not os.path.exists(packing_list_file):
-            raise FileNotFoundError(f"原始装箱单文件不存在: {packing_list_file}")
+        for path in packing_list_files:
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"原始装箱单文件不存在: {path}")
 
         if not os.path.exists(policy_file):
             raise FileNotFoundError(f"政策文件不存在: {policy_file}")
 
         # Check file formats
-        if not packing_list_file.lower().endswith('.xlsx'):
-            print(f"警告: 装箱单文件 '{packing_list_file}' 可能不是Excel格式")
+        for path in packing_list_files:
+            if not path.lower().endswith('.xlsx'):
+                print(f"警告: 装箱单文件 '{path}' 可能不是Excel格式")
 
         if not policy_file.lower().endswith('.xlsx'):
             print(f"警告: 政策文件 '{policy_file}' 可能不是Excel格式")
 
         print(f"开始处理文件:")
-        print(f"- 装箱单: {packing_list_file}")
+        for path in packing_list_files:
+            print(f"- 装箱单: {path}")
         print(f"- 政策文件: {policy_file}")
         print(f"- 输出目录: {args.output_dir}")
+        if args.no_xlsx and not (args.invoice_lines or args.intermediates):
+            print("警告: 使用了--no-xlsx但没有指定--invoice-lines或--intermediates，不会写出任何发票文件")
 
-        result = process_shipping_list(packing_list_file, policy_file, args.output_dir)
+        if args.profile_deep:
+            from shipping_processor.profiling import deep_profile
+            profiling = deep_profile(os.path.join(args.output_dir, 'profile'))
+        else:
+            profiling = contextlib.nullcontext()
+        with profiling as progress_callback:
+            result = process_shipping_list(packing_list_files, policy_file, args.output_dir,
+                                           validate_in_memory=args.validate_in_memory,
+                                           progress_callback=progress_callback,
+                                           xml_merge=args.xml_merge,
+                                           supplier_breakdown=args.supplier_breakdown,
+                                           in_process_merge=args.profile_deep,
+                                           intermediates=args.intermediates,
+                                           invoice_lines=args.invoice_lines,
+                                           render_xlsx=not args.no_xlsx,
+                                           invoice_numbering=args.invoice_numbering,
+                                           invoice_number_db=args.invoice_number_db)
         print(f"处理完成！输出文件已保存到 '{args.output_dir}' 目录。")
     except FileNotFoundError as e:
         print(f"错误: {e}")
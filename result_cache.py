@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+按内容寻址的上传文件和处理结果缓存
+
+上传文件按SHA-256保存为uploads/<hash>.xlsx；处理结果按(装箱单哈希, 政策文件哈希, 处理版本)保存为
+results/<key>/，其中result.json最后写入，存在即表示结果完整可用。处理版本由模板文件、分类规则和
+RESULT_VERSION得到，修改模板或规则后相同的上传不会命中旧的结果。
+同一服务器上再次上传相同的两个文件时，可以跳过验证和处理，直接提供缓存的输出。
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from shipping_processor.model.rules import DEFAULT_CONFIG_PATH
+
+RESULT_FILE = 'result.json'
+# 未完成的任务目录中记录任务使用的上传文件，淘汰时保留这些文件
+INPUTS_FILE = 'inputs.json'
+
+# 处理逻辑改变、相同的输入会得到不同的输出时增加此版本号
+RESULT_VERSION = 1
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 决定输出内容的模板和规则文件；模板与process_shipping_list.find_file一样先在当前目录查找，
+# 分类规则与load_classification_rules使用同一个默认路径
+VERSION_FILES = ['h.xlsx', 'f.xlsx', 'pl_h.xlsx', 'pl_f.xlsx', DEFAULT_CONFIG_PATH]
+
+
+def processing_version(files=None):
+    """模板、分类规则和RESULT_VERSION的哈希(前16位)，作为缓存键的一部分
+
+    Args:
+        files: 参与计算的文件，默认为VERSION_FILES
+
+    Returns:
+        str: 十六进制哈希
+    """
+    digest = hashlib.sha256(f"v{RESULT_VERSION}".encode('ascii'))
+    for name in files or VERSION_FILES:
+        path = name if os.path.exists(name) else os.path.join(PROJECT_DIR, name)
+        digest.update(b'\0' + os.path.basename(name).encode('utf-8') + b'\0')
+        try:
+            with open(path, 'rb') as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+        except OSError as e:
+            # 缺少的文件修改后不会改变缓存键，可能提供过时的结果
+            print(f"警告: 无法读取决定缓存版本的文件 {path}: {e}")
+            digest.update(b'missing')
+    return digest.hexdigest()[:16]
+
+
+class ResultCache:
+    """上传文件和处理结果缓存，按访问时间淘汰超龄条目，超过总大小时先淘汰最久未用的条目"""
+
+    def __init__(self, cache_dir, max_age_seconds=24 * 3600, max_bytes=500 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.uploads_dir = os.path.join(cache_dir, 'uploads')
+        self.results_dir = os.path.join(cache_dir, 'results')
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        os.makedirs(self.uploads_dir, exist_ok=True)
+        os.makedirs(self.results_dir, exist_ok=True)
+
+    def store_upload(self, data, suffix='.xlsx'):
+        """保存上传内容
+
+        Args:
+            data: 上传文件的字节内容
+            suffix: 文件扩展名
+
+        Returns:
+            tuple: (内容哈希, 保存路径)
+        """
+        content_hash = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self.uploads_dir, content_hash + suffix)
+        if os.path.exists(path):
+            os.utime(path)
+        else:
+            fd, temp_path = tempfile.mkstemp(dir=self.uploads_dir)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        return content_hash, path
+
+    def key(self, packing_list_hash, policy_hash):
+        """由两个文件的哈希和当前的处理版本组成结果的缓存键"""
+        return f"{packing_list_hash}_{policy_hash}_{processing_version()}"
+
+    def lookup(self, key):
+        """查找已完成的处理结果
+
+        Returns:
+            dict: 处理结果(路径已转换为绝对路径)，未命中时返回None
+        """
+        entry_dir = os.path.join(self.results_dir, key)
+        result_path = os.path.join(entry_dir, RESULT_FILE)
+        try:
+            with open(result_path, 'r', encoding='utf-8') as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        result = self._resolve(entry_dir, result)
+        files = [os.path.join(result['output_dir'], f) for f in result['export_files']]
+        if not all(os.path.exists(path) for path in files + [result['bundle_path']]):
+            print(f"缓存条目不完整，将重新处理: {key}")
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            return None
+
+        # 更新访问时间，淘汰时按此排序
+        os.utime(result_path)
+        return result
+
+    def new_job_dir(self, key, inputs=()):
+        """为处理任务创建临时目录，完成后由commit移动到缓存位置
+
+        Args:
+            key: 缓存键
+            inputs: 任务使用的上传文件路径(store_upload的返回值)，任务完成之前淘汰时不删除
+
+        Returns:
+            str: 任务目录
+        """
+        job_dir = tempfile.mkdtemp(prefix=f".{key[:16]}-", dir=self.results_dir)
+        with open(os.path.join(job_dir, INPUTS_FILE), 'w', encoding='utf-8') as f:
+            json.dump([os.path.basename(path) for path in inputs], f)
+        return job_dir
+
+    def commit(self, key, job_dir, result):
+        """保存处理结果
+
+        Args:
+            key: 缓存键
+            job_dir: 任务目录(new_job_dir的返回值)
+            result: 处理结果，output_dir和bundle_path须位于job_dir中
+
+        Returns:
+            dict: 缓存位置上的处理结果
+        """
+        stored = dict(result)
+        stored['output_dir'] = os.path.relpath(result['output_dir'], job_dir)
+        stored['bundle_path'] = os.path.relpath(result['bundle_path'], job_dir)
+        with open(os.path.join(job_dir, RESULT_FILE), 'w', encoding='utf-8') as f:
+            json.dump(stored, f, ensure_ascii=False)
+
+        entry_dir = os.path.join(self.results_dir, key)
+        try:
+            os.rename(job_dir, entry_dir)
+        except OSError:
+            # 相同文件的另一个任务已先完成，保留本任务目录，之后由淘汰清理
+            print(f"缓存条目已存在，本次结果不写入缓存: {key}")
+            return result
+
+        self.evict(keep=entry_dir)
+        return self._resolve(entry_dir, stored)
+
+    def evict(self, keep=None):
+        """淘汰超龄条目，并在总大小超限时从最久未用的条目开始淘汰
+
+        Args:
+            keep: 不淘汰的条目路径(例如刚写入的结果)
+        """
+        now = time.time()
+        entries = []
+        in_use = set()
+        for name in os.listdir(self.results_dir):
+            path = os.path.join(self.results_dir, name)
+            if name.startswith('.'):
+                in_use.update(_read_inputs(path))
+            result_path = os.path.join(path, RESULT_FILE)
+            last_used = os.path.getmtime(result_path if os.path.exists(result_path) else path)
+            entries.append((last_used, path, _dir_size(path)))
+        for name in os.listdir(self.uploads_dir):
+            path = os.path.join(self.uploads_dir, name)
+            entries.append((os.path.getmtime(path), path, os.path.getsize(path)))
+
+        entries.sort()
+        total = sum(size for _, _, size in entries)
+        for last_used, path, size in entries:
+            if now - last_used <= self.max_age_seconds and total <= self.max_bytes:
+                break
+            # 未完成的任务目录在超龄之前不淘汰，避免删除正在写入的结果
+            if path == keep or (os.path.basename(path).startswith('.') and now - last_used <= self.max_age_seconds):
+                continue
+            # 排队中或正在处理的任务还要读取的上传文件
+            if os.path.dirname(path) == self.uploads_dir and os.path.basename(path) in in_use:
+                continue
+            _remove(path)
+            total -= size
+            print(f"已淘汰缓存: {os.path.basename(path)}")
+
+    @staticmethod
+    def _resolve(entry_dir, result):
+        resolved = dict(result)
+        resolved['output_dir'] = os.path.join(entry_dir, result['output_dir'])
+        resolved['bundle_path'] = os.path.join(entry_dir, result['bundle_path'])
+        return resolved
+
+
+def _read_inputs(job_dir):
+    try:
+        with open(os.path.join(job_dir, INPUTS_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
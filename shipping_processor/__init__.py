@@ -1,5 +1,15 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-# Export the main function to maintain API compatibility
-from shipping_processor.main import process_shipping_list
+# Export the main function to maintain API compatibility.
+# shipping_processor.main is imported on first access so that importing the
+# package (or one of its subpackages) does not load the original implementation.
+
+__all__ = ['process_shipping_list']
+
+
+def __getattr__(name):
+    if name == 'process_shipping_list':
+        from shipping_processor.main import process_shipping_list
+        return process_shipping_list
+    raise AttributeError(f"module 'shipping_processor' has no attribute '{name}'")
@@ -6,11 +6,20 @@ Input module for reading and parsing Excel files.
 """
 
 from shipping_processor.input.reader import read_excel_file, detect_header_row
+from shipping_processor.input.normalize import normalize_packing_list
+from shipping_processor.input.weights import normalize_weight_values, normalize_weight_columns
+from shipping_processor.input.consolidate import read_packing_lists, supplier_name, supplier_names
 from shipping_processor.input.policy import read_policy_file, extract_rate, extract_company_info, extract_factory_info
 
 __all__ = [
     'read_excel_file',
     'detect_header_row',
+    'normalize_packing_list',
+    'normalize_weight_values',
+    'normalize_weight_columns',
+    'read_packing_lists',
+    'supplier_name',
+    'supplier_names',
     'read_policy_file',
     'extract_rate',
     'extract_company_info',
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Consolidated ingest for several packing lists shipped under one policy.
+
+同一个集装箱里常有多个供应商的装箱单，共用一个政策文件(总运费)。各装箱单在线程池中并发读取和清理，
+然后只拼接一次，后续的运费/保费按合并后的总净重分摊，生成一套合并的出口和复进口发票。
+每一行的来源(供应商)单独记录，用于输出按供应商的汇总。
+"""
+
+import collections
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from shipping_processor.input.normalize import normalize_packing_list, _find_column, SERIAL_PATTERNS
+
+
+def supplier_name(file_path):
+    """装箱单对应的供应商名称，取文件名(不含扩展名)"""
+    return os.path.splitext(os.path.basename(file_path))[0]
+
+
+def supplier_names(files):
+    """每个装箱单的供应商名称，保证互不相同
+
+    不同目录中的同名文件(例如25/original_packing_list.xlsx和428/original_packing_list.xlsx)
+    在名称前加上所在目录名，仍然重复时(同一文件列出两次)再加上序号。
+
+    Args:
+        files: 装箱单文件路径列表
+
+    Returns:
+        list: 与files顺序一致的供应商名称
+    """
+    names = [supplier_name(path) for path in files]
+    counts = collections.Counter(names)
+    names = [f"{os.path.basename(os.path.dirname(os.path.abspath(path)))}/{name}" if counts[name] > 1 else name
+             for path, name in zip(files, names)]
+
+    counts = collections.Counter(names)
+    seen = collections.Counter()
+    unique = []
+    for name in names:
+        seen[name] += 1
+        unique.append(f"{name} ({seen[name]})" if counts[name] > 1 else name)
+    return unique
+
+
+def _read_one(file_path, reader, row_offset):
+    df = reader(file_path)
+    df.columns = [str(col).strip() for col in df.columns]
+    cleaned, removed = normalize_packing_list(df, row_offset=row_offset)
+    for item in removed:
+        item['file'] = file_path
+    return cleaned, removed
+
+
+def read_packing_lists(files, reader, row_offset=4, max_workers=None):
+    """并发读取并清理多个装箱单，合并为一个DataFrame
+
+    Args:
+        files: 装箱单文件路径列表
+        reader: 读取单个文件的函数，参数为文件路径，返回DataFrame
+        row_offset: 第一行数据在Excel中的行号，见normalize_packing_list
+        max_workers: 线程数，默认为文件数
+
+    Returns:
+        tuple: (合并后的DataFrame(索引重新编号), 与其索引对齐的来源Series(供应商名称，互不相同),
+               被去掉或有问题的行的记录列表(见normalize_packing_list)，每项额外带有'file')
+    """
+    files = list(files)
+    if not files:
+        raise ValueError("至少需要一个装箱单文件")
+
+    if len(files) == 1:
+        frames = [_read_one(files[0], reader, row_offset)]
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers or len(files)) as executor:
+            futures = [executor.submit(_read_one, path, reader, row_offset) for path in files]
+            # 按files的顺序合并，与完成顺序无关
+            frames = [future.result() for future in futures]
+
+    names = supplier_names(files)
+    removed = [item for _, items in frames for item in items]
+
+    if len(frames) == 1:
+        df = frames[0][0]
+        return df, pd.Series(names[0], index=df.index), removed
+
+    columns = list(frames[0][0].columns)
+    for path, (df, _) in zip(files[1:], frames[1:]):
+        extra = [col for col in df.columns if col not in columns]
+        missing = [col for col in columns if col not in df.columns]
+        if extra or missing:
+            print(f"警告: 装箱单 '{path}' 的列与 '{files[0]}' 不同 (多出: {extra}, 缺少: {missing})")
+        columns.extend(extra)
+
+    combined = pd.concat([df for df, _ in frames], ignore_index=True).reindex(columns=columns)
+    sources = pd.Series([name for name, (df, _) in zip(names, frames) for _ in range(len(df))],
+                        index=combined.index)
+
+    # 各装箱单的序号都从1开始，合并后重新连续编号
+    serial_col = _find_column(combined.columns, SERIAL_PATTERNS)
+    if serial_col is not None:
+        combined[serial_col] = range(1, len(combined) + 1)
+
+    return combined, sources, removed
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Ingest normalization for packing lists.
+
+读取装箱单后只做一次清理: 去掉中文表头翻译行(以及重复的表头行)、合计/小计行和
+上次输出中带过来的页脚行，并记录每一行被去掉的原因。后续处理阶段直接使用清理后的数据，
+不再各自重复检测。
+"""
+
+import re
+
+import pandas as pd
+
+# 表头翻译行中常见的中文表头术语，一行中出现两个及以上即视为表头行
+HEADER_TERMS = ['料号', '进口清关货描', '型号', '总件数', '总体积', '箱号', '工厂地点', '序号']
+
+# 合计/小计行的标签(整格内容)
+SUMMARY_LABEL = re.compile(r'^(sub[\s-]?)?total\s*[:：]?$|^(合计|总计|小计|汇总)\s*[:：]?$', re.IGNORECASE)
+
+# 生成的装箱单页脚行
+FOOTER_TEXT = re.compile(r'^(PACKED IN|NET WEIGHT\s*:|GROSS WEIGHT\s*:|TOTAL MEASUREMENT|COUNTRY OF ORIGIN)',
+                         re.IGNORECASE)
+
+# 用于识别没有标签的合计行: 序号和料号都为空，但有数值，且位于最后一个数据行之后
+SERIAL_PATTERNS = ['s/n', '序号', 'no.']
+PART_PATTERNS = ['料号', 'part number', 'material code', 'p/n']
+
+
+def _find_column(columns, patterns):
+    for pattern in patterns:
+        for col in columns:
+            if pattern in str(col).strip().lower():
+                return col
+    return None
+
+
+def _text_columns(df):
+    """每个文本列去掉首尾空格后的值，非文本单元格为NaN"""
+    texts = {}
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_object_dtype(series.dtype) or pd.api.types.is_string_dtype(series.dtype):
+            try:
+                texts[col] = series.str.strip()
+            except AttributeError:
+                # 文本和数字混合的列
+                texts[col] = series.map(lambda value: value.strip() if isinstance(value, str) else None)
+    return texts
+
+
+def normalize_packing_list(df, row_offset=4):
+    """去掉装箱单中的表头翻译行、合计/小计行和页脚行
+
+    Args:
+        df: 读取的装箱单数据
+        row_offset: 第一行数据在Excel中的行号，用于记录被去掉的行
+
+    Returns:
+        tuple: (清理后的DataFrame(索引重新编号), 被去掉或有问题的行的记录列表，每项为
+               {'row': Excel行号, 'kind': 'header'/'summary'/'footer'/'error', 'reason': 说明}，
+               'error'表示该行无法确定是否为合计行，仍保留在数据中)
+    """
+    if df.empty:
+        return df, []
+
+    texts = _text_columns(df)
+    column_names = {str(col).strip() for col in df.columns}
+    header_terms = '|'.join(re.escape(term) for term in HEADER_TERMS)
+
+    header_hits = pd.Series(0, index=df.index)
+    summary_mask = pd.Series(False, index=df.index)
+    footer_mask = pd.Series(False, index=df.index)
+    for text in texts.values():
+        header_hits += (text.str.contains(header_terms, regex=True, na=False) | text.isin(column_names)).astype(int)
+        summary_mask |= text.str.match(SUMMARY_LABEL, na=False)
+        footer_mask |= text.str.match(FOOTER_TEXT, na=False)
+    header_mask = header_hits >= 2
+
+    # 没有标签的合计行: 序号和料号都为空，但其他列有数值。只有位于最后一个数据行
+    # (有序号或料号)之后的才按合计行去掉，数据中间的这类行保留并记录为错误
+    serial_col = _find_column(df.columns, SERIAL_PATTERNS)
+    part_col = _find_column(df.columns, PART_PATTERNS)
+    unlabeled = pd.Series(False, index=df.index)
+    unresolved = pd.Series(False, index=df.index)
+    if serial_col is not None and part_col is not None:
+        has_numbers = pd.Series(False, index=df.index)
+        for col in df.columns:
+            if col not in (serial_col, part_col):
+                has_numbers |= pd.to_numeric(df[col], errors='coerce').notna()
+        unkeyed = df[serial_col].isna() & df[part_col].isna()
+        labeled = ~(header_mask | summary_mask | footer_mask)
+        candidates = unkeyed & has_numbers & labeled
+        data_positions = (~unkeyed & labeled).to_numpy().nonzero()[0]
+        last_data = data_positions[-1] if len(data_positions) else -1
+        trailing = pd.Series(range(len(df)), index=df.index) > last_data
+        unlabeled = candidates & trailing
+        unresolved = candidates & ~trailing
+        summary_mask |= unlabeled
+
+    summary_mask &= ~header_mask
+    footer_mask &= ~(header_mask | summary_mask)
+
+    removed = []
+    for kind, mask, reason in (
+        ('header', header_mask, '表头翻译行'),
+        ('summary', summary_mask & ~unlabeled, '合计/小计行'),
+        ('summary', unlabeled, '序号和料号为空的合计行'),
+        ('footer', footer_mask, '装箱单页脚行'),
+        ('error', unresolved, '序号和料号为空，但位于数据行之间，无法确定是否为合计行，已按数据行保留'),
+    ):
+        for position in mask.to_numpy().nonzero()[0]:
+            removed.append({'row': int(position) + row_offset, 'kind': kind, 'reason': reason})
+    removed.sort(key=lambda item: item['row'])
+
+    drop_mask = (header_mask | summary_mask | footer_mask).to_numpy()
+    if not drop_mask.any():
+        return df, removed
+
+    cleaned = df[~drop_mask].reset_index(drop=True)
+    # 表头行中的文字会让数值列被读成文本，去掉后按读取时的规则重新推断:
+    # 整列都能转换为数字时转换为数值列
+    for col in cleaned.columns:
+        if pd.api.types.is_object_dtype(cleaned[col].dtype):
+            converted = pd.to_numeric(cleaned[col], errors='coerce')
+            if converted.notna().sum() == cleaned[col].notna().sum() and converted.notna().any():
+                cleaned[col] = converted
+    return cleaned, removed
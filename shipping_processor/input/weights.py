@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Weight column normalization.
+
+装箱单的净重/毛重列中可能有数值字符串、千分位逗号、通配符(*、?、N/A、TBD等)和空值。
+处理程序和输入验证都在内存中用同一套规则转换为浮点数，并记录每个被按0处理的值，不修改原文件。
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+# 重量列中按0处理的通配符或特殊字符
+WEIGHT_WILDCARDS = ['*', '?', 'n/a', 'tbd', '-', '/', '\\']
+
+
+def normalize_weight_values(values, label='重量', row_offset=1):
+    """把重量列向量化地转换为浮点数
+
+    数值和数值字符串(可含千分位逗号)直接转换；空值、通配符或特殊字符(*、?、N/A、TBD等)、
+    无法解析的值以及负值按0处理，并记录原因。不修改原文件。
+
+    Args:
+        values: 重量列Series
+        label: 容错日志中使用的列名
+        row_offset: 容错日志中的行号 = 行索引 + row_offset
+
+    Returns:
+        tuple: (转换后的float Series, 容错日志列表)
+    """
+    numeric = pd.to_numeric(values, errors='coerce')
+    text = values.astype(str).str.strip().str.replace(',', '', regex=False)
+    blank = values.isna() | (text == '').fillna(False)
+    pending = numeric.isna() & ~blank
+
+    # 去掉千分位逗号后可以直接解析的值
+    numeric = numeric.fillna(pd.to_numeric(text.where(pending), errors='coerce'))
+    pending &= numeric.isna()
+
+    # 数字前的负号不算通配符"-"，例如"-5kg"
+    signed = pending & text.str.match(r'-\s*[0-9.]', na=False)
+    unsigned = text.where(~signed, text.str[1:])
+    wildcard_pattern = '|'.join(re.escape(w) for w in WEIGHT_WILDCARDS)
+    wildcard = pending & unsigned.str.lower().str.contains(wildcard_pattern, regex=True, na=False)
+    pending &= ~wildcard
+
+    # 只保留数字和小数点(以及数字前的负号)后再尝试解析，例如"12.5kg"
+    cleaned = unsigned.where(pending).str.replace(r'[^0-9.]', '', regex=True)
+    cleaned = cleaned.where(cleaned.str.count(r'\.') <= 1)
+    cleaned = cleaned.where(~signed, '-' + cleaned)
+    numeric = numeric.fillna(pd.to_numeric(cleaned, errors='coerce'))
+    unparseable = pending & numeric.isna()
+    negative = (numeric < 0).fillna(False)
+
+    error_log = []
+    for idx in values.index[blank | wildcard | unparseable | negative]:
+        row = idx + row_offset if isinstance(idx, (int, np.integer)) else idx
+        if blank[idx]:
+            error_log.append(f"第{row}行{label}为空值，自动按0处理")
+        elif wildcard[idx]:
+            error_log.append(f"第{row}行{label}包含通配符或特殊字符'{text[idx]}'，自动按0处理")
+        elif negative[idx]:
+            error_log.append(f"第{row}行{label}为负值'{text[idx]}'，自动按0处理")
+        else:
+            error_log.append(f"第{row}行{label}值'{text[idx]}'无法解析为数值，自动按0处理")
+
+    return numeric.mask(negative, 0.0).fillna(0.0).astype(float), error_log
+
+
+def normalize_weight_columns(df, columns, row_offset=1):
+    """对DataFrame中的多个重量列做normalize_weight_values
+
+    Args:
+        df: 数据表
+        columns: {列名: 日志中使用的名称}，不存在的列会跳过
+        row_offset: 容错日志中的行号 = 行索引 + row_offset
+
+    Returns:
+        tuple: (替换了重量列的DataFrame副本, 容错日志列表)
+    """
+    df = df.copy()
+    error_log = []
+    for col, label in columns.items():
+        if col in df.columns:
+            df[col], col_log = normalize_weight_values(df[col], label, row_offset)
+            error_log.extend(col_log)
+    return df, error_log
@@ -0,0 +1,19 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Intermediate module for typed columnar artifacts (Feather/Parquet) written alongside the xlsx outputs.
+"""
+
+from shipping_processor.intermediate.columnar import (
+    IntermediateWriter, load_manifest, read_table, read_intermediate, intermediate_for_xlsx, pyarrow_available
+)
+
+__all__ = [
+    'IntermediateWriter',
+    'load_manifest',
+    'read_table',
+    'read_intermediate',
+    'intermediate_for_xlsx',
+    'pyarrow_available'
+]
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Columnar intermediate artifacts.
+
+cif_original_invoice.xlsx、pl_original_invoice.xlsx等中间结果在验证程序、check_*.py和报表任务中
+都要重新解析xlsx，速度慢且丢失列类型。处理程序可以另外把带类型的中间DataFrame写成Feather或Parquet
+文件(需要pyarrow)，并在manifest.json中记录每个文件的名称、来源变量、行数、列类型和对应的xlsx文件。
+
+Feather文件不压缩写出，读取时用内存映射，数值列不需要复制；Parquet文件更小，适合保存和传输。
+
+对应xlsx文件的条目记录该xlsx写出后的大小和修改时间，读取方用intermediate_for_xlsx查找时，
+xlsx之后被重新生成(而中间文件没有更新)的条目不会被使用。
+"""
+
+import json
+import os
+import re
+import tempfile
+import time
+
+import pandas as pd
+
+FORMATS = ('feather', 'parquet')
+DIR_NAME = 'intermediate'
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+
+def pyarrow_available():
+    """是否安装了pyarrow(写入和读取中间文件都需要)"""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def intermediate_dir(output_dir):
+    return os.path.join(output_dir, DIR_NAME)
+
+
+def _file_stat(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _arrow_safe(df):
+    """转换为pyarrow可以写出的形式: 列名为字符串，数字和文字混合的object列转为文字(空值保留)"""
+    import pyarrow as pa
+
+    frame = df.reset_index(drop=True)
+    frame.columns = [str(col) for col in frame.columns]
+    for col in frame.columns:
+        if frame[col].dtype == object:
+            try:
+                pa.array(frame[col], from_pandas=True)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                frame[col] = frame[col].map(lambda value: value if pd.isna(value) else str(value))
+    return frame
+
+
+def _safe_name(name):
+    return re.sub(r'[^\w.-]+', '_', name, flags=re.UNICODE)
+
+
+class IntermediateWriter:
+    """把中间DataFrame写到<输出目录>/intermediate/，每写一个文件都更新manifest.json
+
+    Args:
+        output_dir: 处理程序的输出目录
+        fmt: 'feather'或'parquet'
+    """
+
+    def __init__(self, output_dir, fmt='feather'):
+        if fmt not in FORMATS:
+            raise ValueError(f"不支持的中间文件格式: {fmt} (可用: {', '.join(FORMATS)})")
+        if not pyarrow_available():
+            raise ImportError("写出Feather/Parquet中间文件需要安装pyarrow: pip install pyarrow")
+        self.directory = intermediate_dir(output_dir)
+        self.fmt = fmt
+        self.entries = {}
+        os.makedirs(self.directory, exist_ok=True)
+        # 同一输出目录中上次运行留下的中间文件不再有效
+        for name in os.listdir(self.directory):
+            if name == MANIFEST_NAME or name.endswith(('.feather', '.parquet')):
+                os.remove(os.path.join(self.directory, name))
+
+    def write(self, name, df, frame=None, xlsx=None, **meta):
+        """写出一个中间DataFrame
+
+        Args:
+            name: 中间文件名称(manifest中的键)
+            df: 数据
+            frame: 来源变量名称，例如result_df
+            xlsx: 对应的xlsx文件路径(首个工作表就是这份数据时)，已写出时记录其大小和修改时间
+            meta: 其他记录在manifest中的信息，例如project、factory
+
+        Returns:
+            str: 写出的文件路径
+        """
+        table = _arrow_safe(df)
+        file_name = f"{_safe_name(name)}.{self.fmt}"
+        path = os.path.join(self.directory, file_name)
+        if self.fmt == 'feather':
+            # 不压缩，读取时可以直接内存映射
+            table.to_feather(path, compression='uncompressed')
+        else:
+            table.to_parquet(path, index=False)
+
+        entry = {
+            'file': file_name,
+            'format': self.fmt,
+            'frame': frame or name,
+            'rows': len(table),
+            'columns': {col: str(dtype) for col, dtype in table.dtypes.items()},
+        }
+        if xlsx is not None:
+            entry['xlsx'] = os.path.basename(xlsx)
+            if os.path.exists(xlsx):
+                entry['xlsx_stat'] = _file_stat(xlsx)
+        entry.update(meta)
+        self.entries[name] = entry
+        self._save_manifest()
+        return path
+
+    def _save_manifest(self):
+        manifest = {'version': MANIFEST_VERSION, 'created_at': time.time(), 'entries': self.entries}
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, os.path.join(self.directory, MANIFEST_NAME))
+
+
+def load_manifest(output_dir):
+    """读取manifest.json，不存在时返回None"""
+    try:
+        with open(os.path.join(intermediate_dir(output_dir), MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get('version') == MANIFEST_VERSION else None
+
+
+def read_table(output_dir, name, columns=None):
+    """读取中间文件为pyarrow.Table(Feather文件内存映射，数值列不复制)
+
+    Args:
+        output_dir: 处理程序的输出目录
+        name: manifest中的名称
+        columns: 只读取的列
+
+    Returns:
+        pyarrow.Table
+    """
+    entry = load_manifest(output_dir)['entries'][name]
+    path = os.path.join(intermediate_dir(output_dir), entry['file'])
+    if entry['format'] == 'feather':
+        import pyarrow.feather as feather
+        return feather.read_table(path, columns=columns, memory_map=True)
+    import pyarrow.parquet as parquet
+    return parquet.read_table(path, columns=columns, memory_map=True)
+
+
+def read_intermediate(output_dir, name, columns=None):
+    """读取中间文件为DataFrame"""
+    return read_table(output_dir, name, columns).to_pandas(split_blocks=True, self_destruct=True)
+
+
+def intermediate_for_xlsx(xlsx_path):
+    """查找与xlsx文件对应且仍然有效的中间文件
+
+    Returns:
+        tuple: (输出目录, 名称)；没有对应的中间文件、未安装pyarrow或xlsx已被重新生成时返回None
+    """
+    output_dir = os.path.dirname(os.path.abspath(xlsx_path))
+    manifest = load_manifest(output_dir)
+    if manifest is None or not pyarrow_available():
+        return None
+    for name, entry in manifest['entries'].items():
+        if entry.get('xlsx') != os.path.basename(xlsx_path) or 'xlsx_stat' not in entry:
+            continue
+        try:
+            if entry['xlsx_stat'] == _file_stat(xlsx_path):
+                return output_dir, name
+        except OSError:
+            return None
+    return None
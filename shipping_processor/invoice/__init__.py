@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Invoice module for building invoice and packing list documents.
+"""
+
+import importlib
+
+from shipping_processor.invoice.document import InvoiceDocument
+
+# 可选阶段(按供应商汇总、发票行文件)和发票号分配的模块在首次访问时才导入
+_LAZY_ATTRIBUTES = {
+    'supplier_breakdown': 'shipping_processor.invoice.breakdown',
+    'InvoiceLineWriter': 'shipping_processor.invoice.lines',
+    'invoice_lines': 'shipping_processor.invoice.lines',
+    'InvoiceNumberAllocator': 'shipping_processor.invoice.numbering',
+    'DeterministicNumbers': 'shipping_processor.invoice.numbering',
+    'number_source': 'shipping_processor.invoice.numbering',
+}
+
+__all__ = [
+    'InvoiceDocument',
+    'supplier_breakdown',
+    'InvoiceLineWriter',
+    'invoice_lines',
+    'InvoiceNumberAllocator',
+    'DeterministicNumbers',
+    'number_source'
+]
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        return getattr(importlib.import_module(_LAZY_ATTRIBUTES[name]), name)
+    raise AttributeError(f"module 'shipping_processor.invoice' has no attribute '{name}'")
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Per-supplier breakdown of a consolidated CIF invoice.
+
+多个装箱单合并处理时，运保费按合并后的总净重分摊。按来源装箱单(供应商)汇总CIF发票中的
+数量、净重、采购总价、FOB总价、分摊的运保费和CIF总价，便于核对和分别结算。
+"""
+
+import pandas as pd
+
+SUPPLIER_COLUMN = 'Supplier'
+
+# (汇总列, CIF发票中的列)
+BREAKDOWN_COLUMNS = [
+    ('Qty', 'Qty'),
+    ('Net Weight (kg)', 'net weight'),
+    ('采购总价', '采购总价'),
+    ('FOB总价', 'FOB总价'),
+    ('运保费', '该项对应的运保费'),
+    ('CIF总价(RMB)', 'CIF总价(FOB总价+运保费)'),
+]
+
+
+def supplier_breakdown(cif_df, sources, exchange_rate=None):
+    """按供应商汇总CIF发票
+
+    Args:
+        cif_df: CIF发票数据(索引与sources对齐)
+        sources: 每行的供应商名称
+        exchange_rate: 汇率(每元人民币兑美元，与政策文件相同)，提供时增加USD金额列
+
+    Returns:
+        pd.DataFrame: 每个供应商一行(按首次出现的顺序)，最后一行为合计
+    """
+    labels = sources.reindex(cif_df.index)
+    values = pd.DataFrame({name: pd.to_numeric(cif_df[col], errors='coerce') if col in cif_df.columns else 0.0
+                           for name, col in BREAKDOWN_COLUMNS}, index=cif_df.index)
+    grouped = values.groupby(labels, sort=False).sum()
+    grouped.insert(0, 'Rows', labels.value_counts(sort=False).reindex(grouped.index))
+    grouped.loc['Total'] = grouped.sum()
+    if exchange_rate:
+        grouped['CIF总价(USD)'] = grouped['CIF总价(RMB)'] * exchange_rate
+    return grouped.rename_axis(SUPPLIER_COLUMN).reset_index()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Sectioned invoice / packing list document.
+
+发票和装箱单在内存中按区段保存: 表头(列名)、数据行、合计行、金额大写行和页脚行。
+编号和合计只在类型不变的数据区段上计算，写出时按顺序输出各区段，
+不再把文字行拼接进数据后再用正则拆开。
+"""
+
+import pandas as pd
+
+# 合计行默认保留的小数位数(重量、体积)，浮点求和的尾差不写入输出
+TOTAL_DECIMALS = 2
+
+
+class InvoiceDocument:
+    """按区段组织的发票/装箱单
+
+    Args:
+        data: 数据行
+        columns: 输出列顺序，默认为data的列；data中缺少的列补为空值
+    """
+
+    def __init__(self, data, columns=None):
+        self.columns = list(columns) if columns is not None else list(data.columns)
+        self.data = data.reindex(columns=self.columns).reset_index(drop=True)
+        self.total = None
+        self.words = []
+        self.footer = []
+
+    def renumber(self, column='S/N', start=1):
+        """数据行重新编号"""
+        if column in self.columns and not self.data.empty:
+            self.data[column] = range(start, start + len(self.data))
+
+    def set_total(self, label_column, sum_columns, label='Total', fill=None, values=None, decimals=None):
+        """计算合计行
+
+        Args:
+            label_column: 写入合计标签的列
+            sum_columns: 求和的列(不存在的列跳过)，非数值按0计算
+            label: 合计标签
+            fill: 其他列的值
+            values: 额外指定的列值
+            decimals: {求和列: 保留的小数位数}，未列出的列保留TOTAL_DECIMALS位
+
+        Returns:
+            dict: {求和列: 合计值}
+        """
+        decimals = decimals or {}
+        totals = {col: round(pd.to_numeric(self.data[col], errors='coerce').fillna(0).sum(),
+                             decimals.get(col, TOTAL_DECIMALS))
+                  for col in sum_columns if col in self.columns}
+        row = {col: fill for col in self.columns}
+        row.update(totals)
+        row.update(values or {})
+        row[label_column] = label
+        self.total = row
+        return totals
+
+    def set_words(self, values, blank_rows=1, fill=''):
+        """金额大写行，前面可以空出若干行
+
+        Args:
+            values: {列: 值}
+            blank_rows: 合计行和大写行之间的空行数
+            fill: 其他列的值
+        """
+        blank = {col: fill for col in self.columns}
+        row = dict(blank)
+        row.update(values)
+        self.words = [dict(blank) for _ in range(blank_rows)] + [row]
+
+    def set_footer(self, lines, column='S/N'):
+        """页脚行，每行文字写在指定列"""
+        self.footer = [{column: line} for line in lines]
+
+    def trailer_rows(self):
+        """数据区段之后的所有行(合计、空行、大写、页脚)"""
+        rows = [self.total] if self.total is not None else []
+        return rows + self.words + self.footer
+
+    def to_frame(self):
+        """拼成一个DataFrame(供仍需要整表的地方使用，只拼接一次)"""
+        trailer = self.trailer_rows()
+        if not trailer:
+            return self.data.copy()
+        return pd.concat([self.data, pd.DataFrame(trailer, columns=self.columns)], ignore_index=True)
+
+    def to_excel(self, writer, sheet_name):
+        """按区段顺序写到ExcelWriter(openpyxl)的工作表中: 表头和数据行，然后是其后的各行
+
+        其后的各行直接写到工作表中，追加模式(mode='a')的writer不允许再次对同一工作表调用to_excel。
+        """
+        self.data.to_excel(writer, sheet_name=sheet_name, index=False)
+        ws = writer.sheets[sheet_name]
+        first_row = len(self.data) + 2  # 表头占第1行
+        for offset, row in enumerate(self.trailer_rows()):
+            for col_idx, col in enumerate(self.columns, 1):
+                value = row.get(col)
+                if value is not None and not (isinstance(value, float) and pd.isna(value)):
+                    ws.cell(row=first_row + offset, column=col_idx, value=value)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Machine-readable invoice line exports.
+
+ERP导入发票行时不需要表头、合计行、金额大写和页脚。处理程序可以直接用内存中合并后的发票数据
+(与写入xlsx发票工作表的数据行相同)为每张发票写出一个CSV或JSON Lines文件，每行一条发票行，
+字段名固定，不随发票类型变化。
+"""
+
+import os
+
+import pandas as pd
+
+FORMATS = ('csv', 'jsonl')
+DIR_NAME = 'invoice_lines'
+
+# (输出字段, 发票数据中的候选列)；出口发票的品名列为'名称'，复进口发票为'Commodity Description (Customs)'
+LINE_FIELDS = [
+    ('sn', ['S/N']),
+    ('part_number', ['Part Number']),
+    ('description', ['Commodity Description (Customs)', '名称']),
+    ('unit_price_usd', ['Unit Price (CIF, USD)']),
+    ('quantity', ['Quantity']),
+    ('unit', ['Unit']),
+    ('amount_usd', ['Total Amount (CIF, USD)']),
+    ('net_weight_kg', ['Total Net Weight (kg)']),
+]
+
+
+def invoice_lines(invoice_df, invoice_no, invoice_type, project=None, factory=None):
+    """把发票数据行转换为固定字段的发票行
+
+    Args:
+        invoice_df: 合并后的发票数据行(不含合计行和页脚)
+        invoice_no: 发票号(即发票工作表名称)
+        invoice_type: 'export'或'reimport'
+        project: 项目，出口发票为None
+        factory: 工厂，出口发票为None
+
+    Returns:
+        pd.DataFrame: 列为invoice_no、invoice_type、LINE_FIELDS中的字段、project和factory
+    """
+    lines = pd.DataFrame(index=invoice_df.index)
+    lines['invoice_no'] = invoice_no
+    lines['invoice_type'] = invoice_type
+    for field, candidates in LINE_FIELDS:
+        source = next((col for col in candidates if col in invoice_df.columns), None)
+        lines[field] = invoice_df[source] if source is not None else None
+    lines['project'] = project
+    lines['factory'] = factory
+    return lines.reset_index(drop=True)
+
+
+class InvoiceLineWriter:
+    """把每张发票的发票行写到<输出目录>/invoice_lines/<发票号>.csv或.jsonl
+
+    Args:
+        output_dir: 处理程序的输出目录
+        fmt: 'csv'或'jsonl'
+    """
+
+    def __init__(self, output_dir, fmt='csv'):
+        if fmt not in FORMATS:
+            raise ValueError(f"不支持的发票行格式: {fmt} (可用: {', '.join(FORMATS)})")
+        self.directory = os.path.join(output_dir, DIR_NAME)
+        self.fmt = fmt
+        self.paths = []
+        os.makedirs(self.directory, exist_ok=True)
+        # 上次运行的发票号不同，留下的文件会被误认为本次的发票
+        for name in os.listdir(self.directory):
+            if name.endswith(('.csv', '.jsonl')):
+                os.remove(os.path.join(self.directory, name))
+
+    def write(self, invoice_df, invoice_no, invoice_type, project=None, factory=None):
+        """写出一张发票的发票行
+
+        Returns:
+            str: 写出的文件路径
+        """
+        lines = invoice_lines(invoice_df, invoice_no, invoice_type, project, factory)
+        path = os.path.join(self.directory, f"{invoice_no}.{self.fmt}")
+        if self.fmt == 'csv':
+            lines.to_csv(path, index=False, encoding='utf-8')
+        else:
+            lines.to_json(path, orient='records', lines=True, force_ascii=False)
+        self.paths.append(path)
+        print(f"发票行已保存到: {path} ({len(lines)}行)")
+        return path
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Invoice number allocation.
+
+发票号(同时用作发票工作表名称)的分配方式:
+
+- counter: 计数器保存在SQLite数据库中，按(前缀, 日期)递增，格式为<前缀><YYYYMMDD><4位以上序号>。
+  分配在IMMEDIATE事务中完成，多个线程、批量处理子进程和服务进程同时分配也不会得到相同的号码。
+  一个任务的多张发票(每个工厂一张复进口发票)一次预留一段连续号码。
+- deterministic: 由输入文件内容的哈希得到号码，格式为<前缀><12位哈希数字><4位序号>，
+  相同输入重新运行得到相同的发票号，输出可以缓存和比较。位数与counter号码不同，两种号码不会重复。
+
+原来按当天已过秒数计算序号(int(seconds / 86400 * 10000))，8.6秒内启动的两个任务会得到相同的号码，
+每次重新运行号码也会变化。
+"""
+
+import datetime
+import hashlib
+import os
+import sqlite3
+import time
+
+MODES = ('counter', 'deterministic')
+
+# 默认计数器数据库放在项目根目录，批量处理子进程切换工作目录后仍使用同一个数据库
+DEFAULT_DB_PATH = os.environ.get(
+    'INVOICE_NUMBER_DB',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'invoice_numbers.db'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (
+    prefix TEXT NOT NULL,
+    date TEXT NOT NULL,
+    last_serial INTEGER NOT NULL,
+    PRIMARY KEY (prefix, date)
+);
+CREATE TABLE IF NOT EXISTS reservations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    prefix TEXT NOT NULL,
+    date TEXT NOT NULL,
+    first_serial INTEGER NOT NULL,
+    last_serial INTEGER NOT NULL,
+    job TEXT,
+    created_at REAL NOT NULL
+);
+"""
+
+
+def inputs_key(paths):
+    """输入文件内容的SHA-256(按给定顺序)，作为确定性发票号的来源"""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class InvoiceNumberAllocator:
+    """SQLite计数器分配发票号，每次操作使用独立的连接，可以在多个线程和进程中同时使用
+
+    Args:
+        db_path: 计数器数据库路径，默认为项目根目录的invoice_numbers.db(可用环境变量INVOICE_NUMBER_DB指定)
+        job: 记录在预留记录中的任务说明(例如输出目录)
+    """
+
+    def __init__(self, db_path=None, job=None):
+        self.db_path = os.path.abspath(db_path or DEFAULT_DB_PATH)
+        self.job = job
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def reserve(self, prefix, count=1, date=None):
+        """预留一段连续的发票号
+
+        Args:
+            prefix: 发票号前缀，例如CXCI、RECI
+            count: 号码个数
+            date: YYYYMMDD，默认为今天
+
+        Returns:
+            list: 发票号
+        """
+        if count <= 0:
+            return []
+        date = date or datetime.date.today().strftime('%Y%m%d')
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute("SELECT last_serial FROM counters WHERE prefix = ? AND date = ?",
+                               (prefix, date)).fetchone()
+            first = (row[0] if row else 0) + 1
+            last = first + count - 1
+            conn.execute("INSERT INTO counters (prefix, date, last_serial) VALUES (?, ?, ?) "
+                         "ON CONFLICT (prefix, date) DO UPDATE SET last_serial = excluded.last_serial",
+                         (prefix, date, last))
+            conn.execute("INSERT INTO reservations (prefix, date, first_serial, last_serial, job, created_at) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", (prefix, date, first, last, self.job, time.time()))
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        return [f"{prefix}{date}{serial:04d}" for serial in range(first, last + 1)]
+
+
+class DeterministicNumbers:
+    """由输入哈希得到发票号，每个前缀的序号从0001开始，同一实例中多次预留时接着编号
+
+    Args:
+        key: 输入文件内容的哈希(十六进制)，见inputs_key
+    """
+
+    def __init__(self, key):
+        self.token = int(key[:16], 16) % 10 ** 12
+        self.last_serial = {}
+
+    def reserve(self, prefix, count=1, date=None):
+        first = self.last_serial.get(prefix, 0) + 1
+        self.last_serial[prefix] = first + max(count, 0) - 1
+        return [f"{prefix}{self.token:012d}{serial:04d}" for serial in range(first, first + count)]
+
+
+def number_source(mode='counter', inputs=None, db_path=None, job=None):
+    """按分配方式创建发票号来源
+
+    Args:
+        mode: 'counter'或'deterministic'
+        inputs: 输入文件路径(deterministic时需要)
+        db_path: 计数器数据库路径(counter时使用)
+        job: 预留记录中的任务说明
+
+    Returns:
+        InvoiceNumberAllocator或DeterministicNumbers，都提供reserve(prefix, count)
+    """
+    if mode == 'deterministic':
+        return DeterministicNumbers(inputs_key(inputs))
+    if mode == 'counter':
+        return InvoiceNumberAllocator(db_path, job=job)
+    raise ValueError(f"不支持的发票号分配方式: {mode} (可用: {', '.join(MODES)})")
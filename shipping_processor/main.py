@@ -9,30 +9,53 @@ This module maintains the original API while we gradually refactor.
 import os
 import sys
 import importlib.util
-import pandas as pd
 
 # First attempt to import from the original module if it exists
 original_module_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'process_shipping_list.py')
+_original_module = None
+
+
+def load_original_module():
+    """Load process_shipping_list.py on first use (it pulls in pandas/openpyxl and is large)."""
+    global _original_module
+    if _original_module is None:
+        spec = importlib.util.spec_from_file_location("original_process_shipping_list", original_module_path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _original_module = module
+    return _original_module
+
+
 if os.path.exists(original_module_path):
-    # Dynamically import the original module
-    spec = importlib.util.spec_from_file_location("original_process_shipping_list", original_module_path)
-    original_module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(original_module)
-    
     # Use the original implementation for now
-    def process_shipping_list(packing_list_file, policy_file, output_dir='outputs'):
+    def process_shipping_list(packing_list_file, policy_file, output_dir='outputs', validate_in_memory=False,
+                              progress_callback=None, xml_merge=False, supplier_breakdown=False,
+                              in_process_merge=False, intermediates=None, invoice_lines=None, render_xlsx=True,
+                              invoice_numbering='counter', invoice_number_db=None):
         """
         Main function to process a shipping list.
         This is a thin wrapper around the original implementation for now.
         
         Args:
-            packing_list_file (str): Path to the packing list Excel file
+            packing_list_file (str or list): Path to the packing list Excel file, or several
+                packing lists shipped under one policy (processed as one consolidated shipment)
             policy_file (str): Path to the policy Excel file 
             output_dir (str): Directory to save output files
+            validate_in_memory (bool): Run validation checks on in-memory frames before writing
+            progress_callback (callable): Called with each stage name in PROCESS_STAGES
+            xml_merge (bool): Splice header/content/footer sheets at the XML level
+            supplier_breakdown (bool): Also write a per-supplier summary (supplier_breakdown.xlsx)
+            in_process_merge (bool): Run the template merge in this process instead of a merge.py subprocess
+            intermediates (str): Also write typed intermediate frames ('feather' or 'parquet', needs pyarrow)
+            invoice_lines (str): Also write per-invoice line files ('csv' or 'jsonl') for ERP import
+            render_xlsx (bool): Set to False to only compute the invoice data and write no xlsx files
+            invoice_numbering (str): 'counter' (atomic SQLite counter) or 'deterministic' (derived from the inputs)
+            invoice_number_db (str): Path of the invoice number counter database (counter numbering only)
             
         Returns:
             None
         """
+        original_module = load_original_module()
         try:
             # Attempt to use refactored input modules as a test
             from shipping_processor.input import read_excel_file, read_policy_file
@@ -44,14 +67,44 @@ if os.path.exists(original_module_path):
             print("INFO: Testing refactored modules along with original implementation")
             
             # But still call the original implementation
-            return original_module.process_shipping_list(packing_list_file, policy_file, output_dir)
+            return original_module.process_shipping_list(packing_list_file, policy_file, output_dir,
+                                                         validate_in_memory=validate_in_memory,
+                                                         progress_callback=progress_callback,
+                                                         xml_merge=xml_merge,
+                                                         supplier_breakdown=supplier_breakdown,
+                                                         in_process_merge=in_process_merge,
+                                                         intermediates=intermediates,
+                                                         invoice_lines=invoice_lines,
+                                                         render_xlsx=render_xlsx,
+                                                         invoice_numbering=invoice_numbering,
+                                                         invoice_number_db=invoice_number_db)
         except ImportError as e:
             print(f"WARNING: Could not import refactored modules: {e}")
-            return original_module.process_shipping_list(packing_list_file, policy_file, output_dir)
+            return original_module.process_shipping_list(packing_list_file, policy_file, output_dir,
+                                                         validate_in_memory=validate_in_memory,
+                                                         progress_callback=progress_callback,
+                                                         xml_merge=xml_merge,
+                                                         supplier_breakdown=supplier_breakdown,
+                                                         in_process_merge=in_process_merge,
+                                                         intermediates=intermediates,
+                                                         invoice_lines=invoice_lines,
+                                                         render_xlsx=render_xlsx,
+                                                         invoice_numbering=invoice_numbering,
+                                                         invoice_number_db=invoice_number_db)
         except Exception as e:
             print(f"ERROR in refactored modules: {e}")
             # Fall back to original implementation
-            return original_module.process_shipping_list(packing_list_file, policy_file, output_dir)
+            return original_module.process_shipping_list(packing_list_file, policy_file, output_dir,
+                                                         validate_in_memory=validate_in_memory,
+                                                         progress_callback=progress_callback,
+                                                         xml_merge=xml_merge,
+                                                         supplier_breakdown=supplier_breakdown,
+                                                         in_process_merge=in_process_merge,
+                                                         intermediates=intermediates,
+                                                         invoice_lines=invoice_lines,
+                                                         render_xlsx=render_xlsx,
+                                                         invoice_numbering=invoice_numbering,
+                                                         invoice_number_db=invoice_number_db)
 else:
     # If original module doesn't exist, implement the function here
     # This will be our final implementation once refactoring is complete
@@ -0,0 +1,19 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Merge module for assembling header, content and footer sheets.
+"""
+
+from shipping_processor.merge.templates import (
+    load_template, append_compiled_sheet, placeholder_cells, precompile_templates
+)
+from shipping_processor.merge.splice import splice_three_excel_files
+
+__all__ = [
+    'load_template',
+    'append_compiled_sheet',
+    'placeholder_cells',
+    'precompile_templates',
+    'splice_three_excel_files'
+]
@@ -0,0 +1,620 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+XML-level sheet splicing writer.
+
+merge_three_excel_files(merge.py)通过openpyxl为每个模板单元格和数据单元格创建Cell对象。
+这里直接在xlsx的XML层面拼接工作表: 逐行流式读取表头模板、中间文件和页脚模板的<sheetData>，
+按行偏移改写行号和单元格引用，把各文件的样式序号重新映射到同一个styles.xml中，
+然后用zipfile写出结果，全程不创建openpyxl单元格对象。
+
+输出与merge_three_excel_files一致: 单元格值(按data_only读取，公式只保留缓存值)、样式、
+合并区域、列宽(按表头名称)和LAYOUT_*定义名称；与原实现一样不复制行高。
+"""
+
+import os
+import re
+import tempfile
+import zipfile
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape, quoteattr
+
+from openpyxl.utils.cell import column_index_from_string, get_column_letter, range_boundaries
+
+from shipping_processor.merge.templates import placeholder_cells
+
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PKG_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+# 工作簿级定义名称前缀: LAYOUT_<工作表序号>_<HEADER|DATA|TOTAL|FOOTER>(merge.py也使用这两个常量)
+LAYOUT_NAME_PREFIX = 'LAYOUT_'
+TOTAL_ROW_MARKERS = ('Total', 'TOTAL', 'total', '合计', '总计')
+
+# 与merge.apply_column_widths的默认列宽相同
+DEFAULT_COLUMN_WIDTHS = {
+    'Material code': 35,
+    'Unit Price': 20,
+    'DESCRIPTION': 30,
+    'default': 15
+}
+
+# openpyxl读取没有width属性的<col>时使用的列宽
+DEFAULT_COL_ELEMENT_WIDTH = 13.0
+
+CELL_REF = re.compile(r'^([A-Z]+)(\d+)$')
+
+ROW_TAG = f'{{{MAIN_NS}}}row'
+V_TAG = f'{{{MAIN_NS}}}v'
+IS_TAG = f'{{{MAIN_NS}}}is'
+T_TAG = f'{{{MAIN_NS}}}t'
+R_TAG = f'{{{MAIN_NS}}}r'
+MERGE_CELL_TAG = f'{{{MAIN_NS}}}mergeCell'
+COL_TAG = f'{{{MAIN_NS}}}col'
+
+CONTENT_TYPES = {
+    'workbook': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml',
+    'worksheet': 'application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml',
+    'styles': 'application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml',
+    'theme': 'application/vnd.openxmlformats-officedocument.theme+xml',
+}
+
+
+def _local(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _clean(elem):
+    """去掉命名空间，只保留主命名空间的元素和不带命名空间的属性(用于样式元素的比较和写出)"""
+    if elem.tag.startswith('{') and not elem.tag.startswith('{' + MAIN_NS + '}'):
+        return None
+    cleaned = ET.Element(_local(elem.tag), {k: v for k, v in elem.attrib.items() if not k.startswith('{')})
+    if elem.text and elem.text.strip():
+        cleaned.text = elem.text
+    for child in elem:
+        child = _clean(child)
+        if child is not None:
+            cleaned.append(child)
+    return cleaned
+
+
+def _text_of(elem):
+    """共享字符串<si>或内联字符串<is>的文本(与openpyxl一样忽略富文本格式和注音)"""
+    text = elem.find(T_TAG)
+    if text is not None:
+        return text.text or ''
+    return ''.join(run.text or '' for run in elem.iterfind(f'{R_TAG}/{T_TAG}'))
+
+
+class _Pool:
+    """按XML内容去重的元素列表"""
+
+    def __init__(self):
+        self.items = []
+        self.index = {}
+
+    def add(self, elem):
+        key = ET.tostring(elem, encoding='unicode')
+        if key not in self.index:
+            self.index[key] = len(self.items)
+            self.items.append(elem)
+        return self.index[key]
+
+    def to_xml(self, tag):
+        body = ''.join(ET.tostring(item, encoding='unicode') for item in self.items)
+        return f'<{tag} count="{len(self.items)}">{body}</{tag}>'
+
+
+class StyleTable:
+    """合并多个工作簿的styles.xml，记录每个工作簿的单元格样式序号到合并后序号的映射"""
+
+    def __init__(self):
+        self.num_formats = {}
+        self.fonts = _Pool()
+        self.fills = _Pool()
+        self.borders = _Pool()
+        self.style_xfs = _Pool()
+        self.cell_xfs = _Pool()
+        self.cell_styles = {}
+        # Excel要求前两个填充固定为none和gray125
+        self.fills.add(ET.fromstring('<fill><patternFill patternType="none"/></fill>'))
+        self.fills.add(ET.fromstring('<fill><patternFill patternType="gray125"/></fill>'))
+
+    def _remap_xf(self, xf, num_fmt_map, font_map, fill_map, border_map, style_xf_map=None):
+        xf = _clean(xf)
+        for attr, mapping in (('numFmtId', num_fmt_map), ('fontId', font_map),
+                              ('fillId', fill_map), ('borderId', border_map), ('xfId', style_xf_map)):
+            if attr in xf.attrib and mapping is not None:
+                value = int(xf.get(attr))
+                if isinstance(mapping, dict):
+                    value = mapping.get(value, value)
+                elif value < len(mapping):
+                    value = mapping[value]
+                else:
+                    value = 0
+                xf.set(attr, str(value))
+        return xf
+
+    def add(self, styles_xml):
+        """加入一个工作簿的styles.xml
+
+        Returns:
+            list: 该工作簿单元格样式序号(cellXfs) -> 合并后的序号
+        """
+        root = ET.fromstring(styles_xml)
+
+        def children(name):
+            parent = root.find(f'{{{MAIN_NS}}}{name}')
+            return [] if parent is None else list(parent)
+
+        num_fmt_map = {}
+        for num_fmt in children('numFmts'):
+            code = num_fmt.get('formatCode')
+            if code not in self.num_formats:
+                self.num_formats[code] = max([163] + list(self.num_formats.values())) + 1
+            num_fmt_map[int(num_fmt.get('numFmtId'))] = self.num_formats[code]
+
+        font_map = [self.fonts.add(_clean(font)) for font in children('fonts')]
+        fill_map = [self.fills.add(_clean(fill)) for fill in children('fills')]
+        border_map = [self.borders.add(_clean(border)) for border in children('borders')]
+        style_xf_map = [self.style_xfs.add(self._remap_xf(xf, num_fmt_map, font_map, fill_map, border_map))
+                        for xf in children('cellStyleXfs')]
+        xf_map = [self.cell_xfs.add(self._remap_xf(xf, num_fmt_map, font_map, fill_map, border_map, style_xf_map))
+                  for xf in children('cellXfs')]
+
+        for cell_style in children('cellStyles'):
+            cell_style = _clean(cell_style)
+            name = cell_style.get('name')
+            if name not in self.cell_styles:
+                xf_id = int(cell_style.get('xfId', 0))
+                cell_style.set('xfId', str(style_xf_map[xf_id] if xf_id < len(style_xf_map) else 0))
+                self.cell_styles[name] = cell_style
+
+        return xf_map or [0]
+
+    def to_xml(self):
+        if not self.fonts.items:
+            self.fonts.add(ET.fromstring('<font><sz val="11"/><name val="Calibri"/></font>'))
+        if not self.borders.items:
+            self.borders.add(ET.fromstring('<border><left/><right/><top/><bottom/><diagonal/></border>'))
+        if not self.style_xfs.items:
+            self.style_xfs.add(ET.fromstring('<xf numFmtId="0" fontId="0" fillId="0" borderId="0"/>'))
+        if not self.cell_xfs.items:
+            self.cell_xfs.add(ET.fromstring('<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'))
+        if not self.cell_styles:
+            self.cell_styles['Normal'] = ET.fromstring('<cellStyle name="Normal" xfId="0" builtinId="0"/>')
+
+        parts = [f'<styleSheet xmlns="{MAIN_NS}">']
+        if self.num_formats:
+            formats = ''.join(f'<numFmt numFmtId="{num_id}" formatCode={quoteattr(code)}/>'
+                              for code, num_id in self.num_formats.items())
+            parts.append(f'<numFmts count="{len(self.num_formats)}">{formats}</numFmts>')
+        parts.append(self.fonts.to_xml('fonts'))
+        parts.append(self.fills.to_xml('fills'))
+        parts.append(self.borders.to_xml('borders'))
+        parts.append(self.style_xfs.to_xml('cellStyleXfs'))
+        parts.append(self.cell_xfs.to_xml('cellXfs'))
+        cell_styles = ''.join(ET.tostring(item, encoding='unicode') for item in self.cell_styles.values())
+        parts.append(f'<cellStyles count="{len(self.cell_styles)}">{cell_styles}</cellStyles>')
+        parts.append('<dxfs count="0"/><tableStyles count="0"/></styleSheet>')
+        return ''.join(parts)
+
+
+class XlsxSource:
+    """以只读方式打开的xlsx文件，按需读取工作表XML"""
+
+    def __init__(self, path):
+        self.path = path
+        self.zip = zipfile.ZipFile(path)
+        self.style_map = None
+
+        workbook = ET.fromstring(self.zip.read('xl/workbook.xml'))
+        rels = ET.fromstring(self.zip.read('xl/_rels/workbook.xml.rels'))
+        targets = {}
+        self.related = {}
+        for rel in rels:
+            target = rel.get('Target')
+            target = target.lstrip('/') if target.startswith('/') else 'xl/' + target
+            targets[rel.get('Id')] = target
+            self.related[rel.get('Type').rsplit('/', 1)[-1]] = target
+
+        self.sheets = {}
+        self.sheet_names = []
+        for sheet in workbook.iter(f'{{{MAIN_NS}}}sheet'):
+            self.sheet_names.append(sheet.get('name'))
+            self.sheets[sheet.get('name')] = targets[sheet.get(f'{{{REL_NS}}}id')]
+
+        view = workbook.find(f'{{{MAIN_NS}}}bookViews/{{{MAIN_NS}}}workbookView')
+        active = int(view.get('activeTab', 0)) if view is not None else 0
+        self.active_sheet = self.sheet_names[active if active < len(self.sheet_names) else 0]
+
+        self.shared_strings = []
+        if 'sharedStrings' in self.related:
+            for si in ET.fromstring(self.zip.read(self.related['sharedStrings'])):
+                self.shared_strings.append(_text_of(si))
+
+    def register_styles(self, styles):
+        """把本文件的样式加入StyleTable(只加入一次)，返回样式序号映射"""
+        if self.style_map is None:
+            path = self.related.get('styles')
+            self.style_map = styles.add(self.zip.read(path)) if path else [0]
+        return self.style_map
+
+    def theme_xml(self):
+        path = self.related.get('theme')
+        return self.zip.read(path) if path else None
+
+    def close(self):
+        self.zip.close()
+
+
+class SheetPart:
+    """流式读取一个工作表: rows()逐行返回单元格，读完后merges、cols、max_row和max_column可用"""
+
+    def __init__(self, source, sheet_name):
+        self.source = source
+        self.sheet_name = sheet_name
+        self.merges = []
+        self.cols = {}
+        self.row_heights = {}
+        self.max_row = 0
+        self.max_column = 0
+
+    def _cell_value(self, cell):
+        """按data_only的方式读取单元格值
+
+        Returns:
+            tuple: (类型, 文本)，类型为'inlineStr'、'n'、'b'、'e'或'd'；没有值时文本为None
+        """
+        kind = cell.get('t', 'n')
+        if kind == 'inlineStr':
+            inline = cell.find(IS_TAG)
+            return 'inlineStr', (_text_of(inline) if inline is not None else None)
+        value = cell.find(V_TAG)
+        if value is None:
+            return 'n', None
+        value = value.text
+        if kind == 's':
+            return 'inlineStr', self.source.shared_strings[int(value)]
+        if kind == 'str':
+            return 'inlineStr', value
+        return kind, value
+
+    def rows(self):
+        """逐行返回(行号, [(列号, 样式序号, 类型, 文本), ...])"""
+        part = self.source.sheets[self.sheet_name]
+        row_counter = 0
+        with self.source.zip.open(part) as stream:
+            for _, elem in ET.iterparse(stream):
+                tag = elem.tag
+                if tag == ROW_TAG:
+                    row_counter = int(elem.get('r', row_counter + 1))
+                    cells = []
+                    col_counter = 0
+                    for cell in elem:
+                        match = CELL_REF.match(cell.get('r', ''))
+                        col_counter = column_index_from_string(match.group(1)) if match else col_counter + 1
+                        kind, value = self._cell_value(cell)
+                        cells.append((col_counter, int(cell.get('s', 0)), kind, value))
+                    if elem.get('ht'):
+                        self.row_heights[row_counter] = elem.get('ht')
+                    if cells:
+                        self.max_row = max(self.max_row, row_counter)
+                        self.max_column = max(self.max_column, cells[-1][0])
+                        yield row_counter, cells
+                    # 读完的行立即释放，大工作表也只占用一行的内存
+                    elem.clear()
+                elif tag == MERGE_CELL_TAG:
+                    min_col, min_row, max_col, max_row = range_boundaries(elem.get('ref'))
+                    self.merges.append((min_row, min_col, max_row, max_col))
+                    # 与openpyxl一样，合并区域边缘的单元格也计入工作表范围
+                    self.max_row = max(self.max_row, max_row)
+                    self.max_column = max(self.max_column, max_col)
+                elif tag == COL_TAG:
+                    width = float(elem.get('width')) if elem.get('width') else DEFAULT_COL_ELEMENT_WIDTH
+                    self.cols[int(elem.get('min'))] = width
+
+    def row_count(self):
+        """openpyxl中的max_row: 空工作表为1"""
+        return max(self.max_row, 1)
+
+
+def _fill_template_grid(part):
+    """读取模板片段(很小，全部读入)，并补上XML中没有的单元格
+
+    append_sheet_with_offset遍历模板的整个区域，XML中没有的单元格也会以模板的默认样式写入目标工作表；
+    这里用模板的0号样式补上这些单元格(合并区域内的单元格除外)。
+    """
+    rows = dict(part.rows())
+    covered = set()
+    for min_row, min_col, max_row, max_col in part.merges:
+        covered.update((row, col) for row in range(min_row, max_row + 1) for col in range(min_col, max_col + 1))
+    for row_idx in range(1, part.max_row + 1):
+        cells = {cell[0]: cell for cell in rows.get(row_idx, [])}
+        for col_idx in range(1, part.max_column + 1):
+            if col_idx not in cells and (row_idx, col_idx) not in covered:
+                cells[col_idx] = (col_idx, 0, 'n', None)
+        if cells:
+            yield row_idx, [cells[col_idx] for col_idx in sorted(cells)]
+
+
+def _placeholder_value(value):
+    """占位单元格的值转换为(类型, 文本)，与SheetPart._cell_value的返回值相同"""
+    if value is None:
+        return 'n', None
+    if isinstance(value, bool):
+        return 'b', '1' if value else '0'
+    if isinstance(value, (int, float)):
+        return 'n', repr(value)
+    return 'inlineStr', str(value)
+
+
+def _cell_xml(ref, style, kind, value):
+    style_attr = f' s="{style}"' if style else ''
+    if value is None:
+        return f'<c r="{ref}"{style_attr}/>'
+    if kind == 'inlineStr':
+        return f'<c r="{ref}"{style_attr} t="inlineStr"><is><t xml:space="preserve">{escape(value)}</t></is></c>'
+    type_attr = '' if kind == 'n' else f' t="{kind}"'
+    return f'<c r="{ref}"{style_attr}{type_attr}><v>{escape(value)}</v></c>'
+
+
+def _layout_names(sheet_index, title, layout):
+    """与merge.write_sheet_layout相同的LAYOUT_*定义名称"""
+    max_col = get_column_letter(max(layout['content_max_column'], 1))
+    quoted_title = title.replace("'", "''")
+    prefix = f"{LAYOUT_NAME_PREFIX}{sheet_index}_"
+    header_rows = layout['header_rows']
+    header_row = header_rows + 1
+    total_row = layout['content_total_row']
+    data_last_row = header_rows + (total_row - 1 if total_row else layout['content_max_row'])
+
+    def ref(first_row, last_row):
+        return f"'{quoted_title}'!$A${first_row}:${max_col}${last_row}"
+
+    names = [(prefix + 'HEADER', ref(header_row, header_row))]
+    if data_last_row > header_row:
+        names.append((prefix + 'DATA', ref(header_row + 1, data_last_row)))
+    if total_row:
+        names.append((prefix + 'TOTAL', ref(header_rows + total_row, header_rows + total_row)))
+    if layout['footer_rows']:
+        footer_first_row = header_rows + layout['content_max_row'] + 1
+        names.append((prefix + 'FOOTER', ref(footer_first_row, footer_first_row + layout['footer_rows'] - 1)))
+    return names
+
+
+def _write_sheet(out_zip, part_name, parts, content_position, styles, tab_selected, overrides=None):
+    """把多个工作表片段纵向拼接成一个工作表并写入输出文件
+
+    只有一个片段时与merge.copy_sheet一样保留原列宽和行高；拼接时与append_sheet_with_offset一样不复制行高，
+    列宽按中间文件的表头名称设置(merge.apply_column_widths)。
+
+    Args:
+        out_zip: 输出的ZipFile
+        part_name: 工作表在输出文件中的路径
+        parts: [(XlsxSource, 工作表名称), ...]，按从上到下的顺序
+        content_position: parts中中间文件内容所在的位置
+        styles: StyleTable
+        tab_selected: 是否为活动工作表
+        overrides: {片段位置: {(行, 列): 值}}，替换模板片段中占位单元格的值
+
+    Returns:
+        dict: 生成LAYOUT_*定义名称所需的行数信息
+    """
+    copy_only = len(parts) == 1
+    row_offset = 0
+    max_column = 0
+    merges = []
+    row1_values = {}
+    part_rows = []
+    layout = {'content_total_row': None}
+
+    with tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024, mode='w+', encoding='utf-8') as sheet_data:
+        for position, (source, sheet_name) in enumerate(parts):
+            style_map = source.register_styles(styles)
+            is_content = position == content_position
+            part = SheetPart(source, sheet_name)
+            header_names = {}
+            part_overrides = (overrides or {}).get(position, {})
+
+            rows = part.rows() if is_content else _fill_template_grid(part)
+            for row_idx, cells in rows:
+                target_row = row_offset + row_idx
+                xml_cells = []
+                for col_idx, style, kind, value in cells:
+                    if (row_idx, col_idx) in part_overrides:
+                        kind, value = _placeholder_value(part_overrides[(row_idx, col_idx)])
+                    mapped_style = style_map[style] if style < len(style_map) else 0
+                    xml_cells.append(_cell_xml(f"{get_column_letter(col_idx)}{target_row}", mapped_style, kind, value))
+                    if row_idx == 1:
+                        name = value if kind == 'inlineStr' else _number(kind, value)
+                        if target_row == 1:
+                            row1_values[col_idx] = name
+                        if is_content and name:
+                            header_names[col_idx] = name
+                    if (is_content and row_idx >= 2 and layout['content_total_row'] is None
+                            and kind == 'inlineStr' and value and value.strip() in TOTAL_ROW_MARKERS):
+                        layout['content_total_row'] = row_idx
+                height = part.row_heights.get(row_idx) if copy_only else None
+                row_attrs = f' ht="{height}" customHeight="1"' if height else ''
+                sheet_data.write(f'<row r="{target_row}"{row_attrs}>{"".join(xml_cells)}</row>')
+
+            for min_row, min_col, max_row, max_col in part.merges:
+                merges.append(f"{get_column_letter(min_col)}{min_row + row_offset}:"
+                              f"{get_column_letter(max_col)}{max_row + row_offset}")
+            if is_content:
+                # 与merge.py一样，按中间文件的表头名称记录列宽
+                column_widths = {name: part.cols[col] for col, name in header_names.items() if col in part.cols}
+                layout['content_max_row'] = part.row_count()
+                layout['content_max_column'] = max(part.max_column, 1)
+
+            rows = part.row_count()
+            part_rows.append(rows)
+            row_offset += rows
+            max_column = max(max_column, part.max_column)
+
+        max_column = max(max_column, 1)
+        cols = []
+        for col_idx in (sorted(part.cols) if copy_only else range(1, max_column + 1)):
+            if copy_only:
+                cols.append(f'<col min="{col_idx}" max="{col_idx}" width="{part.cols[col_idx]}" customWidth="1"/>')
+                continue
+            name = row1_values.get(col_idx)
+            if name in column_widths:
+                width = column_widths[name]
+            elif name in DEFAULT_COLUMN_WIDTHS:
+                width = DEFAULT_COLUMN_WIDTHS[name]
+            else:
+                width = DEFAULT_COLUMN_WIDTHS['default']
+            cols.append(f'<col min="{col_idx}" max="{col_idx}" width="{width}" customWidth="1"/>')
+
+        selected = ' tabSelected="1"' if tab_selected else ''
+        with out_zip.open(part_name, 'w', force_zip64=True) as out:
+            out.write((f'<worksheet xmlns="{MAIN_NS}" xmlns:r="{REL_NS}">'
+                       f'<dimension ref="A1:{get_column_letter(max_column)}{max(row_offset, 1)}"/>'
+                       f'<sheetViews><sheetView{selected} workbookViewId="0"/></sheetViews>'
+                       f'<sheetFormatPr defaultRowHeight="15"/>{"<cols>" + "".join(cols) + "</cols>" if cols else ""}'
+                       f'<sheetData>').encode('utf-8'))
+            sheet_data.seek(0)
+            for chunk in iter(lambda: sheet_data.read(1024 * 1024), ''):
+                out.write(chunk.encode('utf-8'))
+            out.write(b'</sheetData>')
+            if merges:
+                merge_xml = ''.join(f'<mergeCell ref="{ref}"/>' for ref in merges)
+                out.write(f'<mergeCells count="{len(merges)}">{merge_xml}</mergeCells>'.encode('utf-8'))
+            out.write(b'<pageMargins left="0.75" right="0.75" top="1" bottom="1" header="0.5" footer="0.5"/>'
+                      b'</worksheet>')
+
+    layout['header_rows'] = part_rows[0] if content_position > 0 else 0
+    layout['footer_rows'] = part_rows[-1] if content_position < len(parts) - 1 else 0
+    return layout
+
+
+def _number(kind, value):
+    """数值单元格的Python值(只用于按表头名称匹配列宽)"""
+    if value is None or kind != 'n':
+        return value
+    number = float(value)
+    return int(number) if number.is_integer() else number
+
+
+def _write_package(out_zip, sheet_titles, defined_names, styles, theme_xml):
+    """写出工作簿、关系、样式和内容类型等包部件"""
+    sheet_count = len(sheet_titles)
+    sheets_xml = ''.join(f'<sheet name={quoteattr(title)} sheetId="{i}" state="visible" r:id="rId{i}"/>'
+                         for i, title in enumerate(sheet_titles, 1))
+    names_xml = ''.join(f'<definedName name="{name}">{escape(ref)}</definedName>' for name, ref in defined_names)
+    out_zip.writestr('xl/workbook.xml', (
+        f'<workbook xmlns="{MAIN_NS}" xmlns:r="{REL_NS}"><workbookPr/>'
+        f'<bookViews><workbookView activeTab="0"/></bookViews><sheets>{sheets_xml}</sheets>'
+        f'<definedNames>{names_xml}</definedNames><calcPr calcId="124519" fullCalcOnLoad="1"/></workbook>'))
+
+    rels = [f'<Relationship Id="rId{i}" Type="{REL_NS}/worksheet" Target="worksheets/sheet{i}.xml"/>'
+            for i in range(1, sheet_count + 1)]
+    rels.append(f'<Relationship Id="rId{sheet_count + 1}" Type="{REL_NS}/styles" Target="styles.xml"/>')
+    overrides = [f'<Override PartName="/xl/worksheets/sheet{i}.xml" ContentType="{CONTENT_TYPES["worksheet"]}"/>'
+                 for i in range(1, sheet_count + 1)]
+    overrides.append(f'<Override PartName="/xl/workbook.xml" ContentType="{CONTENT_TYPES["workbook"]}"/>')
+    overrides.append(f'<Override PartName="/xl/styles.xml" ContentType="{CONTENT_TYPES["styles"]}"/>')
+    if theme_xml:
+        out_zip.writestr('xl/theme/theme1.xml', theme_xml)
+        rels.append(f'<Relationship Id="rId{sheet_count + 2}" Type="{REL_NS}/theme" Target="theme/theme1.xml"/>')
+        overrides.append(f'<Override PartName="/xl/theme/theme1.xml" ContentType="{CONTENT_TYPES["theme"]}"/>')
+
+    out_zip.writestr('xl/styles.xml', styles.to_xml())
+    out_zip.writestr('xl/_rels/workbook.xml.rels',
+                     f'<Relationships xmlns="{PKG_REL_NS}">{"".join(rels)}</Relationships>')
+    out_zip.writestr('_rels/.rels', (
+        f'<Relationships xmlns="{PKG_REL_NS}"><Relationship Id="rId1" '
+        f'Type="{REL_NS}/officeDocument" Target="xl/workbook.xml"/></Relationships>'))
+    out_zip.writestr('[Content_Types].xml', (
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        f'{"".join(overrides)}</Types>'))
+
+
+def splice_three_excel_files(first_file, middle_file, last_file, output_file,
+                             first_sheet_first_file=None, first_sheet_last_file=None, values=None):
+    """
+    与merge.merge_three_excel_files相同的合并，但在XML层面拼接工作表:
+    - 中间文件的第一个工作表为装箱单，提供first_sheet_first_file/first_sheet_last_file时与它们拼接
+    - 其余工作表为发票，与h.xlsx的第二个工作表(表头)和f.xlsx的活动工作表(页脚)拼接
+    - values({占位名称: 值})写入表头模板的占位单元格(公司名称/地址)
+
+    Returns:
+        bool: 是否成功
+    """
+    print(f"Merging files (XML splicing): {first_file}, {middle_file}, {last_file}")
+    sources = []
+
+    def open_source(path):
+        source = XlsxSource(path)
+        sources.append(source)
+        return source
+
+    temp_path = None
+    try:
+        middle = open_source(middle_file)
+        if not middle.sheet_names:
+            print(f"Error: Middle file must have at least 1 sheet")
+            return False
+        pl_sheet_name = middle.sheet_names[0]
+        invoice_sheet_names = middle.sheet_names[1:]
+        print(f"Found sheets in middle file:")
+        print(f"- Packing List: '{pl_sheet_name}'")
+        print(f"- Invoice sheets: {invoice_sheet_names}")
+
+        styles = StyleTable()
+        # 中间文件的样式最先加入，合并后的默认样式(序号0)来自中间文件
+        middle.register_styles(styles)
+
+        sheets = []
+        if first_sheet_first_file and first_sheet_last_file:
+            print(f"Merging {pl_sheet_name} with: {first_sheet_first_file}, {middle_file}, {first_sheet_last_file}")
+            pl_first = open_source(first_sheet_first_file)
+            pl_last = open_source(first_sheet_last_file)
+            sheets.append((pl_sheet_name, [(pl_first, pl_first.active_sheet), (middle, pl_sheet_name),
+                                           (pl_last, pl_last.active_sheet)], 1,
+                           {0: placeholder_cells(first_sheet_first_file, values)}))
+        else:
+            print(f"Copying first sheet from {middle_file}")
+            sheets.append((pl_sheet_name, [(middle, pl_sheet_name)], 0, None))
+
+        if invoice_sheet_names:
+            header = open_source(first_file)
+            if len(header.sheet_names) < 2:
+                print(f"Error: First file (h.xlsx) must have at least 2 sheets")
+                return False
+            footer = open_source(last_file)
+            for invoice_sheet_name in invoice_sheet_names:
+                sheets.append((invoice_sheet_name, [(header, header.sheet_names[1]), (middle, invoice_sheet_name),
+                                                    (footer, footer.active_sheet)], 1,
+                               {0: placeholder_cells(first_file, values)}))
+
+        output_dir = os.path.dirname(os.path.abspath(output_file))
+        fd, temp_path = tempfile.mkstemp(dir=output_dir, suffix='.xlsx')
+        os.close(fd)
+        defined_names = []
+        with zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_DEFLATED) as out_zip:
+            for sheet_index, (title, parts, content_position, overrides) in enumerate(sheets):
+                print(f"Processing sheet: {title}")
+                layout = _write_sheet(out_zip, f'xl/worksheets/sheet{sheet_index + 1}.xml', parts,
+                                      content_position, styles, sheet_index == 0, overrides)
+                defined_names.extend(_layout_names(sheet_index, title, layout))
+            _write_package(out_zip, [title for title, _, _, _ in sheets], defined_names, styles, middle.theme_xml())
+
+        os.replace(temp_path, output_file)
+        temp_path = None
+        print(f"\nSuccessfully saved merged file to: {output_file}")
+        print(f"Final sheet order: {[title for title, _, _, _ in sheets]}")
+        return True
+    except Exception as e:
+        print(f"Error splicing files into {output_file}: {e}")
+        return False
+    finally:
+        for source in sources:
+            source.close()
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
@@ -0,0 +1,338 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compiled header/footer templates.
+
+h.xlsx、f.xlsx、pl_h.xlsx、pl_f.xlsx每次合并都要用openpyxl重新解析。这里把模板工作表预编译成
+紧凑的二进制文件(.tplc): 单元格表(行、列、值序号、样式序号)是定长记录，可以用np.memmap直接映射，
+多个工作进程共享操作系统页缓存中的同一份数据；值、样式表、合并区域、行高列宽和占位单元格
+(公司名称/地址)保存在文件头中。
+占位单元格的值在合并时由append_compiled_sheet的values参数提供，模板文件本身不修改。
+
+编译文件记录源模板的大小、修改时间和SHA-256。大小和修改时间不变时直接使用；
+发生变化时重新计算哈希，哈希不同则从xlsx重新编译并覆盖编译文件。
+
+用法:
+    python -m shipping_processor.merge.templates h.xlsx f.xlsx pl_h.xlsx pl_f.xlsx
+"""
+
+import copy
+import hashlib
+import os
+import pickle
+import struct
+import sys
+import tempfile
+
+import numpy as np
+import openpyxl
+from openpyxl.cell.cell import MergedCell
+from openpyxl.styles.cell_style import StyleArray
+
+FORMAT_VERSION = 1
+MAGIC = b'SPTPLC01'
+ARTIFACT_SUFFIX = '.tplc'
+CACHE_DIR_NAME = '.template_cache'
+
+# 单元格表: 值序号为-1表示None；样式序号为-1表示合并区域内的单元格(只创建，不写值和样式)
+CELL_DTYPE = np.dtype([('row', '<i4'), ('col', '<i4'), ('value', '<i4'), ('style', '<i4')])
+
+# 各模板中由政策文件填写的单元格
+TEMPLATE_PLACEHOLDERS = {
+    'h.xlsx': {'company_name': ['A1'], 'company_address': ['A2']},
+    'pl_h.xlsx': {'company_name': ['A1', 'B4'], 'company_address': ['A2', 'B5']},
+}
+
+_loaded = {}
+
+
+class CompiledTemplate:
+    """编译后的模板工作表"""
+
+    def __init__(self, meta, cells):
+        self.meta = meta
+        self.cells = cells
+        self.sheet_title = meta['sheet_title']
+        self.max_row = meta['max_row']
+        self.max_column = meta['max_column']
+        self.values = meta['values']
+        self.styles = meta['styles']
+        self.merges = meta['merges']
+        self.column_widths = meta['column_widths']
+        self.row_heights = meta['row_heights']
+        self.placeholders = meta['placeholders']
+
+
+def _file_stat(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _file_hash(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _sheet_key(sheet):
+    return 'active' if sheet is None else str(sheet)
+
+
+def artifact_path(template_path, sheet=None, cache_dir=None):
+    """模板工作表对应的编译文件路径，默认放在模板所在目录的.template_cache下"""
+    template_path = os.path.abspath(template_path)
+    cache_dir = cache_dir or os.path.join(os.path.dirname(template_path), CACHE_DIR_NAME)
+    name = f"{os.path.basename(template_path)}.{_sheet_key(sheet)}{ARTIFACT_SUFFIX}"
+    return os.path.join(cache_dir, name)
+
+
+def compile_template(template_path, sheet=None):
+    """从xlsx编译一个模板工作表
+
+    Args:
+        template_path: 模板文件路径
+        sheet: 工作表序号，None表示活动工作表
+
+    Returns:
+        CompiledTemplate: 编译结果
+    """
+    source_size, source_mtime_ns = _file_stat(template_path)
+    source_hash = _file_hash(template_path)
+
+    wb = openpyxl.load_workbook(template_path, data_only=True)
+    ws = wb.active if sheet is None else wb.worksheets[sheet]
+
+    values = []
+    value_index = {}
+    styles = []
+    style_index = {}
+    records = []
+    # 与append_sheet_with_offset的遍历方式一致: 行列号从1开始枚举
+    for row_idx, row in enumerate(ws.rows, 1):
+        for col_idx, cell in enumerate(row, 1):
+            if isinstance(cell, MergedCell):
+                records.append((row_idx, col_idx, -1, -1))
+                continue
+
+            value = cell.value
+            if value is None:
+                value_id = -1
+            else:
+                key = (type(value), value)
+                if key not in value_index:
+                    value_index[key] = len(values)
+                    values.append(value)
+                value_id = value_index[key]
+
+            # 先读取样式对象: 单元格的样式数组是延迟创建的，读取时才会生成
+            font, border, fill = copy.copy(cell.font), copy.copy(cell.border), copy.copy(cell.fill)
+            protection, alignment = copy.copy(cell.protection), copy.copy(cell.alignment)
+            style = (tuple(cell._style), font, border, fill, cell.number_format, protection, alignment)
+            if style not in style_index:
+                style_index[style] = len(styles)
+                styles.append(style)
+            records.append((row_idx, col_idx, value_id, style_index[style]))
+
+    placeholders = {}
+    for name, coordinates in TEMPLATE_PLACEHOLDERS.get(os.path.basename(template_path), {}).items():
+        placeholders[name] = [openpyxl.utils.cell.coordinate_to_tuple(coordinate) for coordinate in coordinates]
+
+    meta = {
+        'format_version': FORMAT_VERSION,
+        'openpyxl_version': openpyxl.__version__,
+        'source_size': source_size,
+        'source_mtime_ns': source_mtime_ns,
+        'source_hash': source_hash,
+        'sheet': _sheet_key(sheet),
+        'sheet_title': ws.title,
+        'max_row': ws.max_row,
+        'max_column': ws.max_column,
+        'values': values,
+        'styles': styles,
+        'merges': [(r.min_row, r.min_col, r.max_row, r.max_col) for r in ws.merged_cells.ranges],
+        'column_widths': {letter: dim.width for letter, dim in ws.column_dimensions.items()},
+        'row_heights': {row: dim.height for row, dim in ws.row_dimensions.items() if dim.height is not None},
+        'placeholders': placeholders,
+    }
+    return CompiledTemplate(meta, np.array(records, dtype=CELL_DTYPE))
+
+
+def save_compiled_template(compiled, path):
+    """写出编译文件: 魔数、文件头长度、文件头(pickle)、按16字节对齐的单元格表
+
+    先写临时文件再替换，其他进程不会读到写了一半的文件。
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    header = pickle.dumps(compiled.meta, protocol=pickle.HIGHEST_PROTOCOL)
+    prefix = MAGIC + struct.pack('<QQ', len(header), len(compiled.cells)) + header
+    padding = b'\0' * (-len(prefix) % 16)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=ARTIFACT_SUFFIX)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(prefix + padding)
+            f.write(np.ascontiguousarray(compiled.cells, dtype=CELL_DTYPE).tobytes())
+        os.replace(temp_path, path)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def read_compiled_template(path):
+    """读取编译文件，单元格表以只读方式映射到内存
+
+    Returns:
+        CompiledTemplate: 编译结果，文件格式不符时返回None
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            return None
+        header_size, cell_count = struct.unpack('<QQ', f.read(16))
+        meta = pickle.loads(f.read(header_size))
+    if meta.get('format_version') != FORMAT_VERSION or meta.get('openpyxl_version') != openpyxl.__version__:
+        return None
+    offset = len(MAGIC) + 16 + header_size
+    offset += -offset % 16
+    if cell_count:
+        cells = np.memmap(path, dtype=CELL_DTYPE, mode='r', offset=offset, shape=(cell_count,))
+    else:
+        cells = np.empty(0, dtype=CELL_DTYPE)
+    return CompiledTemplate(meta, cells)
+
+
+def _is_current(meta, template_path):
+    """编译文件是否与源模板一致: 大小和修改时间相同，或者内容哈希相同"""
+    if (meta['source_size'], meta['source_mtime_ns']) == _file_stat(template_path):
+        return True
+    return meta['source_hash'] == _file_hash(template_path)
+
+
+def load_template(template_path, sheet=None, cache_dir=None):
+    """加载模板工作表: 进程内缓存 -> 编译文件 -> 从xlsx编译并写出编译文件
+
+    Args:
+        template_path: 模板文件路径
+        sheet: 工作表序号，None表示活动工作表
+        cache_dir: 编译文件目录，默认为模板所在目录的.template_cache
+
+    Returns:
+        CompiledTemplate: 编译结果
+    """
+    template_path = os.path.abspath(template_path)
+    key = (template_path, _sheet_key(sheet))
+    compiled = _loaded.get(key)
+    if compiled is not None and _is_current(compiled.meta, template_path):
+        return compiled
+
+    path = artifact_path(template_path, sheet, cache_dir)
+    compiled = None
+    try:
+        compiled = read_compiled_template(path)
+    except (OSError, ValueError, EOFError, pickle.UnpicklingError):
+        compiled = None
+    if compiled is None or not _is_current(compiled.meta, template_path):
+        compiled = compile_template(template_path, sheet)
+        try:
+            save_compiled_template(compiled, path)
+        except OSError as e:
+            # 编译文件写不出(目录只读、文件被占用等)时只在本进程内使用编译结果
+            print(f"Warning: Could not save compiled template {path}: {e}")
+
+    _loaded[key] = compiled
+    return compiled
+
+
+def append_compiled_sheet(compiled, target_sheet, row_offset, values=None):
+    """把编译后的模板追加到目标工作表，效果与merge.append_sheet_with_offset相同
+
+    Args:
+        compiled: 编译后的模板
+        target_sheet: 目标工作表
+        row_offset: 行偏移
+        values: {占位名称: 值}，覆盖模板中占位单元格的值
+
+    Returns:
+        int: 模板的行数
+    """
+    overrides = {}
+    for name, value in (values or {}).items():
+        for row, col in compiled.placeholders.get(name, []):
+            overrides[(row, col)] = value
+
+    template_values = compiled.values
+    styles = compiled.styles
+    written = {}
+    for row, col, value_id, style_id in compiled.cells.tolist():
+        target_cell = target_sheet.cell(row=row_offset + row, column=col)
+        if style_id < 0:
+            continue
+        value = overrides.get((row, col), template_values[value_id] if value_id >= 0 else None)
+        target_cell.value = value
+        written[(row, col)] = value
+
+        style_array, font, border, fill, number_format, protection, alignment = styles[style_id]
+        target_cell._style = StyleArray(style_array)
+        target_cell.font = font
+        target_cell.border = border
+        target_cell.fill = fill
+        target_cell.number_format = number_format
+        target_cell.protection = protection
+        target_cell.alignment = alignment
+
+    for min_row, min_col, max_row, max_col in compiled.merges:
+        merge_range = (f"{openpyxl.utils.get_column_letter(min_col)}{min_row + row_offset}:"
+                       f"{openpyxl.utils.get_column_letter(max_col)}{max_row + row_offset}")
+        try:
+            target_sheet.merge_cells(merge_range)
+            target_sheet.cell(row=min_row + row_offset, column=min_col).value = written.get((min_row, min_col))
+        except ValueError as e:
+            print(f"Warning: Could not merge cells {merge_range}: {e}")
+
+    return compiled.max_row
+
+
+def placeholder_cells(template_path, values):
+    """模板中要写入给定值的占位单元格
+
+    Args:
+        template_path: 模板文件路径(按文件名查找TEMPLATE_PLACEHOLDERS)
+        values: {占位名称: 值}
+
+    Returns:
+        dict: {(行, 列): 值}
+    """
+    cells = {}
+    for name, coordinates in TEMPLATE_PLACEHOLDERS.get(os.path.basename(template_path), {}).items():
+        if name in (values or {}):
+            for coordinate in coordinates:
+                cells[openpyxl.utils.cell.coordinate_to_tuple(coordinate)] = values[name]
+    return cells
+
+
+def precompile_templates(template_paths, cache_dir=None):
+    """预编译模板的所有工作表和活动工作表
+
+    Returns:
+        list: 写出的编译文件路径
+    """
+    written = []
+    for template_path in template_paths:
+        sheet_count = len(openpyxl.load_workbook(template_path, read_only=True).sheetnames)
+        for sheet in [None] + list(range(sheet_count)):
+            compiled = compile_template(template_path, sheet)
+            path = artifact_path(template_path, sheet, cache_dir)
+            save_compiled_template(compiled, path)
+            written.append(path)
+            print(f"{template_path} [{compiled.sheet_title}] -> {path} "
+                  f"({len(compiled.cells)} cells, {len(compiled.styles)} styles, {len(compiled.merges)} merges)")
+    return written
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Usage: python -m shipping_processor.merge.templates <template.xlsx> [...]")
+        sys.exit(1)
+    precompile_templates(sys.argv[1:])
@@ -12,10 +12,14 @@ from shipping_processor.model.transformer import (
 )
 
 from shipping_processor.model.unit_converter import translate_unit
+from shipping_processor.model.rules import load_classification_rules
+from shipping_processor.model.aggregation import aggregate_invoice_rows
 
 __all__ = [
     'merge_india_invoice_rows',
     'split_by_project_and_factory',
     'find_column_with_pattern',
-    'translate_unit'
+    'translate_unit',
+    'load_classification_rules',
+    'aggregate_invoice_rows'
 ]
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Invoice row aggregation.
+
+出口发票和复进口发票都按(零件号, 单价)合并行。单价量化为以0.0001为单位的整数，
+与零件号一起组合成整数分组键(通过哈希表factorize)，避免直接用浮点数分组；
+数量、金额、净重等求和列一次累加完成，其他字段保留每组第一个非空值。
+"""
+
+import numpy as np
+import pandas as pd
+
+# 单价量化单位: 0.0001
+PRICE_SCALE = 10000
+
+
+def quantize_price(prices):
+    """把单价转换为以0.0001为单位的整数(与round(4)一致)
+
+    Args:
+        prices: 单价列
+
+    Returns:
+        pandas.arrays.IntegerArray: Int64数组，无法转换的值为<NA>
+    """
+    values = pd.to_numeric(prices, errors='coerce').to_numpy(dtype=float)
+    return pd.array(np.rint(values * PRICE_SCALE), dtype='Int64')
+
+
+def group_ids(parts, quantized_prices, sort=False):
+    """由零件号和量化单价计算分组编号
+
+    Args:
+        parts: 零件号列
+        quantized_prices: quantize_price的结果
+        sort: 为True时分组按(零件号, 单价)排序编号，否则按首次出现的顺序编号
+
+    Returns:
+        tuple: (每行的分组编号，缺少零件号或单价的行为-1, 分组数量)
+    """
+    part_codes, _ = pd.factorize(parts, sort=sort)
+    price_codes, price_uniques = pd.factorize(quantized_prices, sort=sort)
+    valid = (part_codes >= 0) & (price_codes >= 0)
+
+    # 两个编号组合成一个整数键，再factorize一次得到连续的分组编号
+    combined = part_codes.astype(np.int64) * max(len(price_uniques), 1) + price_codes
+    ids, uniques = pd.factorize(combined[valid], sort=sort)
+    row_ids = np.full(len(combined), -1, dtype=np.int64)
+    row_ids[valid] = ids
+    return row_ids, len(uniques)
+
+
+def aggregate_invoice_rows(df, part_col='Part Number', price_col='Unit Price (CIF, USD)',
+                           sum_cols=(), first_cols=(), sort=False):
+    """按(零件号, 量化单价)合并发票行
+
+    缺少零件号或单价的行不参与合并(与groupby的默认行为一致)。
+
+    Args:
+        df: 发票数据
+        part_col: 零件号列
+        price_col: 单价列
+        sum_cols: 求和的列，例如数量、金额和净重
+        first_cols: 保留每组第一个非空值的列
+        sort: 为True时结果按(零件号, 单价)排序，否则按每组首次出现的顺序
+
+    Returns:
+        pandas.DataFrame: 合并后的数据，列顺序为零件号、单价、求和列、保留列
+    """
+    sum_cols = [col for col in sum_cols if col in df.columns]
+    first_cols = [col for col in first_cols if col in df.columns]
+
+    quantized = quantize_price(df[price_col])
+    ids, group_count = group_ids(df[part_col], quantized, sort=sort)
+    valid = ids >= 0
+    if not valid.all():
+        print(f"警告: {int((~valid).sum())} 行缺少{part_col}或{price_col}，不参与合并")
+    ids = ids[valid]
+
+    # 每组第一行的位置(ids按首次出现或排序后的顺序编号)
+    positions = np.flatnonzero(valid)
+    _, first_index = np.unique(ids, return_index=True)
+    first_rows = positions[first_index]
+
+    result = {
+        part_col: df[part_col].to_numpy()[first_rows],
+        price_col: quantized[first_rows].to_numpy(dtype=float) / PRICE_SCALE,
+    }
+
+    # 所有求和列一次累加
+    if sum_cols:
+        values = df[sum_cols].iloc[positions].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+        totals = np.zeros((group_count, len(sum_cols)))
+        np.add.at(totals, ids, np.nan_to_num(values))
+        for i, col in enumerate(sum_cols):
+            if pd.api.types.is_integer_dtype(df[col].dtype):
+                result[col] = totals[:, i].astype(df[col].dtype)
+            else:
+                result[col] = totals[:, i]
+
+    # 其他字段保留每组第一个非空值
+    for col in first_cols:
+        column = df[col].iloc[positions]
+        notna = column.notna().to_numpy()
+        groups, first_valid = np.unique(ids[notna], return_index=True)
+        firsts = pd.Series(column.to_numpy()[notna][first_valid], index=groups)
+        result[col] = firsts.reindex(range(group_count)).to_numpy()
+
+    return pd.DataFrame(result)
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Declarative classification rules.
+
+贸易类型、发货人、复进口项目分类和零件号前缀等分类规则定义在
+shipping_processor/config/classification_rules.json中。每条规则编译成一个向量化的掩码
+(str.contains / isin / str.extract)，同一规则集的所有规则用np.select一次求值，
+不再逐行调用apply。
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                   'config', 'classification_rules.json')
+
+# 规则类型: 除extract外都基于去空格、转小写后的文本匹配
+MATCHERS = ('contains', 'not_contains', 'equals', 'in', 'regex', 'extract')
+
+
+def normalized_text(series):
+    """把一列转换为去空格、小写的文本，空值保持为NaN(与str(x).strip().lower()一致)"""
+    return series.astype(str).str.strip().str.lower().where(series.notna())
+
+
+def _compile_rule(rule):
+    """把一条规则编译为函数(原始列, 规范化文本) -> (布尔掩码, 结果值)"""
+    kinds = [kind for kind in MATCHERS if kind in rule]
+    if len(kinds) != 1:
+        raise ValueError(f"规则必须且只能包含一种匹配方式{MATCHERS}: {rule}")
+    kind = kinds[0]
+    pattern = rule[kind]
+    value = rule.get('value')
+
+    if kind == 'extract':
+        upper = rule.get('upper', False)
+
+        def evaluate(raw, text):
+            try:
+                extracted = raw.str.extract(pattern, expand=False)
+            except AttributeError:
+                # 整列都不是文本(例如纯数字)，没有可提取的内容
+                return np.zeros(len(raw), dtype=bool), None
+            if upper:
+                extracted = extracted.str.upper()
+            return extracted.notna().to_numpy(dtype=bool), extracted.to_numpy(dtype=object)
+
+        return evaluate
+
+    if kind == 'in':
+        options = [str(option).strip().lower() for option in pattern]
+
+        def mask(text):
+            return text.isin(options)
+    elif kind == 'equals':
+        target = str(pattern).strip().lower()
+
+        def mask(text):
+            return text.eq(target)
+    elif kind == 'regex':
+        def mask(text):
+            return text.str.contains(pattern, regex=True, na=False)
+    else:
+        needle = str(pattern).strip().lower()
+        negate = kind == 'not_contains'
+
+        def mask(text):
+            matched = text.str.contains(needle, regex=False, na=False)
+            return ~matched if negate else matched
+
+    def evaluate(raw, text):
+        return mask(text).fillna(False).to_numpy(dtype=bool), value
+
+    return evaluate
+
+
+class RuleSet:
+    """一组有序规则: 第一条匹配的规则决定结果，都不匹配时使用默认值"""
+
+    def __init__(self, name, config):
+        self.name = name
+        self.source = config.get('source')
+        self.default = config.get('default')
+        self.description = config.get('description', '')
+        self.values = [rule.get('value') for rule in config.get('rules', []) if 'value' in rule]
+        self._rules = [_compile_rule(rule) for rule in config.get('rules', [])]
+
+    def evaluate(self, raw, text=None):
+        """对一列求值
+
+        Args:
+            raw: 原始列
+            text: 已规范化的文本列，为None时在这里计算
+
+        Returns:
+            pandas.Series: 分类结果，索引与raw相同
+        """
+        if text is None:
+            text = normalized_text(raw)
+        conditions = []
+        choices = []
+        for rule in self._rules:
+            mask, value = rule(raw, text)
+            conditions.append(mask)
+            choices.append(value if isinstance(value, np.ndarray) else np.full(len(raw), value, dtype=object))
+        if not conditions:
+            return pd.Series(self.default, index=raw.index, dtype=object)
+        return pd.Series(np.select(conditions, choices, default=self.default), index=raw.index, dtype=object)
+
+
+class ClassificationRules:
+    """分类规则引擎"""
+
+    def __init__(self, config):
+        self.defaults = dict(config.get('defaults', {}))
+        self.rule_sets = {name: RuleSet(name, rule_config)
+                          for name, rule_config in config.get('rule_sets', {}).items()}
+
+    @classmethod
+    def from_file(cls, config_path=None):
+        """从JSON配置文件加载规则
+
+        Args:
+            config_path: 配置文件路径，默认为shipping_processor/config/classification_rules.json
+
+        Returns:
+            ClassificationRules: 规则引擎
+        """
+        with open(config_path or DEFAULT_CONFIG_PATH, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def evaluate(self, df, names=None, sources=None):
+        """对DataFrame一次求值多个规则集，同一来源列只规范化一次
+
+        Args:
+            df: 输入数据
+            names: 要求值的规则集名称，默认为全部
+            sources: {规则集名称: 来源列}，覆盖配置中的source
+
+        Returns:
+            pandas.DataFrame: 每个规则集一列的分类结果
+        """
+        sources = sources or {}
+        texts = {}
+        results = {}
+        for name in names or self.rule_sets:
+            rule_set = self.rule_sets[name]
+            source = sources.get(name, rule_set.source)
+            if source not in texts:
+                texts[source] = normalized_text(df[source])
+            results[name] = rule_set.evaluate(df[source], texts[source])
+        return pd.DataFrame(results, index=df.index)
+
+    def classify(self, series, name):
+        """对单列求值一个规则集"""
+        return self.rule_sets[name].evaluate(series)
+
+    def category_masks(self, series, name):
+        """按规则集的每个结果值返回布尔掩码
+
+        Returns:
+            dict: {结果值: 布尔Series}
+        """
+        labels = self.classify(series, name)
+        return {value: labels.eq(value) for value in dict.fromkeys(self.rule_sets[name].values)}
+
+    def fill_default(self, series, field):
+        """空值和空白字符串替换为配置的默认值，其余值去掉首尾空格
+
+        Args:
+            series: 输入列
+            field: defaults中的字段名，例如'project'或'factory'
+
+        Returns:
+            pandas.Series: 处理后的列
+        """
+        text = series.astype(str).str.strip()
+        blank = series.isna() | text.eq('').fillna(False)
+        return text.astype(object).mask(blank, self.defaults[field])
+
+
+_rules_cache = {}
+
+
+def load_classification_rules(config_path=None):
+    """加载并缓存分类规则，同一配置文件只编译一次"""
+    path = os.path.abspath(config_path or DEFAULT_CONFIG_PATH)
+    if path not in _rules_cache:
+        _rules_cache[path] = ClassificationRules.from_file(path)
+    return _rules_cache[path]
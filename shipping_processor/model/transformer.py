@@ -7,7 +7,121 @@ Module for transforming DataFrame data.
 
 import pandas as pd
 import numpy as np
-import re
+
+from shipping_processor.model.rules import load_classification_rules
+
+def join_descriptions(values, group_ids, first_rows):
+    """
+    Concatenate the descriptions of merged rows with newlines.
+
+    Groups with a single row keep their value unchanged; empty values are
+    skipped when joining.
+
+    Args:
+        values (Series): Description column
+        group_ids (ndarray): Group number of each row (-1 for rows without a key)
+        first_rows (ndarray): Position of the first row of each group
+
+    Returns:
+        ndarray: One description per group
+    """
+    values = values.to_numpy(dtype=object)
+    result = values[first_rows].copy()
+    multi = np.flatnonzero(np.bincount(group_ids[group_ids >= 0]) > 1)
+    if len(multi) == 0:
+        return result
+
+    keep = np.isin(group_ids, multi) & np.fromiter((bool(val) for val in values), dtype=bool, count=len(values))
+    joined = pd.Series([str(val) for val in values[keep]]).groupby(group_ids[keep]).agg('\n'.join)
+    result[multi] = joined.reindex(multi, fill_value='').to_numpy()
+    return result
+
+def plan_aggregation(columns, part_col, sn_col, desc_col, qty_col):
+    """
+    Choose the aggregation for every column in one pass.
+
+    Args:
+        columns: Columns of the DataFrame to merge
+        part_col (str): Group key column (excluded from the plan)
+        sn_col (str): Serial number column
+        desc_col (str): Description column
+        qty_col (str): Quantity column
+
+    Returns:
+        dict: {column: 'sum' | 'first' | 'join'} for run_aggregation
+    """
+    plan = {
+        # Keep the first serial number
+        sn_col: 'first',
+        # Concatenate descriptions with newlines
+        desc_col: 'join',
+        # Sum quantities
+        qty_col: 'sum',
+    }
+
+    for col in columns:
+        if col in plan or col == part_col:
+            continue
+
+        col_lower = str(col).lower()
+        if any(weight in col_lower for weight in ['weight', 'gross', 'net', '重量']):
+            # Sum weights
+            plan[col] = 'sum'
+        elif any(price in col_lower for price in ['price', 'unit price', '单价']):
+            # Keep first price
+            plan[col] = 'first'
+        elif any(amount in col_lower for amount in ['amount', 'total', '金额']):
+            # Sum amounts
+            plan[col] = 'sum'
+        else:
+            # For other columns, keep the first value
+            plan[col] = 'first'
+
+    return plan
+
+def run_aggregation(df, part_col, plan):
+    """
+    Aggregate a DataFrame by part number according to a plan.
+
+    All reductions share one groupby. Sum columns are reduced together,
+    descriptions are joined per group, and 'first' columns are taken from the
+    first row of each group by position unless that row has a missing value.
+
+    Args:
+        df (DataFrame): Input DataFrame
+        part_col (str): Group key column
+        plan (dict): {column: aggregation} from plan_aggregation
+
+    Returns:
+        DataFrame: One row per part number, sorted by part number
+    """
+    groups = df.groupby(part_col, sort=True)
+    group_ids = groups.ngroup().fillna(-1).to_numpy(dtype=np.int64)
+    valid = group_ids >= 0
+    _, first_index = np.unique(group_ids[valid], return_index=True)
+    first_rows = np.flatnonzero(valid)[first_index]
+
+    # The first row of every group, taken once for all columns
+    grouped = df[[part_col] + list(plan)].take(first_rows).reset_index(drop=True)
+
+    sum_cols = [col for col, how in plan.items() if how == 'sum']
+    first_cols = [col for col, how in plan.items() if how == 'first']
+    # 'first' skips missing values, so only columns whose first row is missing in some group need a reduction
+    nullable_cols = [col for col in first_cols if grouped[col].isna().any()]
+
+    if sum_cols:
+        sums = groups[sum_cols].sum()
+        for col in sum_cols:
+            grouped[col] = sums[col].to_numpy()
+    if nullable_cols:
+        firsts = groups[nullable_cols].first()
+        for col in nullable_cols:
+            grouped[col] = firsts[col].to_numpy()
+    for col, how in plan.items():
+        if how == 'join':
+            grouped[col] = join_descriptions(df[col], group_ids, first_rows)
+
+    return grouped
 
 def merge_india_invoice_rows(df):
     """
@@ -49,38 +163,12 @@ def merge_india_invoice_rows(df):
     if not all([sn_col, part_col, desc_col, qty_col]):
         return df
     
-    # Group rows by part number and aggregate
-    grouped = result_df.groupby(part_col, as_index=False).agg({
-        # Keep the first serial number
-        sn_col: 'first',
-        # Concatenate descriptions with newlines or commas
-        desc_col: lambda x: '\n'.join(str(val) for val in x if val) if len(x) > 1 else x.iloc[0],
-        # Sum quantities
-        qty_col: 'sum'
-    })
-    
-    # For other columns, use appropriate aggregation
-    for col in result_df.columns:
-        if col in [sn_col, part_col, desc_col, qty_col]:
-            continue
-            
-        col_lower = str(col).lower()
-        if any(weight in col_lower for weight in ['weight', 'gross', 'net', '重量']):
-            # Sum weights
-            grouped[col] = result_df.groupby(part_col)[col].sum().values
-        elif any(price in col_lower for price in ['price', 'unit price', '单价']):
-            # Keep first price
-            grouped[col] = result_df.groupby(part_col)[col].first().values
-        elif any(amount in col_lower for amount in ['amount', 'total', '金额']):
-            # Sum amounts
-            grouped[col] = result_df.groupby(part_col)[col].sum().values
-        else:
-            # For other columns, keep the first value
-            grouped[col] = result_df.groupby(part_col)[col].first().values
-    
+    # Classify every column once, then aggregate all of them over a single groupby
+    plan = plan_aggregation(result_df.columns, part_col, sn_col, desc_col, qty_col)
+    grouped = run_aggregation(result_df, part_col, plan)
+
     # Renumber serial numbers
-    for i, idx in enumerate(grouped.index):
-        grouped.at[idx, sn_col] = i + 1
+    grouped[sn_col] = np.arange(1, len(grouped) + 1)
         
     return grouped
 
@@ -125,18 +213,9 @@ def split_by_project_and_factory(df):
                 break
         
         if part_col:
-            # Extract project/factory code from part number
-            def extract_prefix(part_num):
-                if not part_num or not isinstance(part_num, str):
-                    return 'unknown'
-                # Try to extract prefix (usually 2-4 letters at the beginning)
-                match = re.match(r'^([A-Za-z]{2,4})', str(part_num))
-                if match:
-                    return match.group(1).upper()
-                return 'unknown'
-            
-            # Add a new column for factory/project based on part number prefix
-            result_df['factory_project'] = result_df[part_col].apply(extract_prefix)
+            # Extract project/factory code from part number (usually 2-4 letters at the beginning)
+            rules = load_classification_rules()
+            result_df['factory_project'] = rules.classify(result_df[part_col], 'part_prefix')
             factory_col = 'factory_project'
     
     # Split by factory or project
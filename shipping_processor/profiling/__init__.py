@@ -0,0 +1,13 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Profiling module for per-stage cProfile / tracemalloc / stack sampling investigations.
+"""
+
+from shipping_processor.profiling.deep import DeepProfiler, deep_profile
+
+__all__ = [
+    'DeepProfiler',
+    'deep_profile'
+]
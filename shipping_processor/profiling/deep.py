@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Per-stage deep profiling.
+
+按处理阶段(progress_callback收到的PROCESS_STAGES)分别记录:
+
+- <阶段>.pstats: cProfile统计，可用python -m pstats、snakeviz等工具查看
+- <阶段>.collapsed: 采样得到的调用栈(每行"帧;帧;...;帧 次数")，可直接交给flamegraph.pl、speedscope等工具
+- <阶段>.allocations.txt: tracemalloc在该阶段新增内存最多的代码行，以及该阶段的内存峰值
+- summary.json: 各阶段耗时、CPU时间、内存峰值、新增内存和采样次数
+
+cProfile和调用栈采样只记录调用阶段回调的线程(处理程序的主线程)，其他线程(多个装箱单并行读取)
+和子进程(merge.py在子进程中运行时)中的工作不计入。tracemalloc会明显拖慢处理，只在排查时使用。
+"""
+
+import collections
+import contextlib
+import cProfile
+import json
+import linecache
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+SUMMARY_NAME = 'summary.json'
+
+# 不统计的内存分配(分析工具自身、调用栈采样和模块导入)。只过滤比较结果中的代码行，
+# 对快照中的每个内存块调用filter_traces在分配较多时要几秒钟
+EXCLUDED_FILES = {
+    tracemalloc.__file__, cProfile.__file__, pstats.__file__, __file__,
+    '<frozen importlib._bootstrap>', '<frozen importlib._bootstrap_external>', '<unknown>',
+}
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class DeepProfiler:
+    """每个阶段使用独立的cProfile和tracemalloc快照，另有一个线程定时采样调用栈
+
+    Args:
+        profile_dir: 输出目录
+        sample_interval: 调用栈采样间隔(秒)
+        top: 每个阶段记录的内存分配代码行数
+    """
+
+    def __init__(self, profile_dir, sample_interval=0.005, top=25):
+        self.profile_dir = profile_dir
+        self.sample_interval = sample_interval
+        self.top = top
+        self.stages = []
+        self.current = None
+        self._thread_id = None
+        self._stacks = collections.defaultdict(collections.Counter)
+        # 采样线程更新_stacks，阶段结束时在主线程中取出并写出，两者都持有此锁
+        self._stacks_lock = threading.Lock()
+        self._stop_sampling = threading.Event()
+        self._sampler = None
+        self._started_tracemalloc = False
+
+    def start(self):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self._thread_id = threading.get_ident()
+        self._sampler = threading.Thread(target=self._sample, name='deep-profile-sampler', daemon=True)
+        self._sampler.start()
+
+    def _sample(self):
+        while not self._stop_sampling.wait(self.sample_interval):
+            stage = self.current
+            frame = sys._current_frames().get(self._thread_id)
+            if stage is None or frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            with self._stacks_lock:
+                # 阶段在采样期间结束时丢弃这次采样，已写出的阶段不会再出现在_stacks中
+                if self.current == stage:
+                    self._stacks[stage][';'.join(reversed(stack))] += 1
+
+    def stage(self, name):
+        """进入新阶段(可直接作为progress_callback)，结束并写出上一阶段的结果"""
+        if self.current is not None:
+            self._finish_stage()
+        self._snapshot = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        self._profile = cProfile.Profile()
+        self._stage_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        self.current = name
+        self._profile.enable()
+
+    def _finish_stage(self):
+        self._profile.disable()
+        with self._stacks_lock:
+            name, self.current = self.current, None
+            stacks = self._stacks.pop(name, {})
+        seconds = time.perf_counter() - self._stage_start
+        cpu_seconds = time.process_time() - self._cpu_start
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        allocations = [stat for stat in snapshot.compare_to(self._snapshot, 'lineno')
+                       if stat.traceback[0].filename not in EXCLUDED_FILES]
+
+        self._profile.dump_stats(os.path.join(self.profile_dir, f"{name}.pstats"))
+        with open(os.path.join(self.profile_dir, f"{name}.collapsed"), 'w', encoding='utf-8') as f:
+            for stack, count in sorted(stacks.items()):
+                f.write(f"{stack} {count}\n")
+        self._write_allocations(name, allocations[:self.top], peak)
+
+        self.stages.append({
+            'stage': name,
+            'seconds': round(seconds, 4),
+            'cpu_seconds': round(cpu_seconds, 4),
+            'peak_bytes': peak,
+            'allocated_bytes': sum(stat.size_diff for stat in allocations),
+            'samples': sum(stacks.values()),
+        })
+
+    def _write_allocations(self, name, allocations, peak):
+        with open(os.path.join(self.profile_dir, f"{name}.allocations.txt"), 'w', encoding='utf-8') as f:
+            f.write(f"阶段 {name}: 内存峰值 {peak / 1024 / 1024:.1f} MiB\n")
+            f.write(f"新增内存最多的{len(allocations)}处代码 (新增KiB, 新增块数, 位置):\n\n")
+            for stat in allocations:
+                frame = stat.traceback[0]
+                f.write(f"{stat.size_diff / 1024:12.1f} KiB {stat.count_diff:+9d}  {frame.filename}:{frame.lineno}\n")
+                line = linecache.getline(frame.filename, frame.lineno).strip()
+                if line:
+                    f.write(f"{'':24}{line}\n")
+
+    def stop(self):
+        """结束最后一个阶段，写出summary.json
+
+        Returns:
+            list: 各阶段的统计
+        """
+        if self.current is not None:
+            self._finish_stage()
+        self._stop_sampling.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+        with open(os.path.join(self.profile_dir, SUMMARY_NAME), 'w', encoding='utf-8') as f:
+            json.dump({'sample_interval': self.sample_interval, 'stages': self.stages}, f, ensure_ascii=False, indent=2)
+        return self.stages
+
+    def print_summary(self):
+        print(f"\n深度性能分析结果已保存到: {self.profile_dir}")
+        for item in self.stages:
+            print(f"  {item['stage']:<10} {item['seconds']:8.2f}秒  CPU {item['cpu_seconds']:8.2f}秒  "
+                  f"峰值 {item['peak_bytes'] / 1024 / 1024:8.1f} MiB  新增 {item['allocated_bytes'] / 1024 / 1024:8.1f} MiB")
+
+
+@contextlib.contextmanager
+def deep_profile(profile_dir, progress_callback=None):
+    """在with块中按阶段进行深度性能分析
+
+    Args:
+        profile_dir: 输出目录
+        progress_callback: 原有的阶段回调，切换阶段后继续调用
+
+    Yields:
+        callable: 传给process_shipping_list的progress_callback
+    """
+    profiler = DeepProfiler(profile_dir)
+
+    def callback(stage):
+        profiler.stage(stage)
+        if progress_callback:
+            progress_callback(stage)
+
+    profiler.start()
+    try:
+        yield callback
+    finally:
+        profiler.stop()
+        profiler.print_summary()
@@ -3,18 +3,13 @@
 
 import os
 import argparse
-import pandas as pd
 import json
 import sys
 import glob
-from validators.input_validator import InputValidator
-from validators.process_validator import ProcessValidator
-from validators.import_invoice_validator import ImportInvoiceValidator
-from validators.utils import get_output_files
 
-# 导入process_shipping_list模块
+# process_shipping_list模块所在目录；验证器和处理程序都在main()中按需导入，
+# 只查看--help或使用--skip-processing时不需要加载处理程序
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-import process_shipping_list
 
 
 def generate_report(results, report_path, args):
@@ -126,6 +121,18 @@ def generate_report(results, report_path, args):
 
             f.write(f"### {category}: {passed}/{total} 通过\n\n")
 
+        # 检查耗时，最慢的检查排在前面
+        timed_results = sorted(((k, v["duration"]) for k, v in results.items() if "duration" in v),
+                               key=lambda item: (-item[1], item[0]))
+        if timed_results:
+            f.write("## 检查耗时\n\n")
+            f.write(f"- 并发数: {getattr(args, 'jobs', 1)}\n")
+            f.write(f"- 检查耗时合计: {sum(d for _, d in timed_results):.3f}秒\n\n")
+            f.write("| 检查项 | 耗时(秒) |\n|---|---|\n")
+            for key, duration in timed_results[:10]:
+                f.write(f"| {key} | {duration:.3f} |\n")
+            f.write("\n")
+
         # 详细测试结果
         f.write("## 详细测试结果\n\n")
 
@@ -145,14 +152,20 @@ def generate_report(results, report_path, args):
                 for key in failed_tests:
                     result = results[key]
                     f.write(f"##### {key}: ❌ 失败\n")
-                    f.write(f"- 结果: {result['message']}\n\n")
+                    f.write(f"- 结果: {result['message']}\n")
+                    if "duration" in result:
+                        f.write(f"- 耗时: {result['duration']:.3f}秒\n")
+                    f.write("\n")
 
             if passed_tests:
                 f.write("#### ✅ 通过的测试\n\n")
                 for key in passed_tests:
                     result = results[key]
                     f.write(f"##### {key}: ✅ 通过\n")
-                    f.write(f"- 结果: {result['message']}\n\n")
+                    f.write(f"- 结果: {result['message']}\n")
+                    if "duration" in result:
+                        f.write(f"- 耗时: {result['duration']:.3f}秒\n")
+                    f.write("\n")
 
             # 显示有关本类别测试的统计信息
             category_results = {k: results[k] for k in keys if k in results}
@@ -280,24 +293,32 @@ def main():
     parser.add_argument("--report-path", default="reports/validation_report.md", help="报告输出路径")
     parser.add_argument("--skip-processing", action="store_true", help="跳过文件处理，仅验证已生成的文件")
     parser.add_argument("--debug", action="store_true", help="启用调试模式，打印更多调试信息")
+    parser.add_argument("--jobs", type=int, default=1, help="并发执行检查的线程数，默认为1(顺序执行)")
 
     args = parser.parse_args()
 
+    from validators.input_validator import InputValidator
+    from validators.process_validator import ProcessValidator
+    from validators.import_invoice_validator import ImportInvoiceValidator
+    from validators.context import ValidationContext
+    from validators.runner import run_checks
+
     # 确保输出目录存在
     os.makedirs(args.output_dir, exist_ok=True)
     os.makedirs(os.path.dirname(args.report_path), exist_ok=True)
 
-    # 初始化验证器
-    input_validator = InputValidator()
-    process_validator = ProcessValidator()
-    import_invoice_validator = ImportInvoiceValidator()
+    # 初始化验证器，所有检查共享同一个上下文，每个文件只解析一次
+    context = ValidationContext()
+    input_validator = InputValidator(context=context)
+    process_validator = ProcessValidator(context=context)
+    import_invoice_validator = ImportInvoiceValidator(context=context)
 
     # 结果收集
     results = {}
 
     # 1. 验证输入文件
     print("正在验证输入文件...")
-    input_results = input_validator.validate_all(args.packing_list, args.policy_file)
+    input_results = run_checks(input_validator.get_checks(args.packing_list, args.policy_file), args.jobs)
     results.update(input_results)
 
     # 检查输入验证是否通过
@@ -311,6 +332,7 @@ def main():
     if not args.skip_processing:
         print("正在处理文件...")
         try:
+            import process_shipping_list
             process_shipping_list.process_shipping_list(
                 args.packing_list,
                 args.policy_file,
@@ -328,39 +350,47 @@ def main():
     cif_invoice_path = find_cif_invoice(args.output_dir)
     export_invoice_path = find_export_invoice(args.output_dir)
 
-    # 4. 验证处理逻辑
+    # 4. 验证处理逻辑和进口发票，两部分的检查互不依赖，放在同一个检查列表中执行
+    checks = []
     print("正在验证处理逻辑...")
     if cif_invoice_path:
-        process_results = process_validator.validate_all(
+        checks.extend(process_validator.get_checks(
             args.packing_list,
             args.policy_file,
             cif_invoice_path,
             export_invoice_path,
             args.output_dir
-        )
-        results.update(process_results)
+        ))
     else:
         results["process_missing_cif"] = {"success": False, "message": "未找到CIF原始发票文件，无法验证处理逻辑"}
 
     # 5. 验证进口发票
     print("正在验证进口发票...")
-    # 查找进口发票文件
+    # 查找进口发票文件(排序保证结果顺序稳定)
     import_invoice_files = []
-    for file in os.listdir(args.output_dir):
+    for file in sorted(os.listdir(args.output_dir)):
         if file.endswith('.xlsx') and ('reimport' in file.lower() or 'reci' in file.lower()):
             import_invoice_files.append(os.path.join(args.output_dir, file))
 
     if import_invoice_files:
         for import_invoice_path in import_invoice_files:
             print(f"验证进口发票: {import_invoice_path}")
-            import_results = import_invoice_validator.validate_all(import_invoice_path, args.packing_list)
             # 添加文件名前缀以区分不同文件的验证结果
             file_prefix = os.path.basename(import_invoice_path).replace('.xlsx', '')
-            prefixed_results = {f"{file_prefix}_{k}": v for k, v in import_results.items()}
-            results.update(prefixed_results)
+            checks.extend((f"{file_prefix}_{k}", check)
+                          for k, check in import_invoice_validator.get_checks(import_invoice_path, args.packing_list))
     else:
         results["import_invoice_missing"] = {"success": False, "message": "未找到进口发票文件，无法验证进口发票"}
 
+    if args.jobs > 1:
+        print(f"使用 {args.jobs} 个线程并发执行 {len(checks)} 项检查...")
+    results.update(run_checks(checks, args.jobs))
+
+    # 打印最慢的检查，便于定位耗时问题
+    slowest = sorted(((k, v["duration"]) for k, v in results.items() if "duration" in v), key=lambda item: -item[1])[:5]
+    for key, duration in slowest:
+        print(f"  耗时 {duration:.3f}秒: {key}")
+
     # 6. 生成报告
     print(f"正在生成验收报告 {args.report_path}...")
     generate_report(results, args.report_path, args)
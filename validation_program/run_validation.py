@@ -22,6 +22,7 @@ def main():
     parser.add_argument("--report-path", help="指定报告输出路径")
     parser.add_argument("--skip-processing", action="store_true", help="跳过文件处理，仅验证已生成的文件")
     parser.add_argument("--debug", action="store_true", help="启用调试模式，打印更多调试信息")
+    parser.add_argument("--jobs", type=int, default=1, help="并发执行检查的线程数")
     args = parser.parse_args()
     
     # 获取当前目录
@@ -100,6 +101,9 @@ def main():
     if args.debug:
         cmd.append("--debug")
     
+    if args.jobs > 1:
+        cmd.extend(["--jobs", str(args.jobs)])
+    
     # 显示执行的命令
     print("执行命令:", " ".join(cmd))
     
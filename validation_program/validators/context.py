@@ -0,0 +1,113 @@
+import os
+import threading
+import pandas as pd
+import openpyxl
+from .utils import read_sheet_layout, read_layout_table
+
+
+class ValidationContext:
+    """验证上下文
+
+    同一次验证中的所有检查共享一个上下文。每个文件按(路径, 修改时间)只加载一次工作簿，
+    之后不同参数的读取都基于内存中的工作簿完成，解析结果也会缓存下来。
+    上下文可以在多个线程中共享: 同一缓存键只会加载一次，同一工作簿的读取串行进行。
+    """
+
+    def __init__(self):
+        """初始化上下文"""
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._file_locks = {}
+
+    def get(self, kind, file_path, loader, *extra_key):
+        """按(类型, 路径, 修改时间, 附加键)懒加载并缓存结果
+
+        Args:
+            kind: 缓存内容的类型名称
+            file_path: 文件路径
+            loader: 缓存未命中时调用的加载函数
+            extra_key: 附加的缓存键，例如读取参数
+
+        Returns:
+            缓存的结果；DataFrame返回副本，避免检查之间互相修改
+        """
+        path = os.path.abspath(file_path)
+        key = (kind, path, os.path.getmtime(path)) + extra_key
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if key not in self._cache:
+                self._cache[key] = loader()
+            value = self._cache[key]
+        return value.copy() if isinstance(value, pd.DataFrame) else value
+
+    def _file_lock(self, file_path):
+        """同一工作簿的读取需要串行(openpyxl遍历单元格时会修改工作表内部状态)"""
+        with self._lock:
+            return self._file_locks.setdefault(os.path.abspath(file_path), threading.Lock())
+
+    def workbook(self, file_path):
+        """获取已加载的工作簿(只解析一次文件)"""
+        return self.get('workbook', file_path,
+                        lambda: openpyxl.load_workbook(file_path, data_only=True))
+
+    def read_excel(self, file_path, **kwargs):
+        """与pd.read_excel参数相同，但基于缓存的工作簿读取，相同参数的结果也会缓存
+
+        Args:
+            file_path: Excel文件路径
+            kwargs: 传给pd.read_excel的参数
+
+        Returns:
+            pandas.DataFrame: 读取的数据表
+        """
+        def load():
+            workbook = self.workbook(file_path)
+            with self._file_lock(file_path):
+                return pd.read_excel(workbook, engine='openpyxl', **kwargs)
+
+        return self.get('read_excel', file_path, load, repr(sorted(kwargs.items())))
+
+    def sheet_layout(self, file_path):
+        """获取生成文件中记录的表格区域，参见utils.read_sheet_layout"""
+        def load():
+            workbook = self.workbook(file_path)
+            with self._file_lock(file_path):
+                return read_sheet_layout(workbook)
+
+        return self.get('sheet_layout', file_path, load)
+
+    def read_layout_table(self, file_path, sheet_name=0, include_total=False):
+        """按区域定义读取数据表，参见utils.read_layout_table"""
+        def load():
+            workbook = self.workbook(file_path)
+            layout = self.sheet_layout(file_path)
+            with self._file_lock(file_path):
+                return read_layout_table(workbook, sheet_name, layout, include_total)
+
+        return self.get('layout_table', file_path, load, sheet_name, include_total)
+
+    def read_intermediate(self, file_path):
+        """读取与生成的xlsx对应的Feather/Parquet中间文件(处理程序使用--intermediates时写出)
+
+        Args:
+            file_path: 生成的xlsx文件路径
+
+        Returns:
+            pandas.DataFrame: 中间文件中的数据；没有有效的中间文件时返回None
+        """
+        try:
+            from shipping_processor.intermediate.columnar import intermediate_for_xlsx, read_intermediate
+        except ImportError:
+            return None
+        found = intermediate_for_xlsx(file_path)
+        if found is None:
+            return None
+        return self.get('intermediate', file_path, lambda: read_intermediate(*found))
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._cache.clear()
+            self._key_locks.clear()
@@ -1,18 +1,24 @@
 import pandas as pd
-from .utils import find_column_with_pattern, compare_numeric_values
+from .utils import find_column_with_pattern, compare_numeric_values, as_excel_frame
+from .context import ValidationContext
+from .runner import run_checks
 
 class ImportInvoiceValidator:
     """进口发票验证器"""
 
-    def __init__(self):
-        """初始化验证器"""
-        pass
+    def __init__(self, context=None):
+        """初始化验证器
+
+        Args:
+            context: 共享的ValidationContext，为None时新建
+        """
+        self.context = context if context is not None else ValidationContext()
 
     def validate_row_merging(self, import_invoice_path):
         """验证相同Part Number和Unit Price的行是否已合并
 
         Args:
-            import_invoice_path: 进口发票文件路径
+            import_invoice_path: 进口发票文件路径，或写出之前内存中的进口发票DataFrame
 
         Returns:
             dict: 含success和message的验证结果
@@ -68,7 +74,7 @@ class ImportInvoiceValidator:
         """验证S/N是否从1开始编号
 
         Args:
-            import_invoice_path: 进口发票文件路径
+            import_invoice_path: 进口发票文件路径，或写出之前内存中的进口发票DataFrame
 
         Returns:
             dict: 含success和message的验证结果
@@ -163,11 +169,11 @@ class ImportInvoiceValidator:
             # 读取原始装箱单
             try:
                 # 尝试使用多级表头读取
-                original_df = pd.read_excel(original_packing_list_path, header=[1,2], skiprows=[0])
+                original_df = self.context.read_excel(original_packing_list_path, header=[1,2], skiprows=[0])
                 print(f"DEBUG: 使用多级表头读取原始装箱单成功")
             except Exception as e:
                 print(f"DEBUG: 使用多级表头读取失败，尝试使用skiprows=2: {str(e)}")
-                original_df = pd.read_excel(original_packing_list_path, skiprows=2)
+                original_df = self.context.read_excel(original_packing_list_path, skiprows=2)
                 print(f"DEBUG: 使用skiprows=2读取原始装箱单成功")
 
             # 找到原始装箱单中的进口清关货描列和料号列
@@ -241,7 +247,7 @@ class ImportInvoiceValidator:
         """验证合并行后的数量是否正确求和
 
         Args:
-            import_invoice_path: 进口发票文件路径
+            import_invoice_path: 进口发票文件路径，或写出之前内存中的进口发票DataFrame
 
         Returns:
             dict: 含success和message的验证结果
@@ -306,7 +312,7 @@ class ImportInvoiceValidator:
         """验证合并行后的金额是否正确求和
 
         Args:
-            import_invoice_path: 进口发票文件路径
+            import_invoice_path: 进口发票文件路径，或写出之前内存中的进口发票DataFrame
 
         Returns:
             dict: 含success和message的验证结果
@@ -370,7 +376,7 @@ class ImportInvoiceValidator:
         """验证合并行后的净重是否正确求和
 
         Args:
-            import_invoice_path: 进口发票文件路径
+            import_invoice_path: 进口发票文件路径，或写出之前内存中的进口发票DataFrame
 
         Returns:
             dict: 含success和message的验证结果
@@ -431,7 +437,25 @@ class ImportInvoiceValidator:
             return {"success": False, "message": f"验证净重求和时出错: {str(e)}, 行号: {error_line}"}
 
     def read_import_invoice(self, import_invoice_path):
-        """读取进口发票
+        """读取进口发票(同一文件在上下文中只解析一次)
+
+        Args:
+            import_invoice_path: 进口发票文件路径，或写出之前内存中的进口发票DataFrame
+
+        Returns:
+            DataFrame: 进口发票数据框或None
+        """
+        if isinstance(import_invoice_path, pd.DataFrame):
+            return as_excel_frame(import_invoice_path)
+        try:
+            return self.context.get('import_invoice', import_invoice_path,
+                                    lambda: self._load_import_invoice(import_invoice_path))
+        except Exception as e:
+            print(f"DEBUG: 无法读取进口发票 {import_invoice_path}: {str(e)}")
+            return None
+
+    def _load_import_invoice(self, import_invoice_path):
+        """定位并读取进口发票数据表
 
         Args:
             import_invoice_path: 进口发票文件路径
@@ -439,68 +463,91 @@ class ImportInvoiceValidator:
         Returns:
             DataFrame: 进口发票数据框或None
         """
-        import_df = None
-        # 尝试不同的skiprows值读取进口发票
-        for sheet_idx in range(1, 5):  # 尝试不同的工作表
+        # 优先按生成文件中记录的区域定义直接读取数据区
+        layout = self.context.sheet_layout(import_invoice_path)
+        for sheet_name, sheet_layout in sorted(layout.items(), key=lambda item: item[1]['index']):
+            if sheet_layout['index'] < 1:
+                continue
+            try:
+                import_df = self.context.read_layout_table(import_invoice_path, sheet_name, include_total=True)
+            except Exception:
+                continue
+            if import_df is not None and any('S/N' in str(col) or 'Part Number' in str(col) for col in import_df.columns):
+                print(f"DEBUG: 按区域定义读取进口发票 {import_invoice_path}, 工作表 {sheet_name}")
+                print(f"DEBUG: 进口发票列名: {import_df.columns.tolist()}")
+                return import_df
+
+        # 没有区域定义时，在已加载的工作簿中定位'S/N'/'Part Number'表头行，再从该行读取
+        wb = self.context.workbook(import_invoice_path)
+        for sheet_name in wb.sheetnames[1:5]:  # 尝试不同的工作表
             try:
-                sheet_names = pd.ExcelFile(import_invoice_path).sheet_names
-                if len(sheet_names) <= sheet_idx:
+                top_rows = self.context.read_excel(import_invoice_path, sheet_name=sheet_name, header=None, nrows=16)
+                header_idx = next((i for i, row in enumerate(top_rows.itertuples(index=False))
+                                   if any('S/N' in str(value) or 'Part Number' in str(value) for value in row if pd.notna(value))), None)
+                if header_idx is None:
                     continue
-                sheet_name = sheet_names[sheet_idx]
-                for skiprows in range(0, 15):  # 尝试不同的跳过行数
-                    try:
-                        temp_df = pd.read_excel(import_invoice_path, sheet_name=sheet_name, skiprows=skiprows)
-                        # 检查是否包含关键列名
-                        if any('S/N' in str(col) for col in temp_df.columns) or any('Part Number' in str(col) for col in temp_df.iloc[0].values if pd.notna(col)):
-                            # 如果第一行包含列名，则重新读取
-                            if any('S/N' in str(col) for col in temp_df.iloc[0].values if pd.notna(col)):
-                                import_df = pd.read_excel(import_invoice_path, sheet_name=sheet_name, skiprows=skiprows+1, header=0)
-                                # 重命名列
-                                for i, col in enumerate(import_df.columns):
-                                    if i < len(temp_df.columns) and pd.notna(temp_df.iloc[0, i]) and str(temp_df.iloc[0, i]).strip():
-                                        import_df.rename(columns={col: str(temp_df.iloc[0, i]).strip()}, inplace=True)
-                            else:
-                                import_df = temp_df
-
-                            print(f"DEBUG: 成功读取进口发票 {import_invoice_path}, 工作表 {sheet_name}, 跳过行数 {skiprows}")
-                            print(f"DEBUG: 进口发票列名: {import_df.columns.tolist()}")
-                            print(f"DEBUG: 进口发票前5行:\n{import_df.head()}")
-                            return import_df
-                    except Exception as e:
-                        continue
+
+                import_df = self.context.read_excel(import_invoice_path, sheet_name=sheet_name, skiprows=header_idx)
+                import_df.columns = [str(col).strip() if isinstance(col, str) else col for col in import_df.columns]
+                print(f"DEBUG: 成功读取进口发票 {import_invoice_path}, 工作表 {sheet_name}, 表头行 {header_idx + 1}")
+                print(f"DEBUG: 进口发票列名: {import_df.columns.tolist()}")
+                print(f"DEBUG: 进口发票前5行:\n{import_df.head()}")
+                return import_df
             except Exception as e:
                 continue
 
         return None
 
-    def validate_all(self, import_invoice_path, original_packing_list_path):
-        """运行所有进口发票验证
+    def get_checks(self, import_invoice_path, original_packing_list_path):
+        """列出所有进口发票检查，供validate_all顺序执行或由调用方并发执行
 
         Args:
             import_invoice_path: 进口发票文件路径
             original_packing_list_path: 原始装箱单文件路径
 
         Returns:
-            dict: 包含所有验证结果的字典
+            list: [(结果键, 检查函数), ...]
         """
-        results = {}
-
-        # 验证行合并
-        results["import_row_merging"] = self.validate_row_merging(import_invoice_path)
-
-        # 验证S/N编号
-        results["import_sn_numbering"] = self.validate_sn_numbering(import_invoice_path)
+        return [
+            # 验证行合并
+            ("import_row_merging", lambda: self.validate_row_merging(import_invoice_path)),
+            # 验证S/N编号
+            ("import_sn_numbering", lambda: self.validate_sn_numbering(import_invoice_path)),
+            # 验证描述字段
+            ("import_description_field", lambda: self.validate_description_field(import_invoice_path, original_packing_list_path)),
+            # 验证数量求和
+            ("import_quantity_sum", lambda: self.validate_quantity_sum(import_invoice_path)),
+            # 验证金额求和
+            ("import_amount_sum", lambda: self.validate_amount_sum(import_invoice_path)),
+            # 验证净重求和
+            ("import_net_weight_sum", lambda: self.validate_net_weight_sum(import_invoice_path)),
+        ]
+
+    def get_in_memory_checks(self, invoice_df):
+        """列出可直接作用于内存中进口发票的检查，供处理程序在写出文件之前调用
 
-        # 验证描述字段
-        results["import_description_field"] = self.validate_description_field(import_invoice_path, original_packing_list_path)
+        Args:
+            invoice_df: 内存中的进口发票DataFrame(含Total行)
 
-        # 验证数量求和
-        results["import_quantity_sum"] = self.validate_quantity_sum(import_invoice_path)
+        Returns:
+            list: [(结果键, 检查函数), ...]
+        """
+        return [
+            ("import_row_merging", lambda: self.validate_row_merging(invoice_df)),
+            ("import_sn_numbering", lambda: self.validate_sn_numbering(invoice_df)),
+            ("import_quantity_sum", lambda: self.validate_quantity_sum(invoice_df)),
+            ("import_amount_sum", lambda: self.validate_amount_sum(invoice_df)),
+            ("import_net_weight_sum", lambda: self.validate_net_weight_sum(invoice_df)),
+        ]
 
-        # 验证金额求和
-        results["import_amount_sum"] = self.validate_amount_sum(import_invoice_path)
+    def validate_all(self, import_invoice_path, original_packing_list_path):
+        """运行所有进口发票验证
 
-        # 验证净重求和
-        results["import_net_weight_sum"] = self.validate_net_weight_sum(import_invoice_path)
+        Args:
+            import_invoice_path: 进口发票文件路径
+            original_packing_list_path: 原始装箱单文件路径
 
-        return results
+        Returns:
+            dict: 包含所有验证结果的字典
+        """
+        return run_checks(self.get_checks(import_invoice_path, original_packing_list_path))
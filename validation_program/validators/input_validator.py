@@ -2,14 +2,26 @@ import pandas as pd
 import re
 import json
 import os
-from .utils import find_column_with_pattern, read_excel_to_df
+from .utils import find_column_with_pattern
+from shipping_processor.input.weights import normalize_weight_columns
+from .context import ValidationContext
+from .runner import run_checks
+
+# 总净重字段在英文和中文字段行中的名称
+WEIGHT_HEADER_LABELS = ["Total Net Weight (kg)", "总净重"]
 
 
 class InputValidator:
     """输入文件验证器"""
     
-    def __init__(self, config_path=None):
-        """初始化验证器"""
+    def __init__(self, config_path=None, context=None):
+        """初始化验证器
+
+        Args:
+            config_path: 验证规则配置文件路径，默认为config/validation_rules.json
+            context: 共享的ValidationContext，为None时新建
+        """
+        self.context = context if context is not None else ValidationContext()
         if config_path is None:
             # 默认配置路径
             current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -41,25 +53,30 @@ class InputValidator:
             int: 应跳过的表头行数
         """
         try:
-            # 读取前几行进行检测
-            header_rows = pd.read_excel(file_path, nrows=3, header=None)
-            
-            # 检查第一行是否是文件信息行(例如"装货清单 2025年更新版本")
-            first_row = str(header_rows.iloc[0, 0]) if not pd.isna(header_rows.iloc[0, 0]) else ""
-            
-            # if ("年" in first_row or "版本" in first_row) and len(first_row) < 30:
-            if ("采购装箱单" in first_row or "billionaire" in first_row) and len(first_row) < 30:
-                self.skiprows = 1
-                return 1
-                
-            # 默认不跳过表头
-            self.skiprows = 0
-            return 0
+            # 同一文件的检测结果缓存在上下文中
+            self.skiprows = self.context.get('file_structure', file_path,
+                                             lambda: self._detect_skiprows(file_path))
+            return self.skiprows
         except Exception:
             # 默认值
             self.skiprows = 0
             return 0
 
+    def _detect_skiprows(self, file_path):
+        """根据文件前几行判断应跳过的表头行数"""
+        # 读取前几行进行检测
+        header_rows = self.context.read_excel(file_path, nrows=3, header=None)
+        
+        # 检查第一行是否是文件信息行(例如"装货清单 2025年更新版本")
+        first_row = str(header_rows.iloc[0, 0]) if not pd.isna(header_rows.iloc[0, 0]) else ""
+        
+        # if ("年" in first_row or "版本" in first_row) and len(first_row) < 30:
+        if ("采购装箱单" in first_row or "billionaire" in first_row) and len(first_row) < 30:
+            return 1
+            
+        # 默认不跳过表头
+        return 0
+
     def validate_packing_list_header(self, file_path):
         """验证采购装箱单表头
         
@@ -71,7 +88,7 @@ class InputValidator:
         """
         try:
             # 读取前几行进行检测，确保不使用第一行作为列名
-            header_rows = pd.read_excel(file_path, nrows=3, header=None)
+            header_rows = self.context.read_excel(file_path, nrows=3, header=None)
             
             # 打印调试信息
             print("DEBUG: 读取到的表头内容：")
@@ -147,7 +164,7 @@ class InputValidator:
             str: 提取的编号，若未找到则返回None
         """
         try:
-            header_rows = pd.read_excel(file_path, nrows=3, header=None)
+            header_rows = self.context.read_excel(file_path, nrows=3, header=None)
             
             # 遍历前几行寻找编号
             for i in range(min(3, len(header_rows))):
@@ -181,7 +198,7 @@ class InputValidator:
                 
             # 读取表头行
             start_row = self.skiprows
-            header_df = pd.read_excel(file_path, header=None, skiprows=start_row, nrows=4)
+            header_df = self.context.read_excel(file_path, header=None, skiprows=start_row, nrows=4)
             
             # 通常字段名在第1,2行(经过skiprows处理后)
             english_row = header_df.iloc[0]  # 跳过行后的第一行
@@ -251,6 +268,17 @@ class InputValidator:
         except Exception as e:
             return {"success": False, "message": f"验证字段头时出错: {str(e)}。文件路径: {file_path}"}
     
+    def _find_weight_header_row(self, file_path, max_rows=10):
+        """查找重量字段所在的表头行(0起)
+
+        取前几行中最后一个含有总净重字段名的行，即英文字段行之后的中文字段行
+        (中文字段行重复时取最后一行)；都没有时按read_excel_file的布局取第3行
+        """
+        rows = self.context.read_excel(file_path, nrows=max_rows, header=None)
+        header_rows = [idx for idx in range(len(rows))
+                       if rows.iloc[idx].astype(str).str.strip().isin(WEIGHT_HEADER_LABELS).any()]
+        return header_rows[-1] if header_rows else 2
+
     def validate_weights(self, file_path):
         """验证每个箱号的总净重小于总毛重
         
@@ -262,118 +290,37 @@ class InputValidator:
         """
         print(f"开始验证净重毛重 - 文件: {file_path}")
         try:
-            if self.skiprows == 0:
-                self.detect_file_structure(file_path)
-            print(f"跳过行数: {self.skiprows+2}")
-            df = read_excel_to_df(file_path, skiprows=self.skiprows+2)
+            # 与read_excel_file相同的表头布局(标题行、英文字段行、中文字段行)，以中文字段行为表头；
+            # 标题行为空或中文字段行重复时按重量字段所在的行定位
+            header_row = self.context.get('weight_header_row', file_path,
+                                          lambda: self._find_weight_header_row(file_path))
+            print(f"表头行: {header_row + 1}")
+            df = self.context.read_excel(file_path, header=header_row)
             print(f"成功读取数据，共 {len(df)} 行")
             net_weight_col = find_column_with_pattern(df, ["Total Net Weight (kg)", "总净重"])
             gross_weight_col = find_column_with_pattern(df, ["Total Gross Weight (kg)", "总毛重"])
             carton_number_col = find_column_with_pattern(df, ["Carton Number", "箱号"])
-            print(f"列索引 - 净重: {net_weight_col}, 毛重: {gross_weight_col}, 箱号: {carton_number_col}")
+            print(f"列 - 净重: {net_weight_col}, 毛重: {gross_weight_col}, 箱号: {carton_number_col}")
             if net_weight_col is None or gross_weight_col is None:
                 return {"success": False, "message": "未找到净重或毛重列。验收标准: 装箱单必须包含总净重和总毛重列。"}
             if carton_number_col is None:
                 return {"success": False, "message": "未找到箱号列。验收标准: 装箱单必须包含箱号列。"}
 
-            # 改进的安全转换函数，更好地处理非数值和通配符
-            def safe_convert_to_float(val, row_idx, col_name, error_log):
-                try:
-                    # 处理空值
-                    if val is None or pd.isna(val) or val == "":
-                        error_log.append(f"第{row_idx+1}行{col_name}为空值，自动按0处理")
-                        return 0.0
-                    
-                    # 如果已经是数值类型，直接返回
-                    if isinstance(val, (int, float)):
-                        return float(val)
-                    
-                    # 转换为字符串并清理
-                    val_str = str(val).strip().replace(',', '')
-                    if not val_str:
-                        error_log.append(f"第{row_idx+1}行{col_name}为空字符串，自动按0处理")
-                        return 0.0
-                    
-                    # 检查是否包含通配符或特殊字符
-                    wildcards = ['*', '?', 'N/A', 'n/a', 'TBD', 'tbd', '-', '/', '\\']
-                    if any(x in val_str.lower() for x in wildcards):
-                        error_log.append(f"第{row_idx+1}行{col_name}包含通配符或特殊字符'{val_str}'，自动按0处理")
-                        return 0.0
-                    
-                    # 尝试直接转换为浮点数
-                    try:
-                        result = float(val_str)
-                        if result < 0:
-                            error_log.append(f"第{row_idx+1}行{col_name}为负值'{val_str}'，自动按0处理")
-                            return 0.0
-                        return result
-                    except (ValueError, TypeError):
-                        # 尝试清理字符串后转换
-                        clean_str = ''.join(c for c in val_str if c.isdigit() or c == '.')
-                        
-                        # 确保只有一个小数点
-                        if clean_str and clean_str.count('.') <= 1:
-                            if clean_str.startswith('.'):
-                                clean_str = '0' + clean_str
-                            if clean_str.endswith('.'):
-                                clean_str = clean_str + '0'
-                            
-                            if clean_str:
-                                try:
-                                    result = float(clean_str)
-                                    if result < 0:
-                                        error_log.append(f"第{row_idx+1}行{col_name}清理后为负值'{clean_str}'，自动按0处理")
-                                        return 0.0
-                                    return result
-                                except:
-                                    pass
-                        
-                        error_log.append(f"第{row_idx+1}行{col_name}值'{val_str}'无法解析为数值，自动按0处理")
-                        return 0.0
-                except Exception as e:
-                    error_log.append(f"第{row_idx+1}行{col_name}处理时出错: {str(e)}，自动按0处理")
-                    return 0.0
+            # 去掉数据中重复的表头行
+            header_text = df[net_weight_col].astype(str).str.strip()
+            df = df[~header_text.isin(WEIGHT_HEADER_LABELS)]
 
-            carton_net_weights = {}
-            carton_gross_weights = {}
-            carton_rows = {}
-            error_log = []  # 记录被容错的异常值
-            
-            # 处理每一行数据
-            for idx, row in df.iterrows():
-                try:
-                    # 只处理有箱号的行
-                    if pd.notna(row[carton_number_col]):
-                        current_carton = str(row[carton_number_col])
-                        
-                        # 初始化该箱号的数据
-                        if current_carton not in carton_rows:
-                            carton_rows[current_carton] = []
-                            carton_net_weights[current_carton] = 0.0
-                            carton_gross_weights[current_carton] = 0.0
-                        
-                        # 记录行号（Excel中的实际行号）
-                        carton_rows[current_carton].append(idx + self.skiprows + 3)
-                        
-                        # 安全获取净重和毛重值
-                        try:
-                            net_weight_raw = row[net_weight_col] if net_weight_col < len(row) else None
-                        except:
-                            net_weight_raw = None
-                            
-                        try:
-                            gross_weight_raw = row[gross_weight_col] if gross_weight_col < len(row) else None
-                        except:
-                            gross_weight_raw = None
-                        
-                        # 转换为浮点数并累加
-                        net_weight_value = safe_convert_to_float(net_weight_raw, idx, "净重", error_log)
-                        gross_weight_value = safe_convert_to_float(gross_weight_raw, idx, "毛重", error_log)
-                        carton_net_weights[current_carton] += net_weight_value
-                        carton_gross_weights[current_carton] += gross_weight_value
-                except Exception as e:
-                    error_log.append(f"处理第{idx+1}行时出错: {str(e)}，自动跳过")
-                    continue
+            # 只处理有箱号的行；重量在内存中统一转换，空值和通配符按0处理并记录原因
+            # (行号为Excel中的实际行号: 表头行之后的第一行索引为0)
+            df = df[df[carton_number_col].notna()]
+            df, error_log = normalize_weight_columns(
+                df, {net_weight_col: "净重", gross_weight_col: "毛重"}, row_offset=header_row + 2)
+
+            cartons = df[carton_number_col].astype(str)
+            carton_net_weights = df[net_weight_col].groupby(cartons, sort=False).sum().to_dict()
+            carton_gross_weights = df[gross_weight_col].groupby(cartons, sort=False).sum().to_dict()
+            carton_rows = {carton: [idx + header_row + 2 for idx in rows]
+                           for carton, rows in df.groupby(cartons, sort=False).groups.items()}
             
             # 验证每个箱号的净重是否小于毛重
             invalid_cartons = []
@@ -445,7 +392,7 @@ class InputValidator:
                 }
                 
             # 读取政策文件
-            policy_df = pd.read_excel(policy_file_path, index_col=0)
+            policy_df = self.context.read_excel(policy_file_path, index_col=0)
             print(f"DEBUG: 政策文件内容：\n{policy_df.head()}")
             
             # 查找编号列或表头
@@ -511,7 +458,7 @@ class InputValidator:
         """
         try:
             # 读取政策文件
-            policy_df = pd.read_excel(policy_file_path, index_col=0)
+            policy_df = self.context.read_excel(policy_file_path, index_col=0)
             
             # 直接通过索引获取汇率值
             try:
@@ -536,7 +483,7 @@ class InputValidator:
         """
         try:
             # 读取政策文件为DataFrame
-            policy_df = pd.read_excel(policy_file_path)
+            policy_df = self.context.read_excel(policy_file_path)
             
             # 将DataFrame转换为字符串以便于搜索
             # 合并所有单元格内容为一个大字符串
@@ -583,24 +530,48 @@ class InputValidator:
         except Exception as e:
             return {"success": False, "message": f"sheet_naming校验异常: {str(e)}"}
 
-    def validate_all(self, packing_list_path, policy_file_path, reimport_invoice_files=None):
-        """运行所有输入验证，支持reimport发票文件校验"""
-        results = {}
-        header_result = self.validate_packing_list_header(packing_list_path)
-        results["packing_list_header"] = header_result
-        packing_list_id = None
+    def _packing_list_header_result(self, packing_list_path):
+        """表头验证结果，同一文件只验证一次(政策文件编号校验依赖其中的编号)"""
+        try:
+            return self.context.get('packing_list_header', packing_list_path,
+                                    lambda: self.validate_packing_list_header(packing_list_path))
+        except OSError:
+            return self.validate_packing_list_header(packing_list_path)
+
+    def _packing_list_id(self, packing_list_path):
+        """从表头验证结果中提取采购装箱单编号"""
+        header_result = self._packing_list_header_result(packing_list_path)
         if header_result["success"]:
             match = re.search(r'编号: \'([^\']+)\'', header_result["message"])
             if match:
-                packing_list_id = match.group(1)
-        results["packing_list_field_headers"] = self.validate_packing_list_field_headers(packing_list_path)
-        results["weights"] = self.validate_weights(packing_list_path)
-        results["summary_data"] = self.validate_summary_data(packing_list_path)
-        results["policy_file_id"] = self.validate_policy_file_id(policy_file_path, packing_list_id)
-        results["exchange_rate_decimal"] = self.validate_exchange_rate_decimal(policy_file_path)
-        results["company_bank_info"] = self.validate_company_bank_info(policy_file_path)
+                return match.group(1)
+        return None
+
+    def get_checks(self, packing_list_path, policy_file_path, reimport_invoice_files=None):
+        """列出所有输入检查，供validate_all顺序执行或由调用方并发执行
+
+        Args:
+            packing_list_path: 采购装箱单文件路径
+            policy_file_path: 政策文件路径
+            reimport_invoice_files: reimport发票文件列表，为None时不校验命名
+
+        Returns:
+            list: [(结果键, 检查函数), ...]
+        """
+        checks = [
+            ("packing_list_header", lambda: self._packing_list_header_result(packing_list_path)),
+            ("packing_list_field_headers", lambda: self.validate_packing_list_field_headers(packing_list_path)),
+            ("weights", lambda: self.validate_weights(packing_list_path)),
+            ("summary_data", lambda: self.validate_summary_data(packing_list_path)),
+            ("policy_file_id", lambda: self.validate_policy_file_id(policy_file_path, self._packing_list_id(packing_list_path))),
+            ("exchange_rate_decimal", lambda: self.validate_exchange_rate_decimal(policy_file_path)),
+            ("company_bank_info", lambda: self.validate_company_bank_info(policy_file_path)),
+        ]
         # 新增三项验收
         if reimport_invoice_files is not None:
-  
-            results["sheet_naming"] = self.validate_sheet_naming(reimport_invoice_files)
-        return results
\ No newline at end of file
+            checks.append(("sheet_naming", lambda: self.validate_sheet_naming(reimport_invoice_files)))
+        return checks
+
+    def validate_all(self, packing_list_path, policy_file_path, reimport_invoice_files=None):
+        """运行所有输入验证，支持reimport发票文件校验"""
+        return run_checks(self.get_checks(packing_list_path, policy_file_path, reimport_invoice_files))
@@ -2,14 +2,22 @@ import pandas as pd
 import re
 import json
 import os
-from .utils import find_column_with_pattern, read_excel_to_df, compare_numeric_values, find_value_by_fieldname
+from .utils import find_column_with_pattern, read_excel_to_df, compare_numeric_values, find_value_by_fieldname, as_excel_frame
+from .context import ValidationContext
+from .runner import run_checks
 
 
 class ProcessValidator:
     """处理逻辑验证器"""
     
-    def __init__(self, config_path=None):
-        """初始化验证器"""
+    def __init__(self, config_path=None, context=None):
+        """初始化验证器
+
+        Args:
+            config_path: 验证规则配置文件路径，默认为config/validation_rules.json
+            context: 共享的ValidationContext，为None时新建
+        """
+        self.context = context if context is not None else ValidationContext()
         if config_path is None:
             # 默认配置路径
             current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -25,6 +33,30 @@ class ProcessValidator:
             self.rules = {"price_validation": {"decimal_places": {"unit_price": 6, "total_amount": 2}}}
             print(f"DEBUG: 配置文件不存在，使用默认配置: {self.rules}")
     
+    def _read_invoice(self, invoice, **kwargs):
+        """读取生成的发票
+
+        Args:
+            invoice: 发票文件路径，或写出之前内存中的发票DataFrame
+            kwargs: 按文件读取时传给read_excel的参数(指定参数时不使用中间文件)
+
+        Returns:
+            pandas.DataFrame: 发票数据
+        """
+        if isinstance(invoice, pd.DataFrame):
+            return as_excel_frame(invoice)
+        if not kwargs:
+            # 有对应的中间文件时直接读取，不再解析xlsx
+            intermediate = self.context.read_intermediate(invoice)
+            if intermediate is not None:
+                return as_excel_frame(intermediate)
+        return self.context.read_excel(invoice, **kwargs)
+
+    @staticmethod
+    def _describe(invoice):
+        """用于调试输出的发票来源描述"""
+        return "内存数据" if isinstance(invoice, pd.DataFrame) else invoice
+
     def validate_trade_type_identification(self, original_packing_list_path):
         """验证贸易类型识别逻辑
         
@@ -38,12 +70,12 @@ class ProcessValidator:
             # 读取采购装箱单，正确处理表头结构
             try:
                 # 第一行是表格标题，第二行是英文表头，第三行是中文表头
-                df = pd.read_excel(original_packing_list_path, header=[1,2], skiprows=[0])
+                df = self.context.read_excel(original_packing_list_path, header=[1,2], skiprows=[0])
                 print(f"DEBUG: 贸易类型识别 - 正确加载后的列名: {df.columns.tolist()}")
             except Exception as e:
                 print(f"DEBUG: 使用多级表头读取失败，尝试替代方法: {str(e)}")
                 # 如果上面的方法失败，使用传统方法
-                df = pd.read_excel(original_packing_list_path, skiprows=2)
+                df = self.context.read_excel(original_packing_list_path, skiprows=2)
             
             # 查找贸易类型列
             trade_type_columns = ["出口报关方式", "export declaration", "贸易类型", "trade type"]
@@ -94,7 +126,7 @@ class ProcessValidator:
         
         Args:
             original_packing_list_path: 原始采购装箱单文件路径
-            cif_invoice_path: CIF发票文件路径
+            cif_invoice_path: CIF发票文件路径，或写出之前内存中的CIF发票DataFrame
             
         Returns:
             dict: 含success和message的验证结果
@@ -103,17 +135,17 @@ class ProcessValidator:
             # 读取采购装箱单
             try:
                 # 正确处理多层表头
-                original_df = pd.read_excel(original_packing_list_path, header=[1,2], skiprows=[0])
+                original_df = self.context.read_excel(original_packing_list_path, header=[1,2], skiprows=[0])
                 print(f"DEBUG: 贸易类型拆分 - 装箱单列名: {original_df.columns.tolist()}")
             except Exception as e:
                 print(f"DEBUG: 多层表头读取失败，尝试替代方法: {str(e)}")
-                original_df = pd.read_excel(original_packing_list_path, skiprows=2)
+                original_df = self.context.read_excel(original_packing_list_path, skiprows=2)
             
             # 查找贸易类型列
             trade_type_col = find_column_with_pattern(original_df, ["出口报关方式", "export declaration", "贸易类型"])
             
             # 读取CIF发票
-            cif_df = pd.read_excel(cif_invoice_path)
+            cif_df = self._read_invoice(cif_invoice_path)
             
             # 如果找不到贸易类型列，默认所有行为一般贸易
             if trade_type_col is None:
@@ -149,7 +181,7 @@ class ProcessValidator:
         Args:
             original_packing_list_path: 原始采购装箱单文件路径
             policy_file_path: 政策文件路径
-            cif_invoice_path: CIF发票文件路径
+            cif_invoice_path: CIF发票文件路径，或写出之前内存中的CIF发票DataFrame
             
         Returns:
             dict: 含success和message的验证结果
@@ -157,15 +189,15 @@ class ProcessValidator:
         try:
             # 读取采购装箱单
             try:
-                original_df = pd.read_excel(original_packing_list_path, header=[1,2], skiprows=[0])
+                original_df = self.context.read_excel(original_packing_list_path, header=[1,2], skiprows=[0])
                 print(f"DEBUG: FOB价格计算 - 装箱单列名: {original_df.columns.tolist()}")
             except Exception as e:
                 print(f"DEBUG: 多层表头读取失败，尝试替代方法: {str(e)}")
-                original_df = pd.read_excel(original_packing_list_path, skiprows=2)
+                original_df = self.context.read_excel(original_packing_list_path, skiprows=2)
             # 读取政策文件（无表头，竖表结构）
-            policy_df = pd.read_excel(policy_file_path, header=None)
+            policy_df = self.context.read_excel(policy_file_path, header=None)
             # 读取CIF发票
-            cif_df = pd.read_excel(cif_invoice_path)
+            cif_df = self._read_invoice(cif_invoice_path)
             # 找到原始采购单价列
             original_price_col = None
             price_patterns = ["Unit Price", "单价", "采购单价"]
@@ -185,7 +217,7 @@ class ProcessValidator:
             markup_percentage = find_value_by_fieldname(policy_df, ["加价", "加价率", "markup", "Markup"])
             # 找不到再用原有列查找逻辑
             if markup_percentage is None:
-                policy_df2 = pd.read_excel(policy_file_path)  # 尝试横表
+                policy_df2 = self.context.read_excel(policy_file_path)  # 尝试横表
                 markup_col = find_column_with_pattern(policy_df2, ["加价", "markup", "Markup"])
                 if markup_col is not None:
                     for _, row in policy_df2.iterrows():
@@ -221,13 +253,13 @@ class ProcessValidator:
         """
         try:
             # 读取政策文件（无表头，竖表结构）
-            policy_df = pd.read_excel(policy_file_path, header=None)
+            policy_df = self.context.read_excel(policy_file_path, header=None)
             # 优先通过字段名查找保险费率和保险系数
             insurance_rate = find_value_by_fieldname(policy_df, ["保险费率", "Insurance Rate"])
             insurance_factor = find_value_by_fieldname(policy_df, ["保险系数", "Insurance Factor"])
             # 找不到再用原有列查找逻辑
             if insurance_rate is None or insurance_factor is None:
-                policy_df2 = pd.read_excel(policy_file_path)
+                policy_df2 = self.context.read_excel(policy_file_path)
                 insurance_rate_col = find_column_with_pattern(policy_df2, ["保险费率", "Insurance Rate"])
                 insurance_factor_col = find_column_with_pattern(policy_df2, ["保险系数", "Insurance Factor"])
                 for _, row in policy_df2.iterrows():
@@ -256,21 +288,21 @@ class ProcessValidator:
         """
         try:
             try:
-                header_df = pd.read_excel(original_packing_list_path, nrows=3)
+                header_df = self.context.read_excel(original_packing_list_path, nrows=3)
                 print(f"DEBUG: 表格前3行: {header_df.values.tolist()}")
-                original_df = pd.read_excel(original_packing_list_path, header=[1,2], skiprows=[0])
+                original_df = self.context.read_excel(original_packing_list_path, header=[1,2], skiprows=[0])
                 print(f"DEBUG: 正确加载后的列名: {original_df.columns.tolist()}")
             except Exception as e:
                 print(f"DEBUG: 多层表头读取失败: {str(e)}，尝试替代方法")
-                original_df = pd.read_excel(original_packing_list_path, skiprows=2)
+                original_df = self.context.read_excel(original_packing_list_path, skiprows=2)
                 print(f"DEBUG: 使用skiprows=2读取的列名: {original_df.columns.tolist()}")
             # 读取政策文件（无表头，竖表结构）
-            policy_df = pd.read_excel(policy_file_path, header=None)
+            policy_df = self.context.read_excel(policy_file_path, header=None)
             # 优先通过字段名查找总运费
             total_freight = find_value_by_fieldname(policy_df, ["总运费", "运费", "Freight", "Total Freight"])
             # 找不到再用原有列查找逻辑
             if total_freight is None:
-                policy_df2 = pd.read_excel(policy_file_path)
+                policy_df2 = self.context.read_excel(policy_file_path)
                 total_freight_col = find_column_with_pattern(policy_df2, ["总运费", "Total Freight", "Freight", "运费"])
                 if total_freight_col is not None:
                     for _, row in policy_df2.iterrows():
@@ -338,14 +370,14 @@ class ProcessValidator:
         """验证CIF价格计算
         
         Args:
-            cif_invoice_path: CIF发票文件路径
+            cif_invoice_path: CIF发票文件路径，或写出之前内存中的CIF发票DataFrame
             
         Returns:
             dict: 含success和message的验证结果
         """
         try:
             # 读取CIF发票
-            cif_df = pd.read_excel(cif_invoice_path)
+            cif_df = self._read_invoice(cif_invoice_path)
             
             # 找到FOB单价、单个物料保险费、单个物料运费、CIF单价列
             fob_price_col = find_column_with_pattern(cif_df, ["FOB Unit Price", "FOB总价"])
@@ -382,8 +414,8 @@ class ProcessValidator:
         """验证相同物料编号和价格的合并逻辑
         
         Args:
-            cif_invoice_path: CIF发票文件路径
-            export_invoice_path: 出口发票文件路径
+            cif_invoice_path: CIF发票文件路径，或写出之前内存中的CIF发票DataFrame
+            export_invoice_path: 出口发票文件路径，或写出之前内存中的出口发票DataFrame
             
         Returns:
             dict: 含success和message的验证结果
@@ -391,23 +423,28 @@ class ProcessValidator:
         try:
             # 读取CIF发票
             try:
-                cif_df = pd.read_excel(cif_invoice_path)
-                print(f"DEBUG: 成功读取CIF发票: {cif_invoice_path}")
+                cif_df = self._read_invoice(cif_invoice_path)
+                print(f"DEBUG: 成功读取CIF发票: {self._describe(cif_invoice_path)}")
                 print(f"DEBUG: CIF发票行数: {len(cif_df)}")
                 print(f"DEBUG: CIF发票前3行:\n{cif_df.head(3)}")
             except Exception as e:
                 return {"success": False, "message": f"读取CIF发票时出错: {str(e)}"}
             
-            # 读取出口发票
+            # 读取出口发票，优先按区域定义读取数据区
             try:
-                export_df = pd.read_excel(export_invoice_path, sheet_name=1, skiprows=9)
-                print(f"DEBUG: 成功读取出口发票: {export_invoice_path}")
+                if isinstance(export_invoice_path, pd.DataFrame):
+                    export_df = self._read_invoice(export_invoice_path)
+                else:
+                    export_df = self.context.read_layout_table(export_invoice_path, sheet_name=1)
+                if export_df is None:
+                    export_df = self.context.read_excel(export_invoice_path, sheet_name=1, skiprows=9)
+                print(f"DEBUG: 成功读取出口发票: {self._describe(export_invoice_path)}")
                 print(f"DEBUG: 出口发票行数: {len(export_df)}")
                 print(f"DEBUG: 出口发票前3行:\n{export_df.head(3)}")
             except Exception as e:
                 try:
                     # 尝试不使用skiprows
-                    export_df = pd.read_excel(export_invoice_path, sheet_name=1)
+                    export_df = self.context.read_excel(export_invoice_path, sheet_name=1)
                     print(f"DEBUG: 不使用skiprows读取出口发票成功")
                 except Exception as e2:
                     return {"success": False, "message": f"读取出口发票时出错: {str(e)}, 再次尝试失败: {str(e2)}"}
@@ -537,8 +574,8 @@ class ProcessValidator:
             error_line = traceback.extract_tb(e.__traceback__)[-1][1]
             return {"success": False, "message": f"验证物料合并逻辑时出错: {str(e)}, 行号: {error_line}"}
        
-    def validate_all(self, original_packing_list_path, policy_file_path, cif_invoice_path, export_invoice_path, import_invoice_dir):
-        """运行所有处理逻辑验证
+    def get_checks(self, original_packing_list_path, policy_file_path, cif_invoice_path, export_invoice_path, import_invoice_dir):
+        """列出所有处理逻辑检查，供validate_all顺序执行或由调用方并发执行
         
         Args:
             original_packing_list_path: 原始采购装箱单文件路径
@@ -548,55 +585,70 @@ class ProcessValidator:
             import_invoice_dir: 进口发票文件目录
             
         Returns:
-            dict: 包含所有验证结果的字典
+            list: [(结果键, 检查函数), ...]
         """
-        results = {}
-        
         # 贸易类型验证
-        results["trade_type_identification"] = self.validate_trade_type_identification(
-            original_packing_list_path
-        )
-        
-        if cif_invoice_path:
-            results["trade_type_split"] = self.validate_trade_type_split(
-                original_packing_list_path,
-                cif_invoice_path
-            )
+        checks = [
+            ("trade_type_identification", lambda: self.validate_trade_type_identification(original_packing_list_path)),
+        ]
         
-        # 价格计算验证
         if cif_invoice_path:
-            results["fob_price_calculation"] = self.validate_fob_price_calculation(
-                original_packing_list_path,
-                policy_file_path,
-                cif_invoice_path
-            )
-            
-            results["insurance_calculation"] = self.validate_insurance_calculation(
-                original_packing_list_path,
-                policy_file_path,
-                cif_invoice_path
-            )
-            
-            results["freight_calculation"] = self.validate_freight_calculation(
-                original_packing_list_path,
-                policy_file_path,
-                cif_invoice_path
-            )
-            
-            results["cif_price_calculation"] = self.validate_cif_price_calculation(
-                cif_invoice_path
-            )
+            checks.append(("trade_type_split", lambda: self.validate_trade_type_split(
+                original_packing_list_path, cif_invoice_path)))
+            
+            # 价格计算验证
+            checks.append(("fob_price_calculation", lambda: self.validate_fob_price_calculation(
+                original_packing_list_path, policy_file_path, cif_invoice_path)))
+            checks.append(("insurance_calculation", lambda: self.validate_insurance_calculation(
+                original_packing_list_path, policy_file_path, cif_invoice_path)))
+            checks.append(("freight_calculation", lambda: self.validate_freight_calculation(
+                original_packing_list_path, policy_file_path, cif_invoice_path)))
+            checks.append(("cif_price_calculation", lambda: self.validate_cif_price_calculation(cif_invoice_path)))
         
         # 合并和拆分验证
         if cif_invoice_path and export_invoice_path:
-            results["merge_logic"] = self.validate_merge_logic(
-                cif_invoice_path,
-                export_invoice_path
-            )
+            checks.append(("merge_logic", lambda: self.validate_merge_logic(cif_invoice_path, export_invoice_path)))
         
+        return checks
+
+    def get_in_memory_checks(self, original_packing_list_path, policy_file_path, cif_df):
+        """列出可直接作用于内存中CIF发票的价格检查，供处理程序在写出文件之前调用
+        (合并逻辑检查需要出口发票，由调用方在出口发票生成后调用validate_merge_logic)
+
+        Args:
+            original_packing_list_path: 原始采购装箱单文件路径
+            policy_file_path: 政策文件路径
+            cif_df: 内存中的CIF发票DataFrame
 
+        Returns:
+            list: [(结果键, 检查函数), ...]
+        """
+        return [
+            ("fob_price_calculation", lambda: self.validate_fob_price_calculation(
+                original_packing_list_path, policy_file_path, cif_df)),
+            ("insurance_calculation", lambda: self.validate_insurance_calculation(
+                original_packing_list_path, policy_file_path, cif_df)),
+            ("freight_calculation", lambda: self.validate_freight_calculation(
+                original_packing_list_path, policy_file_path, cif_df)),
+            ("cif_price_calculation", lambda: self.validate_cif_price_calculation(cif_df)),
+        ]
+
+    def validate_all(self, original_packing_list_path, policy_file_path, cif_invoice_path, export_invoice_path, import_invoice_dir):
+        """运行所有处理逻辑验证
         
-        return results 
+        Args:
+            original_packing_list_path: 原始采购装箱单文件路径
+            policy_file_path: 政策文件路径
+            cif_invoice_path: CIF发票文件路径
+            export_invoice_path: 出口发票文件路径
+            import_invoice_dir: 进口发票文件目录
+            
+        Returns:
+            dict: 包含所有验证结果的字典
+        """
+        return run_checks(self.get_checks(
+            original_packing_list_path, policy_file_path, cif_invoice_path, export_invoice_path, import_invoice_dir
+        ))
 
     def validate_original_file_required_columns(self, original_packing_list_path):
         """验证原始包装单是否包含所需列
@@ -610,12 +662,12 @@ class ProcessValidator:
         try:
             # 尝试使用复合表头读取
             try:
-                df = pd.read_excel(original_packing_list_path, header=[1,2], skiprows=[0])
+                df = self.context.read_excel(original_packing_list_path, header=[1,2], skiprows=[0])
                 print(f"DEBUG: 使用复合表头读取原始包装单成功: {original_packing_list_path}")
                 print(f"DEBUG: 列名: {df.columns.tolist()}")
             except Exception as e:
                 print(f"DEBUG: 使用复合表头读取失败，尝试使用skiprows=2: {str(e)}")
-                df = pd.read_excel(original_packing_list_path, skiprows=2)
+                df = self.context.read_excel(original_packing_list_path, skiprows=2)
                 print(f"DEBUG: 使用skiprows=2读取原始包装单成功")
                 print(f"DEBUG: 列名: {df.columns.tolist()}")
             
@@ -637,17 +689,17 @@ class ProcessValidator:
         """
         try:
             # 读取进口发票
-            import_df = pd.read_excel(import_invoice_path, skiprows=2)
+            import_df = self.context.read_excel(import_invoice_path, skiprows=2)
             print(f"DEBUG: 读取进口发票成功: {import_invoice_path}")
             print(f"DEBUG: 进口发票列名: {import_df.columns.tolist()}")
             
             # 读取原始包装单
             try:
-                original_df = pd.read_excel(original_packing_list_path, header=[1,2], skiprows=[0])
+                original_df = self.context.read_excel(original_packing_list_path, header=[1,2], skiprows=[0])
                 print(f"DEBUG: 使用复合表头读取原始包装单成功")
             except Exception as e:
                 print(f"DEBUG: 使用复合表头读取失败，尝试使用skiprows=2: {str(e)}")
-                original_df = pd.read_excel(original_packing_list_path, skiprows=2)
+                original_df = self.context.read_excel(original_packing_list_path, skiprows=2)
                 print(f"DEBUG: 使用skiprows=2读取原始包装单成功")
             
             print(f"DEBUG: 原始包装单列名: {original_df.columns.tolist()}")
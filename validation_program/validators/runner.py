@@ -0,0 +1,38 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def run_check(check):
+    """执行单个检查并记录耗时
+
+    Args:
+        check: 无参数的检查函数，返回含success和message的字典
+
+    Returns:
+        dict: 检查结果，附加duration字段(秒)
+    """
+    start = time.perf_counter()
+    result = dict(check())
+    result["duration"] = time.perf_counter() - start
+    return result
+
+
+def run_checks(checks, jobs=1):
+    """执行一组检查
+
+    jobs大于1时在线程池中并发执行。使用线程而不是进程，是为了让所有检查共享同一个
+    ValidationContext中已解析的文件。无论完成顺序如何，结果都按checks中的顺序合并。
+
+    Args:
+        checks: [(结果键, 检查函数), ...]
+        jobs: 并发数，默认为1(顺序执行)
+
+    Returns:
+        dict: {结果键: 检查结果}
+    """
+    if jobs is None or jobs <= 1 or len(checks) <= 1:
+        return {key: run_check(check) for key, check in checks}
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [(key, executor.submit(run_check, check)) for key, check in checks]
+        return {key: future.result() for key, future in futures}
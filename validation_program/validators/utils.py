@@ -1,5 +1,10 @@
 import os
 import pandas as pd
+import openpyxl
+from openpyxl.utils import range_boundaries
+
+# 与merge.py写入的工作簿级定义名称保持一致: LAYOUT_<工作表序号>_<HEADER|DATA|TOTAL|FOOTER>
+LAYOUT_NAME_PREFIX = 'LAYOUT_'
 
 def get_output_files(output_dir):
     """获取输出目录中的所有文件"""
@@ -22,6 +27,91 @@ def read_excel_to_df(file_path, sheet_name=0, skiprows=None):
     """
     return pd.read_excel(file_path, sheet_name=sheet_name, skiprows=skiprows)
 
+def as_excel_frame(df):
+    """把内存中的DataFrame整理成写入Excel后再读回时的形式
+
+    空字符串在Excel中是空单元格，读回后为NaN；列名读回时会去掉首尾空格。
+    这样同一套检查既能用于生成的文件，也能直接用于写出之前的内存数据。
+
+    Args:
+        df: 内存中的DataFrame
+
+    Returns:
+        pandas.DataFrame: 整理后的副本
+    """
+    frame = df.replace('', float('nan')).infer_objects()
+    frame.columns = [str(col).strip() for col in frame.columns]
+    return frame.reset_index(drop=True)
+
+def read_sheet_layout(file_path):
+    """读取生成文件中记录的表格区域(表头行、数据区、合计行、页脚区)
+
+    Args:
+        file_path: Excel文件路径或已加载的openpyxl工作簿
+
+    Returns:
+        dict: {工作表名: {'index': 工作表序号, 'header'/'data'/'total'/'footer': (起始行, 结束行, 起始列, 结束列)}}，
+              文件中没有区域定义时返回空字典
+    """
+    if isinstance(file_path, openpyxl.Workbook):
+        wb = file_path
+    else:
+        try:
+            wb = openpyxl.load_workbook(file_path, read_only=True)
+        except Exception:
+            return {}
+
+    try:
+        sheet_names = wb.sheetnames
+        defined_names = wb.defined_names
+        if isinstance(defined_names, dict):
+            name_items = defined_names.items()
+        else:
+            name_items = ((d.name, d) for d in defined_names.definedName)
+
+        layout = {}
+        for name, defined_name in name_items:
+            if not name.startswith(LAYOUT_NAME_PREFIX):
+                continue
+            part = name.rsplit('_', 1)[-1].lower()
+            for sheet_title, ref in defined_name.destinations:
+                if sheet_title not in sheet_names:
+                    continue
+                min_col, min_row, max_col, max_row = range_boundaries(ref.replace('$', ''))
+                sheet_layout = layout.setdefault(sheet_title, {'index': sheet_names.index(sheet_title)})
+                sheet_layout[part] = (min_row, max_row, min_col, max_col)
+        return layout
+    finally:
+        if wb is not file_path:
+            wb.close()
+
+def read_layout_table(file_path, sheet_name=0, layout=None, include_total=False):
+    """按区域定义精确读取表头和数据行(不含页脚)
+
+    Args:
+        file_path: Excel文件路径或已加载的openpyxl工作簿
+        sheet_name: 工作表名称或索引，默认为0
+        layout: read_sheet_layout的结果，为None时自动读取
+        include_total: 是否同时读取合计行，默认为False
+
+    Returns:
+        pandas.DataFrame: 数据表；文件或工作表没有区域定义时返回None
+    """
+    if layout is None:
+        layout = read_sheet_layout(file_path)
+    if isinstance(sheet_name, int):
+        sheet_name = next((title for title, info in layout.items() if info['index'] == sheet_name), None)
+    sheet_layout = layout.get(sheet_name)
+    if not sheet_layout or 'header' not in sheet_layout:
+        return None
+
+    header_row, _, _, max_col = sheet_layout['header']
+    data_last_row = sheet_layout['data'][1] if 'data' in sheet_layout else header_row
+    if include_total and 'total' in sheet_layout:
+        data_last_row = sheet_layout['total'][1]
+    return pd.read_excel(file_path, engine='openpyxl', sheet_name=sheet_name, skiprows=header_row - 1,
+                         nrows=data_last_row - header_row, usecols=list(range(max_col)))
+
 def compare_numeric_values(value1, value2, precision=0.0001):
     """比较两个数值是否相等(考虑精度)"""
     return abs(value1 - value2) < precision